@@ -1,16 +1,30 @@
 # Juris360 — Auth (login/logout), Payments & Print/PDF, env-compatible
-import os, io
-from datetime import datetime, date
+import os, io, re, sys, csv, gzip, json, base64, bisect, hashlib, time, pickle, random, sqlite3, threading, contextlib, contextvars, itertools
+from collections import namedtuple, OrderedDict
+from datetime import datetime, date, timedelta, timezone
 from decimal import Decimal
 from functools import wraps
 
+import click
 from dotenv import load_dotenv
 from flask import (
     Flask, render_template, request, redirect, url_for,
-    flash, send_file, session
+    flash, send_file, session, g, has_request_context, jsonify,
+    Response, stream_with_context, make_response, abort,
+    template_rendered, before_render_template
 )
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from itsdangerous import URLSafeSerializer, BadSignature
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text, create_engine, func
+from sqlalchemy import text, func, event, or_, and_, case, select, insert, update, delete, inspect, literal, table, column
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, IntegrityError
+from sqlalchemy.schema import CreateIndex, CreateColumn
+from sqlalchemy.orm import joinedload, Session
 
 load_dotenv()
 
@@ -24,7 +38,7 @@ app.config['APP_PASSWORD'] = os.getenv('APP_PASSWORD') or os.getenv('ADMIN_PASS'
 def _truthy(v): return str(v).lower() in {'1', 'true', 'yes', 'on'}
 app.config['REQUIRE_LOGIN'] = _truthy(os.getenv('REQUIRE_LOGIN', os.getenv('ENABLE_AUTH', '1')))
 
-# ---- DB setup (Postgres or SQLite fallback) ----
+# ---- DB setup (Postgres, or SQLite when DATABASE_URL is blank) ----
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 os.makedirs(DATA_DIR, exist_ok=True)
 
@@ -40,18 +54,287 @@ def _resolve_db_uri():
         url = url.replace('postgresql://', 'postgresql+psycopg://', 1)
     return url
 
-candidate_uri = _resolve_db_uri()
-try:
-    eng = create_engine(candidate_uri, pool_pre_ping=True, future=True)
-    with eng.connect() as c: c.execute(text('SELECT 1'))
-    db_uri = candidate_uri
-except Exception:
-    db_uri = _sqlite_uri()
-
-app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
+def _engine_options(uri):
+    opts = {'pool_pre_ping': _truthy(os.getenv('DB_POOL_PRE_PING', '1'))}
+    if not uri.startswith('sqlite'):
+        opts.update(pool_size=int(os.getenv('DB_POOL_SIZE') or 5),
+                    max_overflow=int(os.getenv('DB_MAX_OVERFLOW') or 10),
+                    pool_recycle=int(os.getenv('DB_POOL_RECYCLE') or 1800),
+                    pool_timeout=int(os.getenv('DB_POOL_TIMEOUT') or 30))
+    return opts
+
+# No connection is opened here: engines connect on first use, and schema/seed work
+# happens in `flask init-db` (or lazily on the first request when AUTO_INIT_DB=1).
+# Run init-db on every deploy/upgrade: requests fail with 503 while migrations are pending.
+app.config['SQLALCHEMY_DATABASE_URI'] = _resolve_db_uri()
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['AUTO_INIT_DB'] = _truthy(os.getenv('AUTO_INIT_DB', '0'))
 db = SQLAlchemy()
-db.init_app(app)
+
+# ---- SQLite production mode ----
+# WAL + pragmas on every connection; POST requests (and explicit write blocks) open
+# their transaction with BEGIN IMMEDIATE so writers queue on busy_timeout instead of
+# failing on lock upgrade, and are retried with backoff if the lock still can't be had.
+app.config['SQLITE_TUNED'] = _truthy(os.getenv('SQLITE_TUNED', '1'))
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+app.config['SQLITE_CACHE_KB'] = int(os.getenv('SQLITE_CACHE_KB') or 20000)
+app.config['SQLITE_MMAP_MB'] = int(os.getenv('SQLITE_MMAP_MB') or 256)
+app.config['SQLITE_WRITE_RETRIES'] = int(os.getenv('SQLITE_WRITE_RETRIES') or 5)
+
+_sqlite_write_tx = contextvars.ContextVar('sqlite_write_tx', default=False)
+
+@contextlib.contextmanager
+def write_intent():
+    token = _sqlite_write_tx.set(True)
+    try: yield
+    finally: _sqlite_write_tx.reset(token)
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_on_connect(dbapi_conn, record):
+    if not isinstance(dbapi_conn, sqlite3.Connection) or not app.config['SQLITE_TUNED']: return
+    dbapi_conn.isolation_level = None   # we emit BEGIN ourselves (see _sqlite_begin)
+    cur = dbapi_conn.cursor()
+    cur.execute('PRAGMA journal_mode=WAL')
+    cur.execute('PRAGMA synchronous=NORMAL')
+    cur.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT_MS']}")
+    cur.execute(f"PRAGMA cache_size=-{app.config['SQLITE_CACHE_KB']}")
+    cur.execute(f"PRAGMA mmap_size={app.config['SQLITE_MMAP_MB'] * 1024 * 1024}")
+    cur.execute('PRAGMA temp_store=MEMORY')
+    cur.close()
+
+@event.listens_for(Engine, 'begin')
+def _sqlite_begin(conn):
+    if conn.dialect.name != 'sqlite' or not app.config['SQLITE_TUNED']: return
+    write = _sqlite_write_tx.get() or (has_request_context() and request.method not in ('GET', 'HEAD', 'OPTIONS'))
+    conn.exec_driver_sql('BEGIN IMMEDIATE' if write else 'BEGIN')
+
+def _is_locked(exc):
+    msg = str(getattr(exc, 'orig', exc)).lower()
+    return 'database is locked' in msg or 'database is busy' in msg
+
+def _with_lock_retry(fn, *args, **kw):
+    # Re-runs fn after a lock error; fn must be one transaction that can safely run again
+    retries = app.config['SQLITE_WRITE_RETRIES']
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kw)
+        except OperationalError as e:
+            if attempt == retries or not _is_locked(e): raise
+            db.session.rollback()
+            time.sleep(0.05 * 2 ** attempt * (1 + random.random()))
+
+# POST views that read request.stream or commit in batches can't simply run twice;
+# they retry their own transactions instead (see _insert_batch, reconcile_payments).
+_NO_VIEW_RETRY = ('import_data', 'payments_batch')
+
+def _with_write_retry(view):
+    @wraps(view)
+    def _wrap(*a, **kw):
+        return _with_lock_retry(view, *a, **kw)
+    return _wrap
+
+# ---- SQL statement budget (per request; 0 disables) ----
+app.config['SQL_QUERY_BUDGET'] = int(os.getenv('SQL_QUERY_BUDGET') or 0)
+app.config['SQL_QUERY_BUDGET_STRICT'] = _truthy(os.getenv('SQL_QUERY_BUDGET_STRICT', '0'))
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and statement != 'BEGIN' and statement != 'BEGIN IMMEDIATE':
+        g.sql_count = g.get('sql_count', 0) + 1
+
+@app.after_request
+def _check_query_budget(resp):
+    budget = app.config['SQL_QUERY_BUDGET']
+    if not budget: return resp
+    used = g.get('sql_count', 0)
+    resp.headers['X-SQL-Count'] = str(used)
+    if used > budget:
+        msg = f'{request.method} {request.path} issued {used} SQL statements (budget {budget})'
+        if app.config['SQL_QUERY_BUDGET_STRICT']: raise QueryBudgetExceeded(msg)
+        app.logger.warning(msg)
+    return resp
+
+# ---- Request / SQL / render instrumentation, exposed on /metrics ----
+# Per-process counters and histograms in Prometheus text format; scrape every worker.
+app.config['METRICS_ENABLED'] = _truthy(os.getenv('METRICS_ENABLED', '1'))
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '').strip()
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS') or 0)
+
+_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_STATEMENTS = (1, 2, 3, 5, 8, 12, 20, 50, 100)
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}   # (name, labels) -> value
+        self._hists = {}      # (name, labels) -> [bucket counts..., +Inf], sum
+
+    def describe(self, name, kind, help, buckets=None):
+        self._help[name] = (kind, help, buckets)
+
+    def inc(self, name, labels, by=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock: self._counters[key] = self._counters.get(key, 0) + by
+
+    def observe(self, name, labels, value):
+        buckets = self._help[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None: h = self._hists[key] = [[0] * (len(buckets) + 1), 0.0]
+            h[0][bisect.bisect_left(buckets, value)] += 1
+            h[1] += value
+
+    @staticmethod
+    def _labels(pairs, extra=()):
+        esc = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        items = list(pairs) + list(extra)
+        return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in items) + '}' if items else ''
+
+    def render(self):
+        with self._lock:
+            counters, hists = dict(self._counters), {k: (list(v[0]), v[1]) for k, v in self._hists.items()}
+        out = []
+        for name, (kind, help, buckets) in self._help.items():
+            out += [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+            if kind == 'counter':
+                out += [f'{name}{self._labels(l)} {v:g}' for (n, l), v in sorted(counters.items()) if n == name]
+                continue
+            for (n, l), (counts, total) in sorted(hists.items()):
+                if n != name: continue
+                running = 0
+                for le, c in zip([*map(str, buckets), '+Inf'], counts):
+                    running += c
+                    out.append(f'{name}_bucket{self._labels(l, [("le", le)])} {running}')
+                out += [f'{name}_sum{self._labels(l)} {total:.6f}', f'{name}_count{self._labels(l)} {running}']
+        return '\n'.join(out) + '\n'
+
+metrics = _Metrics()
+metrics.describe('juris360_requests_total', 'counter', 'Requests by endpoint, method and status.')
+metrics.describe('juris360_request_duration_seconds', 'histogram', 'Time to build the response, by endpoint.', _SECONDS)
+metrics.describe('juris360_request_sql_statements', 'histogram', 'SQL statements issued per request, by endpoint.', _STATEMENTS)
+metrics.describe('juris360_sql_seconds_total', 'counter', 'Time spent executing SQL, by endpoint.')
+metrics.describe('juris360_template_render_seconds', 'histogram', 'Jinja render time, by template.', _SECONDS)
+metrics.describe('juris360_pdf_render_seconds', 'histogram', 'ReportLab time per invoice PDF.', _SECONDS)
+
+def _endpoint():
+    return (request.endpoint or 'unmatched') if has_request_context() else 'cli'
+
+# The start time lives on the statement's execution context, so a statement that raises
+# (and never reaches after_cursor_execute) leaves nothing behind to pair with the next one.
+@event.listens_for(Engine, 'before_cursor_execute')
+def _time_statement_start(conn, cursor, statement, parameters, context, executemany):
+    if context is not None: context._juris360_t0 = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _time_statement_end(conn, cursor, statement, parameters, context, executemany):
+    t0 = getattr(context, '_juris360_t0', None)
+    if t0 is None: return
+    elapsed = time.perf_counter() - t0
+    if has_request_context(): g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+    slow = app.config['SLOW_QUERY_MS']
+    if slow and elapsed * 1000 >= slow:
+        route = f'{request.method} {request.path} ({_endpoint()})' if has_request_context() else 'cli'
+        app.logger.warning('Slow query %.1f ms in %s: %s', elapsed * 1000, route, ' '.join(statement.split())[:500])
+
+@app.before_request
+def _start_timer():
+    g.t0 = time.perf_counter()
+
+@app.after_request
+def _record_request(resp):
+    if not app.config['METRICS_ENABLED'] or 't0' not in g: return resp
+    ep = _endpoint()
+    metrics.inc('juris360_requests_total', {'endpoint': ep, 'method': request.method, 'status': resp.status_code})
+    metrics.observe('juris360_request_duration_seconds', {'endpoint': ep}, time.perf_counter() - g.t0)
+    metrics.observe('juris360_request_sql_statements', {'endpoint': ep}, g.get('sql_count', 0))
+    metrics.inc('juris360_sql_seconds_total', {'endpoint': ep}, g.get('sql_seconds', 0.0))
+    return resp
+
+@before_render_template.connect_via(app)
+def _template_start(sender, template, context, **extra):
+    g.setdefault('_render_t0', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def _template_done(sender, template, context, **extra):
+    stack = g.get('_render_t0')
+    if stack and app.config['METRICS_ENABLED']:
+        metrics.observe('juris360_template_render_seconds', {'template': template.name}, time.perf_counter() - stack.pop())
+
+# ------------- Compression and static assets -------------
+# Text responses above COMPRESS_MIN_SIZE bytes go out as brotli (when the optional `brotli`
+# package is installed) or gzip. Static URLs carry a content hash (?v=...) so they can be
+# cached for a year and change whenever the file does.
+app.config['COMPRESS_ENABLED'] = _truthy(os.getenv('COMPRESS_ENABLED', '1'))
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE') or 1024)
+app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL') or 6)
+app.config['STATIC_MAX_AGE'] = int(os.getenv('STATIC_MAX_AGE') or 31536000)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_COMPRESSIBLE = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+_static_hashes = {}       # filename -> (mtime_ns, hash)
+_static_compressed = {}   # (filename, hash, encoding) -> bytes
+
+def _static_hash(filename):
+    path = safe_join(app.static_folder, filename or '')
+    try: mtime = os.stat(path).st_mtime_ns
+    except (OSError, TypeError): return None
+    hit = _static_hashes.get(filename)
+    if hit and hit[0] == mtime: return hit[1]
+    with open(path, 'rb') as fh: digest = hashlib.sha256(fh.read()).hexdigest()[:12]
+    _static_hashes[filename] = (mtime, digest)
+    return digest
+
+@app.url_defaults
+def _static_version(endpoint, values):
+    if endpoint == 'static' and 'v' not in values:
+        v = _static_hash(values.get('filename'))
+        if v: values['v'] = v
+
+def _compress(data, encoding):
+    if encoding == 'br': return brotli.compress(data, quality=app.config['COMPRESS_LEVEL'])
+    return gzip.compress(data, compresslevel=app.config['COMPRESS_LEVEL'], mtime=0)
+
+@app.after_request
+def _compress_response(resp):
+    static = request.endpoint == 'static'
+    if static and resp.status_code in (200, 304):
+        v = request.args.get('v')
+        if v and v == _static_hash(request.view_args.get('filename')):
+            resp.cache_control.no_cache = None
+            resp.cache_control.public = True
+            resp.cache_control.max_age = app.config['STATIC_MAX_AGE']
+            resp.cache_control.immutable = True
+    if not app.config['COMPRESS_ENABLED'] or resp.status_code != 200 or 'Content-Encoding' in resp.headers \
+            or not (resp.mimetype or '').startswith(_COMPRESSIBLE): return resp
+    if resp.direct_passthrough and not static: return resp   # send_file downloads stay as they are
+    if resp.is_streamed and not resp.direct_passthrough: return resp   # streamed exports
+    if (resp.content_length or 0) < app.config['COMPRESS_MIN_SIZE']: return resp
+    resp.vary.add('Accept-Encoding')
+    accept = request.accept_encodings
+    encoding = 'br' if brotli is not None and accept['br'] else 'gzip' if accept['gzip'] else None
+    if not encoding: return resp
+    resp.direct_passthrough = False
+    if static:
+        key = (request.view_args.get('filename'), resp.get_etag()[0], encoding)
+        body = _static_compressed.get(key)
+        if body is None: body = _static_compressed[key] = _compress(resp.get_data(), encoding)
+    else:
+        body = _compress(resp.get_data(), encoding)
+    resp.set_data(body)
+    resp.headers['Content-Encoding'] = encoding
+    tag, weak = resp.get_etag()
+    if tag and not weak: resp.set_etag(tag, weak=True)   # the bytes differ from the identity encoding
+    return resp
 
 # ------------- Auth helpers -------------
 def login_required(view):
@@ -86,15 +369,27 @@ def inject_globals():
     return dict(config=app.config, session=session)
 
 # ------------- Models -------------
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 class Client(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(50))
     email = db.Column(db.String(120))
     address = db.Column(db.String(200))
+    updated_at = db.Column(db.DateTime, default=lambda: _utcnow())
+    row_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')   # see "Sync feed"
     cases = db.relationship('Case', back_populates='client', cascade='all, delete-orphan')
     invoices = db.relationship('Invoice', back_populates='client', cascade='all, delete-orphan')
 
+    # ix_*_lower serve sorting and the SQLite prefix range; Postgres also gets a pattern-ops
+    # index for the LIKE prefix match, which a collation-ordered index can't answer (see _prefix_match)
+    __table_args__ = (db.Index('ix_client_name_lower', func.lower(name)),
+                      db.Index('ix_client_name_prefix', func.lower(name).label('name_lower'),
+                               postgresql_ops={'name_lower': 'text_pattern_ops'}).ddl_if(dialect='postgresql'),
+                      db.Index('ix_client_row_version', 'row_version', 'id'))
+
 class CaseType(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
@@ -116,6 +411,9 @@ class Case(db.Model):
     status_id = db.Column(db.Integer, db.ForeignKey('case_status.id'), nullable=False)
     opened_on = db.Column(db.Date, default=date.today)
     next_hearing_date = db.Column(db.Date, nullable=True)
+    advocate = db.Column(db.String(120))
+    updated_at = db.Column(db.DateTime, default=lambda: _utcnow())
+    row_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')   # see "Sync feed"
 
     client = db.relationship('Client', back_populates='cases')
     case_type = db.relationship('CaseType', back_populates='cases')
@@ -123,16 +421,36 @@ class Case(db.Model):
     hearings = db.relationship('Hearing', back_populates='case', cascade='all, delete-orphan')
     invoices = db.relationship('Invoice', back_populates='case', cascade='all, delete-orphan')
 
+    __table_args__ = (db.Index('ix_case_ref_lower', func.lower(ref)),
+                      db.Index('ix_case_title_lower', func.lower(title)),
+                      db.Index('ix_case_ref_prefix', func.lower(ref).label('ref_lower'),   # see Client
+                               postgresql_ops={'ref_lower': 'text_pattern_ops'}).ddl_if(dialect='postgresql'),
+                      db.Index('ix_case_title_prefix', func.lower(title).label('title_lower'),
+                               postgresql_ops={'title_lower': 'text_pattern_ops'}).ddl_if(dialect='postgresql'),
+                      db.Index('ix_case_ref', 'ref'),
+                      db.Index('ix_case_client', 'client_id', 'id'),
+                      db.Index('ix_case_status', 'status_id', 'id'),
+                      db.Index('ix_case_next_hearing', 'next_hearing_date'),
+                      db.Index('ix_case_opened', 'opened_on', 'id'),
+                      db.Index('ix_case_row_version', 'row_version', 'id'))
+
 class Hearing(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    case_id = db.Column(db.Integer, db.ForeignKey('case.id'), nullable=False)
+    # active_history: a hearing moved to another case refreshes the old case's next hearing
+    case_id = db.column_property(db.Column(db.Integer, db.ForeignKey('case.id'), nullable=False), active_history=True)
     date = db.Column(db.Date, nullable=False)
     status_id = db.Column(db.Integer, db.ForeignKey('case_status.id'), nullable=False)
     notes = db.Column(db.String(400))
+    updated_at = db.Column(db.DateTime, default=lambda: _utcnow())
+    row_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')   # see "Sync feed"
 
     case = db.relationship('Case', back_populates='hearings')
     status = db.relationship('CaseStatus', back_populates='hearings')
 
+    __table_args__ = (db.Index('ix_hearing_date', 'date', 'id'),
+                      db.Index('ix_hearing_case_date', 'case_id', 'date'),
+                      db.Index('ix_hearing_row_version', 'row_version', 'id'))
+
 class Invoice(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.String(40), nullable=False)
@@ -141,6 +459,14 @@ class Invoice(db.Model):
     status_id = db.Column(db.Integer, db.ForeignKey('case_status.id'), nullable=False)
     amount = db.Column(db.Numeric(12,2), nullable=False)
     due_date = db.Column(db.Date, nullable=True)
+    # Ledger totals, maintained from Payment writes (see _ledger_refresh)
+    paid_total = db.Column(db.Numeric(12,2), nullable=False, default=0, server_default='0')
+    balance = db.Column(db.Numeric(12,2), nullable=False, server_default='0',
+                        default=lambda ctx: ctx.get_current_parameters().get('amount') or 0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    payments_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=lambda: _utcnow(), onupdate=lambda: _utcnow())
+    row_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')   # see "Sync feed"
 
     client = db.relationship('Client', back_populates='invoices')
     case = db.relationship('Case', back_populates='invoices')
@@ -148,16 +474,418 @@ class Invoice(db.Model):
     payments = db.relationship('Payment', back_populates='invoice',
                                cascade='all, delete-orphan', lazy='dynamic')
 
+    __table_args__ = (db.Index('ix_invoice_balance', 'balance'),
+                      db.Index('ix_invoice_number', 'number'),
+                      db.Index('ix_invoice_case', 'case_id'),
+                      db.Index('ix_invoice_client', 'client_id', 'id'),
+                      db.Index('ix_invoice_status', 'status_id', 'id'),
+                      db.Index('ix_invoice_due', 'due_date', 'id'),
+                      db.Index('ix_invoice_row_version', 'row_version', 'id'))
+
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id', ondelete='CASCADE'), nullable=False)
+    # active_history: the ledger needs the old invoice_id even when it was expired by a commit
+    invoice_id = db.column_property(db.Column(db.Integer, db.ForeignKey('invoice.id', ondelete='CASCADE'), nullable=False),
+                                    active_history=True)
     amount = db.Column(db.Numeric(12,2), nullable=False)
-    date = db.Column(db.Date, nullable=False, default=date.today)
+    # active_history: moving a payment to another month refreshes the month it left
+    date = db.column_property(db.Column(db.Date, nullable=False, default=date.today), active_history=True)
     method = db.Column(db.String(30))
     reference = db.Column(db.String(80))
     note = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=lambda: _utcnow())
+    row_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')   # see "Sync feed"
     invoice = db.relationship('Invoice', back_populates='payments')
 
+    __table_args__ = (db.Index('ix_payment_invoice_date', 'invoice_id', 'date', 'id'),
+                      db.Index('ix_payment_date', 'date'),
+                      db.Index('ix_payment_reference', 'reference'),
+                      db.Index('ix_payment_row_version', 'row_version', 'id'))
+
+class AppMeta(db.Model):
+    # Small key/value counters shared by all workers (e.g. the lookups version)
+    __tablename__ = 'app_meta'
+    key = db.Column(db.String(60), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class CollectionSummary(db.Model):
+    # Payments per calendar month and method; refreshed for the months a payment write touches
+    __tablename__ = 'collection_summary'
+    period = db.Column(db.String(7), primary_key=True)   # YYYY-MM
+    method = db.Column(db.String(30), primary_key=True)  # '' when no method was recorded
+    total = db.Column(db.Numeric(14,2), nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class Job(db.Model):
+    # Background work queued in the database; see "Background jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(12), nullable=False, default='queued')   # queued/running/done/failed
+    priority = db.Column(db.Integer, nullable=False, default=0)           # higher runs first
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime, nullable=False, default=lambda: _utcnow())
+    locked_by = db.Column(db.String(80))
+    locked_at = db.Column(db.DateTime)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: _utcnow())
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_job_ready', 'status', 'priority', 'run_at'),)
+
+class SyncTombstone(db.Model):
+    # One row per deleted Client/Case/Hearing/Invoice/Payment, so sync clients can drop it
+    __tablename__ = 'sync_tombstone'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    row_version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=lambda: _utcnow())
+
+    __table_args__ = (db.Index('ix_sync_tombstone_version', 'row_version', 'id'),
+                      db.Index('ix_sync_tombstone_deleted', 'deleted_at'))
+
+def _bump_version(conn, key):
+    meta = AppMeta.__table__
+    if not conn.execute(update(meta).where(meta.c.key == key).values(value=meta.c.value + 1)).rowcount:
+        conn.execute(meta.insert().values(key=key, value=1))
+
+# ------------- Invoice ledger -------------
+_LEDGER_COLUMNS = ('id', 'amount', 'paid_total', 'balance', 'payment_count')
+
+def _ledger_refresh(conn, ids=None, touch=True):
+    # One set-based UPDATE; ids=None rebuilds every invoice. touch=False leaves
+    # payments_version/updated_at alone (migration 1 runs before step 3 adds them), which
+    # needs a bare table() so updated_at's onupdate default isn't applied either.
+    pay = Payment.__table__
+    inv = Invoice.__table__ if touch else table('invoice', *map(column, _LEDGER_COLUMNS))
+    paid = select(func.coalesce(func.sum(pay.c.amount), 0)).where(pay.c.invoice_id == inv.c.id).scalar_subquery()
+    count = select(func.count(pay.c.id)).where(pay.c.invoice_id == inv.c.id).scalar_subquery()
+    stmt = update(inv).values(paid_total=func.round(paid, 2), payment_count=count,
+                              balance=func.round(inv.c.amount - paid, 2))
+    if touch: stmt = stmt.values(payments_version=inv.c.payments_version + 1, updated_at=_utcnow())
+    if ids is not None: stmt = stmt.where(inv.c.id.in_(ids))
+    return conn.execute(stmt)
+
+@event.listens_for(Session, 'after_flush')
+def _ledger_after_flush(session, ctx):
+    ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Payment):
+            ids.add(obj.invoice_id)
+            ids.update(inspect(obj).attrs.invoice_id.history.deleted or ())
+        elif isinstance(obj, Invoice) and obj not in session.new \
+                and inspect(obj).attrs.amount.history.has_changes():
+            ids.add(obj.id)
+    ids.discard(None)
+    if ids:
+        _ledger_refresh(session.connection(), ids)
+        session.info.setdefault('ledger_ids', set()).update(ids)
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _ledger_expire(session, ctx):
+    ids = session.info.pop('ledger_ids', None)
+    if not ids: return
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Invoice) and obj.id in ids:
+            session.expire(obj, ['paid_total', 'balance', 'payment_count'])
+
+# ------------- Cache -------------
+# In-process LRU by default; set CACHE_REDIS_URL to share entries (and invalidations) across workers.
+app.config['CACHE_REDIS_URL'] = os.getenv('CACHE_REDIS_URL', '').strip()
+app.config['CACHE_MAX_ITEMS'] = int(os.getenv('CACHE_MAX_ITEMS') or 2048)
+
+class _LocalCache:
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None: return None
+            value, expires = item
+            if expires and expires < time.monotonic():
+                del self._data[key]; return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items: self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for k in keys: self._data.pop(k, None)
+
+    def clear(self):
+        with self._lock: self._data.clear()
+
+class _RedisCache:
+    def __init__(self, url, prefix='juris360:'):
+        import redis
+        self._r = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key):
+        raw = self._r.get(self._prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._r.set(self._prefix + key, pickle.dumps(value), ex=ttl)
+
+    def delete(self, *keys):
+        if keys: self._r.delete(*[self._prefix + k for k in keys])
+
+    def clear(self):
+        for k in self._r.scan_iter(self._prefix + '*'): self._r.delete(k)
+
+def _make_cache():
+    if app.config['CACHE_REDIS_URL']:
+        try:
+            return _RedisCache(app.config['CACHE_REDIS_URL'])
+        except Exception as e:
+            app.logger.warning('Shared cache unavailable (%s); using in-process cache', e)
+    return _LocalCache(app.config['CACHE_MAX_ITEMS'])
+
+cache = _make_cache()
+
+# Cache keys to drop when a commit touches any of the listed models.
+_CACHE_DEPS = []
+
+def cache_depends(key, *models):
+    _CACHE_DEPS.append((frozenset(models), key))
+
+def _invalidate(models):
+    keys = [key for deps, key in _CACHE_DEPS if deps & set(models)]
+    if keys: cache.delete(*keys)
+
+@event.listens_for(Session, 'after_flush')
+def _track_touched(session, ctx):
+    touched = session.info.setdefault('touched', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        touched.add(type(obj).__name__)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    touched = session.info.pop('touched', None)
+    if touched: _invalidate(touched)
+
+# {% fragment 'name', part, ... %}...{% endfragment %} caches the rendered block under its
+# name and key parts (usually data versions, so a write moves the key instead of deleting it).
+app.config['FRAGMENT_TTL'] = int(os.getenv('FRAGMENT_TTL') or 3600)
+
+class _FragmentCache(Extension):
+    tags = {'fragment'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'): parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endfragment'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        key = 'fragment:' + ':'.join(map(str, parts))
+        html = cache.get(key)
+        if html is None:
+            html = str(caller())
+            cache.set(key, html, ttl=app.config['FRAGMENT_TTL'])
+        return Markup(html)
+
+app.jinja_env.add_extension(_FragmentCache)
+
+def data_version(*keys):
+    # app_meta counters as one key part, e.g. data_version('sync') moves on every synced write
+    known = g.setdefault('data_versions', {})
+    missing = [k for k in keys if k not in known]
+    if missing:
+        known.update({k: 0 for k in missing})
+        known.update(db.session.execute(select(AppMeta.key, AppMeta.value).where(AppMeta.key.in_(missing))).all())
+    return '.'.join(str(known[k]) for k in keys)
+
+app.jinja_env.globals.update(data_version=data_version)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_touched(session):
+    session.info.pop('touched', None)
+    session.info.pop('lookups_changed', None)
+
+# ------------- Lookup registry -------------
+# CaseType/CaseStatus held in memory; reloaded when the shared 'lookups' version moves.
+Lookup = namedtuple('Lookup', 'id name')
+
+class _LookupRegistry:
+    def __init__(self):
+        self.version = None
+        self._data = None
+
+    def _load(self):
+        if has_request_context() and g.get('lookups_checked'): return self._data
+        v = db.session.execute(select(AppMeta.value).where(AppMeta.key == 'lookups')).scalar() or 0
+        if v != self.version or self._data is None:
+            types = [Lookup(*r) for r in db.session.execute(select(CaseType.id, CaseType.name).order_by(CaseType.name))]
+            status = [Lookup(*r) for r in db.session.execute(select(CaseStatus.id, CaseStatus.name).order_by(CaseStatus.name))]
+            self._data = (types, status, {t.id: t.name for t in types}, {s.id: s.name for s in status},
+                          {s.name.lower(): s.id for s in status})
+            self.version = v
+        if has_request_context(): g.lookups_checked = True
+        return self._data
+
+    def case_types(self): return self._load()[0]
+    def statuses(self): return self._load()[1]
+    def type_name(self, id): return self._load()[2].get(id, '')
+    def status_name(self, id): return self._load()[3].get(id, '')
+    def status_id(self, name): return self._load()[4].get(name.lower())
+
+    def status_ids(self, *names):
+        ids = self._load()[4]
+        return [ids[n.lower()] for n in names if n.lower() in ids]
+
+    def current_version(self):
+        self._load()
+        return self.version
+
+    def reset(self):
+        self.version = None
+
+lookup_cache = _LookupRegistry()
+app.jinja_env.globals.update(type_name=lookup_cache.type_name, status_name=lookup_cache.status_name,
+                             lookups_version=lookup_cache.current_version)
+
+@event.listens_for(Session, 'after_flush')
+def _lookups_after_flush(session, ctx):
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    if any(isinstance(o, (CaseType, CaseStatus)) for o in changed):
+        _bump_version(session.connection(), 'lookups')
+        session.info['lookups_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _lookups_after_commit(session):
+    if session.info.pop('lookups_changed', False): lookup_cache.reset()
+
+# ------------- Sync feed -------------
+# Every write to a synced model stamps the row with a version from the 'sync' counter in
+# app_meta, allocated once per transaction; deletes leave a SyncTombstone with the same
+# version. The counter row stays locked until commit, so versions become visible in order
+# and a client holding cursor V has seen everything at or below it. That lock serialises
+# writers of synced rows (on Postgres; SQLite writers are serial anyway), so the version is
+# taken only in before_commit, after the last flush: writes record the rows they touch and
+# are stamped in one UPDATE per table just before COMMIT, keeping the locked section to
+# that tail rather than the whole transaction (an import batch, a payment run). A sequence
+# would avoid the lock but lets versions commit out of order, which cursors can't tolerate.
+# Case.next_hearing_date and the invoice ledger totals are derived: the ledger bumps its
+# invoices, the daily next-hearing roll does not (clients get the hearings themselves).
+app.config['SYNC_BATCH'] = int(os.getenv('SYNC_BATCH') or 500)
+app.config['SYNC_TOMBSTONE_DAYS'] = int(os.getenv('SYNC_TOMBSTONE_DAYS') or 90)
+SYNC_MODELS = {'client': Client, 'case': Case, 'hearing': Hearing, 'invoice': Invoice, 'payment': Payment}
+_SYNC_KINDS = {model: kind for kind, model in SYNC_MODELS.items()}
+
+def _sync_allocate(conn):
+    meta = AppMeta.__table__
+    v = conn.execute(update(meta).where(meta.c.key == 'sync').values(value=meta.c.value + 1)
+                     .returning(meta.c.value)).scalar()
+    if v is None:
+        conn.execute(meta.insert().values(key='sync', value=1)); v = 1
+    return v
+
+def _sync_mark(session, model, ids):
+    # Rows written in this transaction; _sync_stamp versions them at commit
+    session.info.setdefault('sync_rows', {}).setdefault(model, set()).update(i for i in ids if i is not None)
+
+def _sync_touch(conn, model, ids, version):
+    t = model.__table__
+    ids = sorted(ids)
+    for i in range(0, len(ids), 500):
+        conn.execute(update(t).where(t.c.id.in_(ids[i:i + 500])).values(row_version=version, updated_at=_utcnow()))
+
+@event.listens_for(Session, 'before_flush')
+def _sync_before_flush(session, ctx, instances):
+    changed = [o for o in session.new if type(o) in _SYNC_KINDS]
+    changed += [o for o in session.dirty if type(o) in _SYNC_KINDS and session.is_modified(o, include_collections=False)]
+    if not changed: return
+    now = _utcnow()
+    for o in changed: o.updated_at = now
+    session.info.setdefault('sync_pending', []).extend(changed)
+
+@event.listens_for(Session, 'after_flush')
+def _sync_after_flush(session, ctx):
+    for o in session.info.pop('sync_pending', ()): _sync_mark(session, type(o), [o.id])
+    ledger = session.info.get('ledger_ids')   # invoices whose totals _ledger_after_flush just rewrote
+    if ledger: _sync_mark(session, Invoice, ledger)
+    gone = [(_SYNC_KINDS[type(o)], o.id) for o in session.deleted if type(o) in _SYNC_KINDS]
+    if gone: session.info.setdefault('sync_gone', []).extend(gone)
+
+@event.listens_for(Session, 'before_commit')
+def _sync_stamp(session):
+    session.flush()   # commit would flush after this hook; anything pending must be marked first
+    rows, gone = session.info.pop('sync_rows', None), session.info.pop('sync_gone', None)
+    if not rows and not gone: return
+    conn = session.connection()
+    v = _sync_allocate(conn)
+    for model, ids in (rows or {}).items(): _sync_touch(conn, model, ids, v)
+    if gone: conn.execute(insert(SyncTombstone.__table__), [{'kind': k, 'row_id': i, 'row_version': v} for k, i in gone])
+
+@event.listens_for(Session, 'after_rollback')
+def _sync_forget(session):
+    for key in ('sync_pending', 'sync_rows', 'sync_gone'): session.info.pop(key, None)
+
+def _sync_cursor(raw, floor):
+    # "version.kind.id.floor": the last item a client received, plus the tombstone floor
+    # when its chain of cursors started; '' starts from the beginning
+    if not raw: return (-1, 0, 0), floor
+    try: v, k, i, f = (int(x) for x in raw.split('.'))
+    except ValueError: raise ValueError('since must be a cursor returned by /sync')
+    return (v, k, i), f
+
+def _sync_after(t, kind_no, cursor):
+    v, k, i = cursor
+    if kind_no < k: return t.c.row_version > v
+    if kind_no > k: return t.c.row_version >= v
+    return or_(t.c.row_version > v, and_(t.c.row_version == v, t.c.id > i))
+
+def _sync_value(v):
+    if isinstance(v, (date, datetime)): return v.isoformat()
+    if isinstance(v, Decimal): return str(v)
+    return v
+
+def sync_changes(since='', limit=None, kinds=None):
+    # Reads at most limit+1 rows per kind from the (row_version, id) indexes and merges them,
+    # so a page costs the same however large the tables are.
+    limit = max(1, min(limit or app.config['SYNC_BATCH'], 5000))
+    meta = AppMeta.__table__
+    floor = db.session.execute(select(meta.c.value).where(meta.c.key == 'sync_floor')).scalar() or 0
+    cursor, seen_floor = _sync_cursor(since, floor)
+    if seen_floor < floor and cursor[0] < floor:   # tombstones this client still needed were purged
+        return {'reset': True, 'cursor': '', 'more': True, 'changes': {}, 'deleted': {}}
+    kinds = [k for k in SYNC_MODELS if not kinds or k in kinds]
+    items = []
+    for kind_no, kind in enumerate(SYNC_MODELS, start=1):
+        if kind not in kinds: continue
+        t = SYNC_MODELS[kind].__table__
+        stmt = select(t).where(_sync_after(t, kind_no, cursor)).order_by(t.c.row_version, t.c.id).limit(limit + 1)
+        items += [((r.row_version, kind_no, r.id), kind, r) for r in db.session.execute(stmt)]
+    tomb = SyncTombstone.__table__
+    stmt = select(tomb).where(_sync_after(tomb, 0, cursor), tomb.c.kind.in_(kinds)) \
+        .order_by(tomb.c.row_version, tomb.c.id).limit(limit + 1)
+    items += [((r.row_version, 0, r.id), None, r) for r in db.session.execute(stmt)]
+    items.sort(key=lambda x: x[0])
+    page = items[:limit]
+    changes, deleted = {}, {}
+    for _, kind, r in page:
+        if kind is None:
+            deleted.setdefault(r.kind, []).append(r.row_id); continue
+        if kind not in changes: changes[kind] = {'columns': list(r._fields), 'rows': []}
+        changes[kind]['rows'].append([_sync_value(v) for v in r])
+    last = page[-1][0] if page else cursor
+    return {'reset': False, 'cursor': '' if last[0] < 0 else '.'.join(map(str, last + (floor,))),
+            'more': len(items) > limit, 'changes': changes, 'deleted': deleted}
+
 # ------------- Seed data -------------
 def seed_if_empty():
     if Client.query.first(): return
@@ -188,36 +916,1575 @@ def seed_if_empty():
     i2 = Invoice(number='INV-1002', client=bob, case=c2, status=open_s, amount=D('22000.00'), due_date=date.today())
     db.session.add_all([i1, i2]); db.session.commit()
 
-with app.app_context():
-    db.create_all()
-    seed_if_empty()
+# ------------- Schema migrations -------------
+# create_all() only creates missing tables. Anything that changes an existing table
+# is appended here as a numbered step; steps are idempotent and run in order.
+def _add_columns(conn, table, names):
+    have = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    quoted = conn.dialect.identifier_preparer.format_table(table)
+    for name in names:
+        if name in have: continue
+        ddl = CreateColumn(table.c[name]).compile(dialect=conn.dialect)
+        conn.execute(text(f'ALTER TABLE {quoted} ADD COLUMN {ddl}'))
+
+def _create_indexes(conn, names):
+    by_name = {i.name: i for t in db.metadata.sorted_tables for i in t.indexes}
+    for name in names: conn.execute(CreateIndex(by_name[name], if_not_exists=True))
+
+def _m1_invoice_ledger(conn):
+    _add_columns(conn, Invoice.__table__, ['paid_total', 'balance', 'payment_count'])
+    _ledger_refresh(conn, touch=False)
+
+def _m2_core_indexes(conn):
+    _create_indexes(conn, [
+        'ix_client_name_lower', 'ix_case_ref_lower', 'ix_case_title_lower', 'ix_invoice_balance',
+        'ix_case_ref', 'ix_case_client', 'ix_case_status', 'ix_hearing_date', 'ix_hearing_case_date',
+        'ix_invoice_number', 'ix_invoice_case', 'ix_invoice_client', 'ix_invoice_status', 'ix_invoice_due',
+        'ix_payment_invoice_date'])
+
+def _m3_invoice_versioning(conn):
+    _add_columns(conn, Invoice.__table__, ['payments_version', 'updated_at'])
+    inv = Invoice.__table__
+    conn.execute(update(inv).where(inv.c.updated_at.is_(None)).values(updated_at=_utcnow()))
+
+def _m4_search_index(conn):
+    _search_create(conn)
+    _search_rebuild(conn)
+
+def _m5_cause_list(conn):
+    _add_columns(conn, Case.__table__, ['advocate'])
+    _create_indexes(conn, ['ix_case_next_hearing'])
+    _next_hearing_refresh(conn)
+
+def _m6_collection_summary(conn):
+    _create_indexes(conn, ['ix_payment_date'])
+    _collections_refresh(conn)
+
+def _m7_jobs(conn):
+    _create_indexes(conn, ['ix_job_ready'])
+
+def _m8_payment_reference(conn):
+    _create_indexes(conn, ['ix_payment_reference'])
+
+def _m9_sync(conn):
+    # Existing rows start at version 0, so a first sync (no cursor) picks them all up
+    now = _utcnow()
+    for model in SYNC_MODELS.values():
+        t = model.__table__
+        _add_columns(conn, t, ['updated_at', 'row_version'])
+        conn.execute(update(t).where(t.c.updated_at.is_(None)).values(updated_at=now))
+    _create_indexes(conn, [f'ix_{k}_row_version' for k in SYNC_MODELS])
+
+def _m10_list_sort_indexes(conn):
+    _create_indexes(conn, ['ix_case_opened'])
+
+def _m11_prefix_indexes(conn):
+    if conn.dialect.name == 'postgresql':
+        _create_indexes(conn, ['ix_client_name_prefix', 'ix_case_ref_prefix', 'ix_case_title_prefix'])
+
+MIGRATIONS = [
+    (1, 'invoice ledger columns', _m1_invoice_ledger),
+    (2, 'indexes for list, filter and lookup queries', _m2_core_indexes),
+    (3, 'invoice payments_version / updated_at', _m3_invoice_versioning),
+    (4, 'full-text search index', _m4_search_index),
+    (5, 'case advocate and next hearing date', _m5_cause_list),
+    (6, 'monthly collection summary', _m6_collection_summary),
+    (7, 'background job queue', _m7_jobs),
+    (8, 'payment reference index', _m8_payment_reference),
+    (9, 'row versions and tombstones for sync', _m9_sync),
+    (10, 'index for the case date sort', _m10_list_sort_indexes),
+    (11, 'pattern-ops indexes for typeahead prefix search', _m11_prefix_indexes),
+]
+
+def _schema_version(conn):
+    return conn.execute(select(AppMeta.value).where(AppMeta.key == 'schema_version')).scalar() or 0
+
+def migrate():
+    applied = []
+    with write_intent(), db.engine.begin() as conn:
+        db.metadata.create_all(conn)
+        current = _schema_version(conn)
+        for version, label, step in MIGRATIONS:
+            if version <= current: continue
+            step(conn)
+            applied.append((version, label))
+        if applied:
+            meta = AppMeta.__table__
+            conn.execute(meta.delete().where(meta.c.key == 'schema_version'))
+            conn.execute(meta.insert().values(key='schema_version', value=applied[-1][0]))
+    return applied
+
+def init_db(seed=True):
+    applied = migrate()
+    if seed: seed_if_empty()
+    return applied
+
+def pending_migrations():
+    with db.engine.connect() as conn:
+        # no app_meta table: never initialised
+        current = _schema_version(conn) if inspect(conn).has_table(AppMeta.__tablename__) else 0
+    return [(v, label) for v, label, _ in MIGRATIONS if v > current]
+
+_init_lock = threading.Lock()
+_db_ready = False
+
+@app.before_request
+def _lazy_init_db():
+    # AUTO_INIT_DB=1 migrates and seeds here. Otherwise `flask init-db` is a required deploy
+    # step, and a database it hasn't upgraded fails every request with 503 (checked until it
+    # passes once per worker) rather than running against a schema this code doesn't match.
+    global _db_ready
+    if _db_ready or request.endpoint == 'static': return
+    with _init_lock:
+        if _db_ready: return
+        if app.config['AUTO_INIT_DB']:
+            init_db()
+        else:
+            pending = pending_migrations()
+            if pending:
+                msg = (f'Database schema is missing migrations {", ".join(str(v) for v, _ in pending)}; '
+                       f'run `flask --app app init-db` to upgrade it')
+                app.logger.error(msg)
+                return Response(msg + '\n', status=503, mimetype='text/plain')
+        _db_ready = True
 
 # ------------- Helpers -------------
+# Loader options for list views: the templates touch these relations on every row.
+# Status and type names come from the lookup registry, so only client/case are joined.
+def _case_opts():
+    return (joinedload(Case.client),)
+
+def _hearing_opts():
+    return (joinedload(Hearing.case),)
+
+def _invoice_opts():
+    return (joinedload(Invoice.client), joinedload(Invoice.case))
+
+# ------------- Paging & filters -------------
+app.config['PAGE_SIZE'] = int(os.getenv('PAGE_SIZE') or 50)
+app.config['MAX_PAGE_SIZE'] = int(os.getenv('MAX_PAGE_SIZE') or 500)
+
+Page = namedtuple('Page', 'rows next sort dir per')
+
+def _encode_cursor(key, pk):
+    raw = json.dumps([key.isoformat() if isinstance(key, date) else key, pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_cursor(tok, is_date):
+    try:
+        key, pk = json.loads(base64.urlsafe_b64decode(tok + '=' * (-len(tok) % 4)))
+        return (date.fromisoformat(key) if is_date and key is not None else key), int(pk)
+    except Exception:
+        return None
+
+def _arg_int(name, args=None):
+    v = str((request.args if args is None else args).get(name) or '').strip()
+    return int(v) if v.isdigit() else None
+
+def _arg_date(name, args=None):
+    try: return datetime.strptime((request.args if args is None else args).get(name) or '', '%Y-%m-%d').date()
+    except ValueError: return None
+
+def _keyset_past(desc):
+    return (lambda a, b: a < b) if desc else (lambda a, b: a > b)
+
+def _keyset_after(expr, pk, kv, kid, desc):
+    past = _keyset_past(desc)
+    return and_(expr <= kv if desc else expr >= kv, or_(past(expr, kv), past(pk, kid)))
+
+def _keyset_nullable(expr):
+    return getattr(getattr(expr, 'expression', None), 'nullable', False)
+
+def _keyset_page(query, sorts, default):
+    # sorts: name -> (sql expr, row getter, is_date, descending by default[, cursor value -> sql]);
+    # pk is always the tie-breaker. Every page is a range read of an (expr, id) index: the
+    # cursor bound is written as expr >= v AND (expr > v OR id > k), and rows with a NULL key
+    # come last in either direction, paged by id alone once the non-NULL rows run out.
+    sort = request.args.get('sort') if request.args.get('sort') in sorts else default
+    expr, getter, is_date, desc, *bind = sorts[sort]
+    bind = bind[0] if bind else (lambda v: v)
+    if request.args.get('dir') in ('asc', 'desc'): desc = request.args['dir'] == 'desc'
+    per = min(_arg_int('per') or app.config['PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+    pk = query.column_descriptions[0]['entity'].id
+    past = _keyset_past(desc)
+    by_pk = pk.desc() if desc else pk.asc()
+
+    cur = _decode_cursor(request.args.get('after', ''), is_date) if request.args.get('after') else None
+    if expr is pk:
+        rows = (query.filter(past(pk, cur[1])) if cur else query).order_by(by_pk).limit(per + 1).all()
+    else:
+        nullable = _keyset_nullable(expr)
+        rows = []
+        if not (cur and cur[0] is None):   # still in the non-NULL keys
+            q = query.filter(expr.isnot(None)) if nullable else query
+            if cur: q = q.filter(_keyset_after(expr, pk, bind(cur[0]), cur[1], desc))
+            rows = q.order_by(expr.desc() if desc else expr.asc(), by_pk).limit(per + 1).all()
+        if nullable and len(rows) <= per:
+            q = query.filter(expr.is_(None))
+            if cur and cur[0] is None: q = q.filter(past(pk, cur[1]))
+            rows += q.order_by(by_pk).limit(per + 1 - len(rows)).all()
+    nxt = None
+    if len(rows) > per:
+        rows = rows[:per]
+        nxt = _encode_cursor(getter(rows[-1]), rows[-1].id)
+    return Page(rows, nxt, sort, 'desc' if desc else 'asc', per)
+
+def _page_url(**overrides):
+    args = request.args.to_dict()
+    args.update(overrides)
+    args = {k: v for k, v in args.items() if v not in (None, '')}
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+app.jinja_env.globals['page_url'] = _page_url
+
+def _prefix_match(expr, q):
+    # lower(col) LIKE 'q%' with q escaped; on Postgres the text_pattern_ops *_prefix indexes
+    # serve it whatever the database collation. SQLite won't use an expression index for LIKE,
+    # so there it is the range [q, q with its last character bumped), which is exact under
+    # SQLite's binary comparison and served by the plain lower() indexes.
+    q = q.lower()
+    if db.engine.dialect.name == 'sqlite':
+        return and_(expr >= q, expr < q[:-1] + chr(min(ord(q[-1]) + 1, sys.maxunicode)))
+    return expr.startswith(q, autoescape=True)
+
+# Sort keys per list route; check-indexes EXPLAINs a first and a next page of each
+CLIENT_SORTS = {
+    'name': (func.lower(Client.name), lambda r: r.name, False, False, func.lower),
+    'id': (Client.id, lambda r: r.id, False, True),
+}
+CASE_SORTS = {
+    'id': (Case.id, lambda r: r.id, False, True),
+    'date': (Case.opened_on, lambda r: r.opened_on, True, True),
+    'name': (Case.ref, lambda r: r.ref, False, False),
+}
+HEARING_SORTS = {
+    'date': (Hearing.date, lambda r: r.date, True, True),
+    'id': (Hearing.id, lambda r: r.id, False, True),
+}
+INVOICE_SORTS = {
+    'id': (Invoice.id, lambda r: r.id, False, True),
+    'date': (Invoice.due_date, lambda r: r.due_date, True, True),
+    'name': (Invoice.number, lambda r: r.number, False, False),
+}
+
+def _clients_page():
+    q = Client.query
+    name = request.args.get('q', '').strip()
+    if name: q = q.filter(_prefix_match(func.lower(Client.name), name))
+    return _keyset_page(q, CLIENT_SORTS, 'name')
+
+def _cases_page():
+    q = Case.query.options(*_case_opts())
+    if _arg_int('status_id'): q = q.filter(Case.status_id == _arg_int('status_id'))
+    if _arg_int('client_id'): q = q.filter(Case.client_id == _arg_int('client_id'))
+    if _arg_int('case_type_id'): q = q.filter(Case.case_type_id == _arg_int('case_type_id'))
+    if _arg_date('date_from'): q = q.filter(Case.opened_on >= _arg_date('date_from'))
+    if _arg_date('date_to'): q = q.filter(Case.opened_on <= _arg_date('date_to'))
+    return _keyset_page(q, CASE_SORTS, 'id')
+
+def _filter_hearings(q, args=None):
+    a = request.args if args is None else args
+    if _arg_int('status_id', a): q = q.filter(Hearing.status_id == _arg_int('status_id', a))
+    if _arg_int('case_id', a): q = q.filter(Hearing.case_id == _arg_int('case_id', a))
+    if _arg_int('client_id', a):
+        q = q.filter(Hearing.case_id.in_(db.session.query(Case.id).filter(Case.client_id == _arg_int('client_id', a))))
+    if _arg_int('case_type_id', a):
+        q = q.filter(Hearing.case_id.in_(db.session.query(Case.id).filter(Case.case_type_id == _arg_int('case_type_id', a))))
+    if _arg_date('date_from', a): q = q.filter(Hearing.date >= _arg_date('date_from', a))
+    if _arg_date('date_to', a): q = q.filter(Hearing.date <= _arg_date('date_to', a))
+    return q
+
+def _hearings_page():
+    q = _filter_hearings(Hearing.query.options(*_hearing_opts()))
+    return _keyset_page(q, HEARING_SORTS, 'date')
+
+def _filter_invoices(q, args=None):
+    # args: request.args by default; the CLI passes a plain dict
+    a = request.args if args is None else args
+    if _arg_int('status_id', a): q = q.filter(Invoice.status_id == _arg_int('status_id', a))
+    if _arg_int('client_id', a): q = q.filter(Invoice.client_id == _arg_int('client_id', a))
+    if _arg_int('case_id', a): q = q.filter(Invoice.case_id == _arg_int('case_id', a))
+    if _arg_int('case_type_id', a):
+        q = q.filter(Invoice.case_id.in_(db.session.query(Case.id).filter(Case.case_type_id == _arg_int('case_type_id', a))))
+    if a.get('outstanding'): q = q.filter(Invoice.balance > 0)
+    if _arg_date('date_from', a): q = q.filter(Invoice.due_date >= _arg_date('date_from', a))
+    if _arg_date('date_to', a): q = q.filter(Invoice.due_date <= _arg_date('date_to', a))
+    return q
+
+def _invoices_page():
+    q = _filter_invoices(Invoice.query.options(*_invoice_opts()))
+    return _keyset_page(q, INVOICE_SORTS, 'id')
+
+# ------------- Typeahead lookups -------------
+app.config['TYPEAHEAD_LIMIT'] = int(os.getenv('TYPEAHEAD_LIMIT') or 20)
+
+def _client_label(c): return c.name
+def _case_label(c): return f'{c.ref} — {c.title}'
+
+def _typeahead_label(kind, id):
+    if not str(id or '').isdigit(): return ''
+    model, label = (Client, _client_label) if kind == 'clients' else (Case, _case_label)
+    r = db.session.get(model, int(id))
+    return label(r) if r else ''
+
+app.jinja_env.globals['typeahead_label'] = _typeahead_label
+
+def _form_id(model, field, label):
+    # Picker ids arrive in a hidden input, empty when nothing was picked (no JS, or text typed
+    # without choosing a result)
+    raw = (request.form.get(field) or '').strip()
+    if not raw.isdigit() or db.session.get(model, int(raw)) is None:
+        raise ValueError(f'Pick a {label} from the list')
+    return int(raw)
+
+def _typeahead_args():
+    limit = min(_arg_int('limit') or app.config['TYPEAHEAD_LIMIT'], 50)
+    return request.args.get('q', '').strip(), limit
+
+app.config['METRICS_TTL'] = int(os.getenv('METRICS_TTL') or 60)
+cache_depends('metrics', 'Client', 'Case', 'Invoice', 'Payment', 'Hearing', 'CaseStatus')
+
+def _compute_metrics(today):
+    # One round trip: every KPI is a scalar subquery of a single SELECT
+    open_ids = lookup_cache.status_ids('Pending', 'Open')
+    week_start = today - timedelta(days=today.weekday())
+    one = lambda q: q.scalar_subquery()
+    stmt = select(
+        one(select(func.count(Client.id))).label('clients'),
+        one(select(func.count(Case.id)).where(Case.status_id.in_(open_ids))).label('pending_cases'),
+        one(select(func.count(Invoice.id)).where(Invoice.status_id.in_(open_ids))).label('pending_invoices'),
+        one(select(func.coalesce(func.sum(Invoice.balance), 0)).where(Invoice.balance > 0)).label('receivables'),
+        one(select(func.count(Hearing.id)).where(
+            Hearing.date.between(week_start, week_start + timedelta(days=6)))).label('hearings_week'),
+    )
+    row = dict(db.session.execute(stmt).mappings().one())
+    row['receivables'] = Decimal(str(row['receivables'] or 0)).quantize(Decimal('0.01'))
+    return row
+
 def _metrics():
-    clients = Client.query.count()
-    pending_cases = Case.query.join(CaseStatus).filter(CaseStatus.name.in_(['Pending','Open'])).count()
-    pending_invoices = Invoice.query.join(CaseStatus).filter(CaseStatus.name.in_(['Pending','Open'])).count()
-    return {'clients': clients, 'pending_cases': pending_cases, 'pending_invoices': pending_invoices}
+    today = date.today()
+    hit = cache.get('metrics')
+    if hit and hit[0] == today: return hit[1]
+    m = _compute_metrics(today)
+    cache.set('metrics', (today, m), ttl=app.config['METRICS_TTL'])
+    return m
 
 def _invoice_paid_balance(inv: Invoice):
-    paid = db.session.query(func.coalesce(func.sum(Payment.amount), 0)).filter(Payment.invoice_id == inv.id).scalar() or 0
-    paid = Decimal(paid)
-    total = Decimal(inv.amount or 0)
-    return paid, (total - paid)
+    return Decimal(inv.paid_total or 0), Decimal(inv.balance or 0)
+
+# ------------- Invoice PDFs -------------
+app.config['EXPORT_WORKERS'] = int(os.getenv('EXPORT_WORKERS') or os.cpu_count() or 2)
+app.config['EXPORT_BATCH'] = int(os.getenv('EXPORT_BATCH') or 200)
+
+def _have_reportlab():
+    try:
+        import reportlab  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+def _invoice_pdf_data(inv, pays):
+    # Plain, picklable snapshot of everything the PDF shows
+    paid, balance = _invoice_paid_balance(inv)
+    return {
+        'id': inv.id, 'number': inv.number, 'client': inv.client.name,
+        'case': f'{inv.case.ref} — {inv.case.title}', 'status': lookup_cache.status_name(inv.status_id),
+        'due': inv.due_date.strftime('%Y-%m-%d') if inv.due_date else '—',
+        'amount': float(inv.amount or 0), 'paid': float(paid), 'balance': float(balance),
+        'payments': [(p.date.strftime('%Y-%m-%d'), p.method or '—', p.reference or '', float(p.amount))
+                     for p in pays],
+    }
+
+def _render_invoice_pdf(d):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    mem = io.BytesIO()
+    c = canvas.Canvas(mem, pagesize=A4)
+    w, h = A4
+    y = h - 50
+
+    c.setFont("Helvetica-Bold", 16); c.drawString(40, y, f"Invoice {d['number']}")
+    c.setFont("Helvetica", 10); y -= 20
+    c.drawString(40, y, f"Client: {d['client']}")
+    y -= 14; c.drawString(40, y, f"Case: {d['case']}")
+    y -= 14; c.drawString(40, y, f"Status: {d['status']}")
+    y -= 14; c.drawString(40, y, f"Due: {d['due']}")
+    y -= 20; c.setFont("Helvetica-Bold", 12)
+    c.drawString(40, y, f"Total: {d['amount']:.2f}    Paid: {d['paid']:.2f}    Balance: {d['balance']:.2f}")
+
+    y -= 24; c.setFont("Helvetica-Bold", 11); c.drawString(40, y, "Payments")
+    y -= 16; c.setFont("Helvetica", 10)
+    if not d['payments']:
+        c.drawString(40, y, "— None —"); y -= 14
+    else:
+        for pdate, method, ref, amount in d['payments']:
+            c.drawString(40, y, pdate)
+            c.drawString(140, y, method)
+            c.drawString(240, y, ref)
+            c.drawRightString(w-40, y, f"{amount:.2f}")
+            y -= 14
+            if y < 60:
+                c.showPage(); y = h - 50; c.setFont("Helvetica", 10)
+
+    c.showPage(); c.save()
+    return mem.getvalue()
+
+def _render_invoice_pdfs(batch):
+    return [(f"invoice-{re.sub(r'[^A-Za-z0-9._-]+', '_', d['number'])}-{d['id']}.pdf", _render_invoice_pdf(d))
+            for d in batch]
+
+def _export_batches(args, size):
+    # Keyset walk over the filtered invoices: two queries per batch (invoices, then their payments)
+    last = 0
+    while True:
+        invs = _filter_invoices(Invoice.query.options(*_invoice_opts()), args) \
+            .filter(Invoice.id > last).order_by(Invoice.id).limit(size).all()
+        if not invs: return
+        pays = {}
+        for p in Payment.query.filter(Payment.invoice_id.in_([i.id for i in invs])) \
+                .order_by(Payment.invoice_id, Payment.date, Payment.id):
+            pays.setdefault(p.invoice_id, []).append(p)
+        yield [_invoice_pdf_data(i, pays.get(i.id, [])) for i in invs]
+        last = invs[-1].id
+        db.session.expunge_all()
+
+_export_pool = None
+
+_export_pool_lock = threading.Lock()   # job worker threads may ask for the pool concurrently
+
+def _get_export_pool():
+    global _export_pool
+    with _export_pool_lock:
+        if _export_pool is None:
+            import multiprocessing as mp
+            from concurrent.futures import ProcessPoolExecutor
+            _export_pool = ProcessPoolExecutor(app.config['EXPORT_WORKERS'], mp_context=mp.get_context('spawn'))
+    return _export_pool
+
+class _ZipSink:
+    # Write-only, unseekable target: zipfile falls back to data descriptors and we drain as we go
+    def __init__(self): self._chunks = []
+    def write(self, b): self._chunks.append(bytes(b)); return len(b)
+    def flush(self): pass
+    def drain(self):
+        out = b''.join(self._chunks); self._chunks.clear(); return out
+
+def _export_invoice_pdfs_zip(args):
+    import zipfile
+    from collections import deque
+    pool = _get_export_pool()
+    window = deque()
+    sink = _ZipSink()
+    zf = zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED)
+
+    def emit(future):
+        for name, pdf in future.result(): zf.writestr(name, pdf)
+        return sink.drain()
+
+    # Rendering batches of ~20 keeps IPC overhead low; at most 2 batches per worker are in flight.
+    for batch in _export_batches(args, app.config['EXPORT_BATCH']):
+        for i in range(0, len(batch), 20):
+            window.append(pool.submit(_render_invoice_pdfs, batch[i:i + 20]))
+            while len(window) > app.config['EXPORT_WORKERS'] * 2:
+                yield emit(window.popleft())
+    while window: yield emit(window.popleft())
+    zf.close()
+    yield sink.drain()
+
+# ------------- Full-text search -------------
+# One document per client, case, hearing and payment: an FTS5 table on SQLite, a
+# search_doc table with a GIN-indexed tsvector on Postgres, LIKE scans otherwise.
+# Document key = row id * 8 + kind; documents are rewritten in the writer's transaction.
+app.config['SEARCH_LIMIT'] = int(os.getenv('SEARCH_LIMIT') or 50)
+
+SEARCH_SOURCES = {   # kind: (key offset, model, indexed fields, title expr, body expr)
+    'client': (1, Client, ('name', 'email'), Client.name, func.coalesce(Client.email, '')),
+    'case': (2, Case, ('ref', 'title'), Case.ref + ' ' + Case.title, literal('')),
+    'hearing': (3, Hearing, ('notes',), literal(''), func.coalesce(Hearing.notes, '')),
+    'payment': (4, Payment, ('reference', 'note'), func.coalesce(Payment.reference, ''), func.coalesce(Payment.note, '')),
+}
+_SEARCH_KINDS = {src[1]: kind for kind, src in SEARCH_SOURCES.items()}
+_SEARCH_BY_OFFSET = {src[0]: kind for kind, src in SEARCH_SOURCES.items()}
+_search_fts = table('search_fts', column('rowid'), column('title'), column('body'))
+_search_doc = table('search_doc', column('key'), column('title'), column('body'))
+_search_mode_cache = None
+
+def _search_mode(conn):
+    global _search_mode_cache
+    if _search_mode_cache is None:
+        name = conn.dialect.name
+        if name == 'sqlite' and inspect(conn).has_table('search_fts'): _search_mode_cache = 'fts5'
+        elif name == 'postgresql' and inspect(conn).has_table('search_doc'): _search_mode_cache = 'pg'
+        else: _search_mode_cache = 'like'
+    return _search_mode_cache
+
+def _search_target(conn):
+    mode = _search_mode(conn)
+    if mode == 'fts5': return _search_fts, _search_fts.c.rowid
+    if mode == 'pg': return _search_doc, _search_doc.c.key
+    return None, None
+
+def _search_create(conn):
+    global _search_mode_cache
+    if conn.dialect.name == 'sqlite':
+        try:
+            conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+                              "title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"))
+        except OperationalError as e:   # SQLite built without FTS5
+            app.logger.warning('Full-text index unavailable (%s); search falls back to LIKE', e)
+    elif conn.dialect.name == 'postgresql':
+        conn.execute(text("CREATE TABLE IF NOT EXISTS search_doc (key BIGINT PRIMARY KEY, title TEXT NOT NULL, "
+                          "body TEXT NOT NULL, tsv tsvector GENERATED ALWAYS AS (setweight(to_tsvector('simple', title), 'A') "
+                          "|| setweight(to_tsvector('simple', body), 'B')) STORED)"))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_search_doc_tsv ON search_doc USING gin (tsv)'))
+    _search_mode_cache = None
+
+def _search_select(kind, ids=None):
+    offset, model, _, title, body = SEARCH_SOURCES[kind]
+    stmt = select(model.id * 8 + offset, title, body)
+    return stmt if ids is None else stmt.where(model.id.in_(ids))
+
+def _search_sync(conn, changed):
+    # changed: {kind: ids}; drops their documents and re-reads whatever rows still exist
+    t, key = _search_target(conn)
+    if t is None: return
+    for kind, ids in changed.items():
+        ids = sorted(i for i in ids if i is not None)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            conn.execute(delete(t).where(key.in_([n * 8 + SEARCH_SOURCES[kind][0] for n in chunk])))
+            conn.execute(insert(t).from_select([key.name, 'title', 'body'], _search_select(kind, chunk)))
+
+def _search_rebuild(conn):
+    t, key = _search_target(conn)
+    if t is None: return 0
+    conn.execute(delete(t))
+    for kind in SEARCH_SOURCES: conn.execute(insert(t).from_select([key.name, 'title', 'body'], _search_select(kind)))
+    if _search_mode(conn) == 'fts5': conn.execute(text("INSERT INTO search_fts(search_fts) VALUES ('optimize')"))
+    return conn.execute(select(func.count()).select_from(t)).scalar()
+
+@event.listens_for(Session, 'after_flush')
+def _search_after_flush(session, ctx):
+    changed = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        kind = _SEARCH_KINDS.get(type(obj))
+        if not kind: continue
+        if obj in session.dirty and not any(inspect(obj).attrs[f].history.has_changes() for f in SEARCH_SOURCES[kind][2]):
+            continue
+        changed.setdefault(kind, set()).add(obj.id)
+    if changed: _search_sync(session.connection(), changed)
+
+def _search_terms(q):
+    return re.findall(r'\w+', (q or '').lower())[:8]
+
+def _search_keys(terms, limit):
+    # [(kind, id)] best first; every term must match, the last one as a prefix
+    conn = db.session.connection()
+    mode = _search_mode(conn)
+    if mode == 'fts5':
+        match = ' '.join([f'"{t}"' for t in terms[:-1]] + [f'"{terms[-1]}"*'])
+        rows = conn.execute(text('SELECT rowid FROM search_fts WHERE search_fts MATCH :m '
+                                 'ORDER BY bm25(search_fts, 10.0, 1.0) LIMIT :n'), {'m': match, 'n': limit})
+    elif mode == 'pg':
+        query = ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+        rows = conn.execute(text("SELECT key FROM search_doc, to_tsquery('simple', :q) q WHERE tsv @@ q "
+                                 'ORDER BY ts_rank(tsv, q) DESC, key LIMIT :n'), {'q': query, 'n': limit})
+    else:
+        keys = []
+        for kind, (offset, model, _, title, body) in SEARCH_SOURCES.items():
+            doc = func.lower(title + ' ' + body)
+            stmt = select(model.id).where(and_(*[doc.contains(t, autoescape=True) for t in terms]))
+            keys += [(kind, i) for (i,) in db.session.execute(stmt.order_by(model.id.desc()).limit(limit))]
+        return keys[:limit]
+    return [(_SEARCH_BY_OFFSET[k % 8], k // 8) for (k,) in rows]
+
+Hit = namedtuple('Hit', 'kind id label detail url')
+
+def _search_hit(kind, obj):
+    if kind == 'client':
+        return Hit(kind, obj.id, obj.name, obj.email or obj.phone or '', url_for('clients_edit', id=obj.id))
+    if kind == 'case':
+        return Hit(kind, obj.id, f'{obj.ref} — {obj.title}', obj.client.name, url_for('cases_edit', id=obj.id))
+    if kind == 'hearing':
+        return Hit(kind, obj.id, f'{obj.date} · {obj.case.ref}', obj.notes or '', url_for('hearings_edit', id=obj.id))
+    return Hit(kind, obj.id, f'{obj.reference or "Payment"} · {obj.amount}',
+               f'{obj.invoice.number} {obj.note or ""}'.strip(), url_for('invoice_view', id=obj.invoice_id))
+
+_SEARCH_OPTS = {'case': (joinedload(Case.client),), 'hearing': (joinedload(Hearing.case),),
+                'payment': (joinedload(Payment.invoice),)}
+
+def search_all(q, limit=None):
+    terms = _search_terms(q)
+    if not terms: return []
+    keys = _search_keys(terms, limit or app.config['SEARCH_LIMIT'])
+    objs = {}
+    for kind in {k for k, _ in keys}:
+        model = SEARCH_SOURCES[kind][1]
+        ids = [i for k, i in keys if k == kind]
+        found = model.query.options(*_SEARCH_OPTS.get(kind, ())).filter(model.id.in_(ids))
+        objs.update({(kind, o.id): o for o in found})
+    return [_search_hit(k, objs[(k, i)]) for k, i in keys if (k, i) in objs]
+
+# ------------- Cause list -------------
+# Case.next_hearing_date is the earliest hearing on or after today. It is refreshed for the
+# cases whose hearings change; `flask refresh-next-hearings` rolls it forward as days pass.
+# Cause lists and iCal feeds are cached under the 'calendar' version in app_meta, which any
+# write to hearings, cases or clients bumps.
+app.config['CAUSELIST_TTL'] = int(os.getenv('CAUSELIST_TTL') or 86400)
+app.config['ICAL_PAST_DAYS'] = int(os.getenv('ICAL_PAST_DAYS') or 30)
+_ICAL_REV = '1'   # bump when the feed layout changes
+
+def _next_hearing_refresh(conn, case_ids=None, stale_only=False, today=None):
+    today = today or date.today()
+    h, c = Hearing.__table__, Case.__table__
+    nxt = select(func.min(h.c.date)).where(h.c.case_id == c.c.id, h.c.date >= today).scalar_subquery()
+    stmt = update(c).values(next_hearing_date=nxt)
+    if case_ids is not None: stmt = stmt.where(c.c.id.in_(case_ids))
+    if stale_only: stmt = stmt.where(c.c.next_hearing_date < today)
+    return conn.execute(stmt)
+
+@event.listens_for(Session, 'after_flush')
+def _calendar_after_flush(session, ctx):
+    case_ids, touched = set(), False
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Hearing):
+            case_ids.add(obj.case_id)
+            case_ids.update(inspect(obj).attrs.case_id.history.deleted or ())
+            touched = True
+        elif isinstance(obj, (Case, Client)):
+            touched = True
+    case_ids.discard(None)
+    if case_ids:
+        _next_hearing_refresh(session.connection(), case_ids)
+        session.info.setdefault('next_hearing_ids', set()).update(case_ids)
+    if touched: _bump_version(session.connection(), 'calendar')
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _next_hearing_expire(session, ctx):
+    ids = session.info.pop('next_hearing_ids', None)
+    if not ids: return
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Case) and obj.id in ids:
+            session.expire(obj, ['next_hearing_date'])
+
+def _calendar_version():
+    return db.session.execute(select(AppMeta.value).where(AppMeta.key == 'calendar')).scalar() or 0
+
+CauseItem = namedtuple('CauseItem', 'id date status_id notes case_id ref title advocate client')
+
+def _cause_items(start, end):
+    # Hearings in [start, end], ordered as printed; cached per date range and calendar version
+    key = f'causelist:{_calendar_version()}:{start}:{end}'
+    items = cache.get(key)
+    if items is None:
+        rows = db.session.execute(
+            select(Hearing.id, Hearing.date, Hearing.status_id, Hearing.notes, Case.id, Case.ref, Case.title,
+                   Case.advocate, Client.name)
+            .join(Case, Case.id == Hearing.case_id).join(Client, Client.id == Case.client_id)
+            .where(Hearing.date >= start, Hearing.date <= end)
+            .order_by(Hearing.date, Case.advocate, Case.ref, Hearing.id))
+        items = [CauseItem(*r) for r in rows]
+        cache.set(key, items, ttl=app.config['CAUSELIST_TTL'])
+    return items
+
+def _cause_range(view, day):
+    if view == 'day': return day, day
+    start = day - timedelta(days=day.weekday())
+    return start, start + timedelta(days=6)
+
+def _feed_signer():
+    return URLSafeSerializer(app.config['SECRET_KEY'], salt='ical-feed')
+
+def feed_url(scope):
+    # scope: 'firm' or 'client:<id>'; the signed token is the only credential a calendar app sends
+    return url_for('calendar_feed', token=_feed_signer().dumps(scope), _external=True)
+
+app.jinja_env.globals['feed_url'] = feed_url
+
+def _ical_text(s):
+    return (s or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r', '').replace('\n', '\\n')
+
+def _ical_fold(line):
+    # RFC 5545: content lines longer than 75 octets continue on lines starting with a space
+    out, cur, size = [], '', 0
+    for ch in line:
+        n = len(ch.encode())
+        if size + n > 75:
+            out.append(cur); cur, size = ' ', 1
+        cur += ch; size += n
+    out.append(cur)
+    return '\r\n'.join(out)
+
+def _render_ical(scope):
+    q = (select(Hearing.id, Hearing.date, Hearing.status_id, Hearing.notes, Case.ref, Case.title, Case.advocate, Client.name)
+         .join(Case, Case.id == Hearing.case_id).join(Client, Client.id == Case.client_id)
+         .where(Hearing.date >= date.today() - timedelta(days=app.config['ICAL_PAST_DAYS']))
+         .order_by(Hearing.date, Hearing.id))
+    if scope.startswith('client:'): q = q.where(Case.client_id == int(scope.split(':', 1)[1]))
+    stamp = _utcnow().strftime('%Y%m%dT%H%M%SZ')
+    host = request.host.split(':')[0]
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Kwetu Partners//Juris360//EN', 'CALSCALE:GREGORIAN',
+             'X-WR-CALNAME:' + _ical_text('Juris360 hearings')]
+    for id, day, status_id, notes, ref, title, advocate, client in db.session.execute(q):
+        desc = [f'Client: {client}', f'Status: {lookup_cache.status_name(status_id)}']
+        if advocate: desc.append(f'Advocate: {advocate}')
+        if notes: desc.append(notes)
+        lines += ['BEGIN:VEVENT', f'UID:hearing-{id}@{host}', f'DTSTAMP:{stamp}',
+                  f'DTSTART;VALUE=DATE:{day:%Y%m%d}', f'DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}',
+                  'SUMMARY:' + _ical_text(f'{ref} — {title}'), 'DESCRIPTION:' + _ical_text('\n'.join(desc)),
+                  'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_ical_fold(l) for l in lines) + '\r\n'
+
+# ------------- Reporting -------------
+# Ageing is one grouped pass over outstanding invoices (stored balances). Collections read
+# the collection_summary table, which payment writes keep current month by month.
+AGE_BUCKETS = [('current', 'Not yet due'), ('d0_30', '0–30 days'), ('d31_60', '31–60 days'),
+               ('d61_90', '61–90 days'), ('d90_plus', '90+ days')]
+_CENTS = Decimal('0.01')
+
+def _cents(v): return Decimal(str(v or 0)).quantize(_CENTS)
+
+def _period(d): return f'{d.year:04d}-{d.month:02d}'
+
+def _period_bounds(p):
+    y, m = map(int, p.split('-'))
+    return date(y, m, 1), date(y + m // 12, m % 12 + 1, 1)
+
+def _periods_between(lo, hi):
+    out, p = [], _period(lo)
+    while p <= _period(hi):
+        out.append(p); p = _period(_period_bounds(p)[1])
+    return out
+
+def _collections_refresh(conn, periods=None):
+    # periods=None rebuilds every month from the first payment to the last
+    pay, cs = Payment.__table__, CollectionSummary.__table__
+    if periods is None:
+        conn.execute(delete(cs))
+        lo, hi = conn.execute(select(func.min(pay.c.date), func.max(pay.c.date))).one()
+        periods = _periods_between(lo, hi) if lo else []
+    method = func.coalesce(pay.c.method, '')
+    for p in sorted(periods):
+        start, end = _period_bounds(p)
+        conn.execute(delete(cs).where(cs.c.period == p))
+        conn.execute(insert(cs).from_select(['period', 'method', 'total', 'count'],
+            select(literal(p), method, func.round(func.sum(pay.c.amount), 2), func.count(pay.c.id))
+            .where(pay.c.date >= start, pay.c.date < end).group_by(method)))
+
+@event.listens_for(Session, 'after_flush')
+def _collections_after_flush(session, ctx):
+    periods = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Payment): continue
+        attrs = inspect(obj).attrs
+        if obj in session.dirty and not any(attrs[f].history.has_changes() for f in ('date', 'amount', 'method')):
+            continue
+        periods.update(_period(d) for d in [obj.date, *(attrs.date.history.deleted or ())] if d)
+    if periods: _collections_refresh(session.connection(), periods)
+
+def aged_receivables(today):
+    due, bal = Invoice.due_date, Invoice.balance
+    d30, d60, d90 = (today - timedelta(days=n) for n in (30, 60, 90))
+    bucket = lambda cond: func.coalesce(func.sum(case((cond, bal), else_=0)), 0)
+    stmt = (select(Client.id, Client.name,
+                   bucket(or_(due.is_(None), due >= today)).label('current'),
+                   bucket(and_(due < today, due >= d30)).label('d0_30'),
+                   bucket(and_(due < d30, due >= d60)).label('d31_60'),
+                   bucket(and_(due < d60, due >= d90)).label('d61_90'),
+                   bucket(due < d90).label('d90_plus'),
+                   func.sum(bal).label('total'), func.count(Invoice.id).label('invoices'))
+            .join(Client, Client.id == Invoice.client_id).where(bal > 0)
+            .group_by(Client.id, Client.name).order_by(func.sum(bal).desc(), Client.id))
+    rows = []
+    for r in db.session.execute(stmt).mappings():
+        r = dict(r)
+        for k in [b for b, _ in AGE_BUCKETS] + ['total']: r[k] = _cents(r[k])
+        rows.append(r)
+    totals = {k: sum((r[k] for r in rows), Decimal('0.00')) for k in [b for b, _ in AGE_BUCKETS] + ['total']}
+    return rows, totals
+
+def collections(first, last):
+    # first/last: 'YYYY-MM' inclusive; reads only the summary table
+    cs = CollectionSummary
+    rng = cs.period.between(first, last)
+    by_month = db.session.execute(select(cs.period, func.sum(cs.total), func.sum(cs.count))
+                                  .where(rng).group_by(cs.period).order_by(cs.period)).all()
+    by_method = db.session.execute(select(cs.method, func.sum(cs.total), func.sum(cs.count))
+                                   .where(rng).group_by(cs.method).order_by(func.sum(cs.total).desc())).all()
+    return ([{'period': p, 'total': _cents(t), 'count': int(n)} for p, t, n in by_month],
+            [{'method': m or 'Unspecified', 'total': _cents(t), 'count': int(n)} for m, t, n in by_method])
+
+# ------------- Tabular export -------------
+# CSV / XLSX of whole tables. Rows come off a server-side cursor EXPORT_YIELD at a time
+# (one SELECT, names and payment aggregates joined in) and are written out as they arrive.
+app.config['EXPORT_YIELD'] = int(os.getenv('EXPORT_YIELD') or 2000)
+
+def _invoice_export_stmt(args):
+    last_paid = (select(func.max(Payment.date)).where(Payment.invoice_id == Invoice.id)
+                 .correlate(Invoice).scalar_subquery())
+    stmt = (select(Invoice.id, Invoice.number, Client.name, Case.ref, CaseStatus.name, Invoice.amount,
+                   Invoice.due_date, Invoice.paid_total, Invoice.balance, Invoice.payment_count, last_paid)
+            .join(Client, Client.id == Invoice.client_id).join(Case, Case.id == Invoice.case_id)
+            .join(CaseStatus, CaseStatus.id == Invoice.status_id))
+    q = _filter_invoices(db.session.query(Invoice.id), args)
+    return (stmt.where(Invoice.id.in_(q.scalar_subquery())).order_by(Invoice.id),
+            ['ID', 'Number', 'Client', 'Case', 'Status', 'Amount', 'Due', 'Paid', 'Balance', 'Payments', 'Last Payment'])
+
+def _payment_export_stmt(args):
+    paid_to_date = func.sum(Payment.amount).over(partition_by=Payment.invoice_id, order_by=(Payment.date, Payment.id))
+    stmt = (select(Payment.id, Payment.date, Invoice.number, Client.name, Case.ref, Payment.amount,
+                   paid_to_date, Invoice.amount - paid_to_date, Payment.method, Payment.reference, Payment.note)
+            .join(Invoice, Invoice.id == Payment.invoice_id).join(Client, Client.id == Invoice.client_id)
+            .join(Case, Case.id == Invoice.case_id).order_by(Payment.date, Payment.id))
+    # The invoices page's filters (status, client, outstanding, due dates...) pick invoices, and
+    # the export holds those invoices' payments; paid_from/paid_to bound the payment dates
+    invoices = _filter_invoices(db.session.query(Invoice.id), args)
+    if invoices.whereclause is not None: stmt = stmt.where(Payment.invoice_id.in_(invoices.scalar_subquery()))
+    if _arg_int('invoice_id', args): stmt = stmt.where(Payment.invoice_id == _arg_int('invoice_id', args))
+    # Payment-date bounds go on the outer query so the running totals still count earlier payments
+    if _arg_date('paid_from', args) or _arg_date('paid_to', args):
+        sub = stmt.subquery()
+        outer = select(*sub.c)
+        if _arg_date('paid_from', args): outer = outer.where(sub.c[1] >= _arg_date('paid_from', args))
+        if _arg_date('paid_to', args): outer = outer.where(sub.c[1] <= _arg_date('paid_to', args))
+        stmt = outer.order_by(sub.c[1], sub.c[0])
+    return stmt, ['ID', 'Date', 'Invoice', 'Client', 'Case', 'Amount', 'Paid To Date', 'Invoice Balance',
+                  'Method', 'Reference', 'Note']
+
+def _hearing_export_stmt(args):
+    stmt = (select(Hearing.id, Hearing.date, Case.ref, Case.title, Client.name, CaseStatus.name, Hearing.notes)
+            .join(Case, Case.id == Hearing.case_id).join(Client, Client.id == Case.client_id)
+            .join(CaseStatus, CaseStatus.id == Hearing.status_id))
+    q = _filter_hearings(db.session.query(Hearing.id), args)
+    return (stmt.where(Hearing.id.in_(q.scalar_subquery())).order_by(Hearing.date, Hearing.id),
+            ['ID', 'Date', 'Case', 'Title', 'Client', 'Status', 'Notes'])
+
+EXPORTS = {'invoices': _invoice_export_stmt, 'payments': _payment_export_stmt, 'hearings': _hearing_export_stmt}
+
+def _export_rows(stmt):
+    result = db.session.execute(stmt.execution_options(yield_per=app.config['EXPORT_YIELD']))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+class _LineSink:
+    def __init__(self): self._parts = []
+    def write(self, s): self._parts.append(s)
+    def drain(self):
+        out = ''.join(self._parts); self._parts.clear(); return out
+
+def _export_csv(stmt, header):
+    sink = _LineSink()
+    w = csv.writer(sink)
+    w.writerow(header)
+    yield '\ufeff' + sink.drain()   # BOM so Excel picks UTF-8
+    for part in _export_rows(stmt):
+        w.writerows(part)
+        yield sink.drain()
+
+_XML_BAD = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_XLSX_EPOCH = date(1899, 12, 30)
+
+def _xlsx_cell(v):
+    if v is None: return '<c/>'
+    if isinstance(v, bool): return f'<c t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, float, Decimal)): return f'<c><v>{v}</v></c>'
+    if isinstance(v, datetime): return f'<c s="2"><v>{(v - datetime(1899, 12, 30)).total_seconds() / 86400:.6f}</v></c>'
+    if isinstance(v, date): return f'<c s="1"><v>{(v - _XLSX_EPOCH).days}</v></c>'
+    s = _XML_BAD.sub('', str(v)).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{s}</t></is></c>'
+
+def _xlsx_row(values): return '<row>' + ''.join(_xlsx_cell(v) for v in values) + '</row>'
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/></Types>',
+    '_rels/.rels': '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/></Relationships>',
+    'xl/_rels/workbook.xml.rels': '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/></Relationships>',
+    'xl/styles.xml': '<?xml version="1.0" encoding="UTF-8"?><styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font/></fonts><fills count="1"><fill/></fills><borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs><cellXfs count="3"><xf/><xf numFmtId="14" applyNumberFormat="1"/>'
+        '<xf numFmtId="22" applyNumberFormat="1"/></cellXfs></styleSheet>',
+}
+
+def _export_xlsx(stmt, header, sheet):
+    # Minimal SpreadsheetML with inline strings, so the sheet can be written row by row
+    import zipfile
+    from xml.sax.saxutils import quoteattr
+    sink = _ZipSink()
+    zf = zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED)
+    for name, xml in _XLSX_PARTS.items(): zf.writestr(name, xml)
+    zf.writestr('xl/workbook.xml', '<?xml version="1.0" encoding="UTF-8"?><workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                f'<sheets><sheet name={quoteattr(sheet)} sheetId="1" r:id="rId1"/></sheets></workbook>')
+    with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as f:
+        f.write(('<?xml version="1.0" encoding="UTF-8"?><worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                 '<sheetData>' + _xlsx_row(header)).encode())
+        yield sink.drain()
+        for part in _export_rows(stmt):
+            f.write(''.join(_xlsx_row(r) for r in part).encode())
+            yield sink.drain()
+        f.write(b'</sheetData></worksheet>')
+    zf.close()
+    yield sink.drain()
+
+# ------------- Rendered invoice cache -------------
+# Print HTML and PDF bytes are cached per invoice under a content key built from the
+# invoice row, its payments_version and the names it displays; the same key is the ETag.
+_INVOICE_RENDER_REV = '2'   # bump when the print/PDF layout changes
+
+def _invoice_etag(inv, kind):
+    parts = (kind, _INVOICE_RENDER_REV, inv.id, inv.number, str(inv.amount), inv.status_id,
+             lookup_cache.status_name(inv.status_id), str(inv.due_date), str(inv.paid_total),
+             str(inv.balance), inv.payment_count, inv.payments_version,
+             inv.client.name, inv.case.ref, inv.case.title)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def _cached_render(inv, kind, etag, render):
+    key = f'invoice:{inv.id}:{kind}'
+    hit = cache.get(key)
+    if hit and hit[0] == etag: return hit[1]
+    body = render()
+    cache.set(key, (etag, body))
+    return body
+
+def _not_modified(etag, modified):
+    if is_resource_modified(request.environ, etag=etag, last_modified=modified): return None
+    return _with_validators(Response(status=304), etag, modified)
+
+def _with_validators(resp, etag, modified):
+    resp.set_etag(etag)
+    if modified: resp.last_modified = modified.replace(tzinfo=timezone.utc)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True   # always revalidate; unchanged invoices answer 304
+    return resp
+
+@event.listens_for(Session, 'after_flush')
+def _invoice_render_after_flush(session, ctx):
+    ids = session.info.setdefault('rendered_invoice_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Invoice): ids.add(obj.id)
+        elif isinstance(obj, Payment):
+            ids.add(obj.invoice_id)
+            ids.update(inspect(obj).attrs.invoice_id.history.deleted or ())
+
+@event.listens_for(Session, 'after_commit')
+def _invoice_render_evict(session):
+    ids = session.info.pop('rendered_invoice_ids', None)
+    if ids: cache.delete(*[f'invoice:{i}:{k}' for i in ids if i for k in ('html', 'pdf')])
+
+# ------------- Bulk import -------------
+# Streams CSV / JSON Lines rows, validates them against in-memory reference maps and
+# inserts them with executemany in IMPORT_BATCH-sized transactions. Committed batches stay
+# committed, so rows that can't be parsed or validated are reported by row number in the
+# normal report rather than failing the request; a client resubmits just those rows.
+app.config['IMPORT_BATCH'] = int(os.getenv('IMPORT_BATCH') or 1000)
+app.config['IMPORT_MAX_ERRORS'] = int(os.getenv('IMPORT_MAX_ERRORS') or 1000)
+
+def _read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    head = stream.read(1)
+    while head and head.isspace(): head = stream.read(1)
+    if head == '[':   # JSON array: parsed whole; use JSON Lines for very large files
+        yield from json.loads(head + stream.read())
+        return
+    first = head + stream.readline()
+    for line in [first] if first.strip() else []: yield _json_line(line)
+    for line in stream:
+        if line.strip(): yield _json_line(line)
+
+def _json_line(line):
+    # A bad line becomes that row's error (see import_rows) instead of ending an import
+    # whose earlier batches are already committed
+    try: return json.loads(line)
+    except ValueError as e: return ValueError(f'unreadable json: {e}')
+
+def _import_format(filename, mimetype):
+    name = (filename or '').lower()
+    if name.endswith(('.json', '.jsonl', '.ndjson')) or 'json' in (mimetype or ''): return 'json'
+    return 'csv'
+
+class _RefMaps:
+    # name/number -> id maps, loaded once per import; ambiguous keys map to None
+    def __init__(self):
+        self.clients = self._map(select(func.lower(Client.name), Client.id))
+        self.client_ids = set(self.clients.values()) | {i for (i,) in db.session.execute(select(Client.id))}
+        self.cases = self._map(select(func.lower(Case.ref), Case.id))
+        self.case_clients = dict(db.session.execute(select(Case.id, Case.client_id)).all())
+        self.invoices = self._map(select(func.lower(Invoice.number), Invoice.id))
+        self.invoice_ids = {i for (i,) in db.session.execute(select(Invoice.id))}
+        self.case_types, self.statuses = lookup_cache.case_types(), lookup_cache.statuses()
+        self.open_id, self.pending_id = lookup_cache.status_id('Open'), lookup_cache.status_id('Pending')
+
+    @staticmethod
+    def _map(stmt):
+        out = {}
+        for key, id in db.session.execute(stmt):
+            out[key] = None if key in out else id
+        return out
+
+def _ref(row, id_field, name_field, by_name, valid_ids, label):
+    raw_id = str(row.get(id_field) or '').strip()
+    if raw_id:
+        if not raw_id.isdigit() or int(raw_id) not in valid_ids: raise ValueError(f'unknown {id_field} {raw_id}')
+        return int(raw_id)
+    name = str(row.get(name_field) or '').strip().lower()
+    if not name: raise ValueError(f'{name_field} or {id_field} is required')
+    if name not in by_name: raise ValueError(f'unknown {label} {row.get(name_field)!r}')
+    if by_name[name] is None: raise ValueError(f'ambiguous {label} {row.get(name_field)!r}')
+    return by_name[name]
+
+def _lookup_ref(row, id_field, name_field, items, label, default=None):
+    raw_id = str(row.get(id_field) or '').strip()
+    if raw_id.isdigit() and any(i.id == int(raw_id) for i in items): return int(raw_id)
+    name = str(row.get(name_field) or '').strip().lower()
+    for i in items:
+        if i.name.lower() == name: return i.id
+    if not raw_id and not name and default: return default
+    raise ValueError(f'unknown {label} {row.get(name_field) or raw_id!r}')
+
+def _req(row, field):
+    v = str(row.get(field) or '').strip()
+    if not v: raise ValueError(f'{field} is required')
+    return v
+
+def _opt_date(row, field, default=None):
+    v = str(row.get(field) or '').strip()
+    if not v: return default
+    try: return datetime.strptime(v, '%Y-%m-%d').date()
+    except ValueError: raise ValueError(f'{field} must be YYYY-MM-DD')
+
+def _money(row, field, positive=False):
+    try: v = Decimal(str(row.get(field) or '').strip()).quantize(Decimal('0.01'))
+    except Exception: raise ValueError(f'{field} must be a number')
+    if positive and v <= 0: raise ValueError(f'{field} must be greater than zero')
+    return v
+
+def _import_client(row, refs):
+    return {'name': _req(row, 'name'), 'phone': row.get('phone') or None,
+            'email': row.get('email') or None, 'address': row.get('address') or None}
+
+def _import_case(row, refs):
+    return {'ref': _req(row, 'ref'), 'title': _req(row, 'title'),
+            'client_id': _ref(row, 'client_id', 'client', refs.clients, refs.client_ids, 'client'),
+            'case_type_id': _lookup_ref(row, 'case_type_id', 'case_type', refs.case_types, 'case type'),
+            'status_id': _lookup_ref(row, 'status_id', 'status', refs.statuses, 'status', refs.open_id),
+            'opened_on': _opt_date(row, 'opened_on', date.today()), 'advocate': row.get('advocate') or None}
+
+def _import_hearing(row, refs):
+    return {'case_id': _ref(row, 'case_id', 'case', refs.cases, refs.case_clients, 'case'),
+            'date': _opt_date(row, 'date') or _req(row, 'date'),
+            'status_id': _lookup_ref(row, 'status_id', 'status', refs.statuses, 'status', refs.pending_id),
+            'notes': row.get('notes') or None}
+
+def _import_invoice(row, refs):
+    case_id = _ref(row, 'case_id', 'case', refs.cases, refs.case_clients, 'case')
+    client_id = refs.case_clients[case_id]
+    if row.get('client_id') or row.get('client'):
+        client_id = _ref(row, 'client_id', 'client', refs.clients, refs.client_ids, 'client')
+    amount = _money(row, 'amount')
+    return {'number': _req(row, 'number'), 'client_id': client_id, 'case_id': case_id,
+            'status_id': _lookup_ref(row, 'status_id', 'status', refs.statuses, 'status', refs.pending_id),
+            'amount': amount, 'due_date': _opt_date(row, 'due_date'),
+            'paid_total': Decimal('0'), 'balance': amount, 'payment_count': 0,
+            'payments_version': 0, 'updated_at': _utcnow()}
+
+def _import_payment(row, refs):
+    return {'invoice_id': _ref(row, 'invoice_id', 'invoice', refs.invoices, refs.invoice_ids, 'invoice'),
+            'amount': _money(row, 'amount', positive=True), 'date': _opt_date(row, 'date', date.today()),
+            'method': row.get('method') or None, 'reference': row.get('reference') or None,
+            'note': row.get('note') or None}
+
+IMPORTERS = {
+    'clients': (Client, _import_client),
+    'cases': (Case, _import_case),
+    'hearings': (Hearing, _import_hearing),
+    'invoices': (Invoice, _import_invoice),
+    'payments': (Payment, _import_payment),
+}
+
+def _after_bulk_insert(conn, model, rows, ids):
+    # Bulk inserts bypass the ORM flush hooks; keep derived data in step by hand.
+    if model is Payment:
+        _ledger_refresh(conn, {r['invoice_id'] for r in rows})
+        _close_paid_invoices(conn, {r['invoice_id'] for r in rows})
+        _sync_mark(db.session, Invoice, {r['invoice_id'] for r in rows})
+        _collections_refresh(conn, {_period(r['date']) for r in rows})
+    if model in _SEARCH_KINDS: _search_sync(conn, {_SEARCH_KINDS[model]: ids})
+    if model is Hearing:
+        _next_hearing_refresh(conn, {r['case_id'] for r in rows})
+        _bump_version(conn, 'calendar')
+
+def _close_paid_invoices(conn, ids):
+    # Same rule as a single payment: an invoice whose balance reaches zero is Closed
+    closed = lookup_cache.status_id('Closed')
+    if not closed or not ids: return 0
+    inv = Invoice.__table__
+    return conn.execute(update(inv).where(inv.c.id.in_(ids), inv.c.balance <= 0, inv.c.status_id != closed)
+                        .values(status_id=closed, updated_at=_utcnow())).rowcount
+
+def _bulk_invalidate(model, rows):
+    _invalidate({model.__name__, 'Invoice'} if model is Payment else {model.__name__})
+    if model is Payment:
+        cache.delete(*[f'invoice:{i}:{k}' for i in {r['invoice_id'] for r in rows} for k in ('html', 'pdf')])
+
+def _insert_batch(model, rows):
+    ids = _with_lock_retry(_insert_batch_tx, model, rows)
+    _bulk_invalidate(model, rows)
+    return ids
+
+def _insert_batch_tx(model, rows):
+    with write_intent():
+        conn = db.session.connection()
+        t = model.__table__
+        if model in _SYNC_KINDS:
+            now = _utcnow()
+            rows = [{**r, 'updated_at': now} for r in rows]
+        # ids must line up with rows: callers attach child rows by position
+        ids = conn.execute(insert(t).returning(t.c.id, sort_by_parameter_order=True), rows).scalars().all()
+        if model in _SYNC_KINDS: _sync_mark(db.session, model, ids)
+        _after_bulk_insert(conn, model, rows, ids)
+        db.session.commit()
+    return ids
+
+_END_OF_ROWS = object()
+
+def import_rows(kind, rows, dry_run=False):
+    model, convert = IMPORTERS[kind]
+    refs = _with_lock_retry(_RefMaps)
+    batch, errors = [], []
+    inserted = failed = 0
+    t0 = time.perf_counter()
+
+    def flush():
+        nonlocal inserted, failed
+        if not batch: return
+        if dry_run:
+            inserted += len(batch)
+        else:
+            try:
+                _insert_batch(model, batch); inserted += len(batch)
+            except Exception as e:
+                db.session.rollback(); failed += len(batch)
+                errors.append({'row': None, 'error': f'batch of {len(batch)} rows rejected: {e.__class__.__name__}: {e}'})
+        batch.clear()
+
+    rows, n = iter(rows), 0
+    while True:
+        try:
+            row = next(rows, _END_OF_ROWS)
+        except (ValueError, csv.Error) as e:
+            if not inserted or dry_run: raise   # nothing written yet: the whole file is rejected
+            errors.append({'row': n + 1, 'error': f'unreadable input, import stopped here: {e}'})
+            break
+        if row is _END_OF_ROWS: break
+        n += 1
+        try:
+            if isinstance(row, ValueError): raise row
+            if not isinstance(row, dict): raise TypeError(f'expected an object, got {type(row).__name__}')
+            batch.append(convert(row, refs))
+        except (ValueError, KeyError, TypeError) as e:
+            failed += 1
+            if len(errors) < app.config['IMPORT_MAX_ERRORS']: errors.append({'row': n, 'error': str(e)})
+            continue
+        if len(batch) >= app.config['IMPORT_BATCH']: flush()
+    flush()
+    secs = time.perf_counter() - t0
+    return {'kind': kind, 'inserted': inserted, 'failed': failed, 'dry_run': dry_run,
+            'seconds': round(secs, 3), 'rows_per_sec': round(inserted / secs, 1) if secs else None,
+            'errors': errors}
+
+# ------------- Payment batches / bank reconciliation -------------
+# Statement lines are matched to invoices first by Payment.reference: a reference or account
+# already on earlier payments of exactly one invoice (a client's standing M-Pesa account, say)
+# points at that invoice. Failing that, by an explicit invoice number, or an invoice number
+# appearing in the reference / narrative text. A line repeating the reference, amount and date
+# of a posted payment (or of an earlier line) is a duplicate. Matching uses two indexed IN
+# queries; the payments then go in as one executemany in one transaction.
+_NUMBER_TOKEN = re.compile(r'[A-Za-z0-9][A-Za-z0-9/_-]*[0-9]')
+
+def _line_tokens(row):
+    explicit = str(row.get('invoice') or row.get('invoice_number') or '').strip()
+    if explicit: return [explicit]
+    text_ = ' '.join(str(row.get(f) or '') for f in ('reference', 'account', 'narrative', 'description'))
+    return _NUMBER_TOKEN.findall(text_)
+
+def _invoice_index(tokens):
+    index = {}
+    tokens = sorted({t for t in tokens} | {t.upper() for t in tokens})
+    for i in range(0, len(tokens), 500):
+        for id, number, balance in db.session.execute(
+                select(Invoice.id, Invoice.number, Invoice.balance).where(Invoice.number.in_(tokens[i:i + 500]))):
+            key = number.lower()
+            index[key] = None if key in index else (id, number, _cents(balance))   # None: number not unique
+    return index
+
+def _line_refs(row):
+    return [v for v in (str(row.get(f) or '').strip() for f in ('reference', 'account')) if v]
+
+def _reference_index(refs):
+    # reference -> [(invoice id, number, balance, amount, date)] of the payments carrying it
+    refs, index = sorted(refs), {}
+    for i in range(0, len(refs), 500):
+        for ref, *hit in db.session.execute(
+                select(Payment.reference, Invoice.id, Invoice.number, Invoice.balance, Payment.amount, Payment.date)
+                .join(Invoice, Invoice.id == Payment.invoice_id).where(Payment.reference.in_(refs[i:i + 500]))):
+            index.setdefault(ref, []).append(hit)
+    return index
+
+def reconcile_payments(lines, dry_run=False):
+    # Matching and posting are one transaction retried as a whole on a lock error, so a retry
+    # re-reads the balances and known references it matched against
+    t0 = time.perf_counter()
+    lines = list(lines)
+    report, rows = _with_lock_retry(_reconcile_tx, lines, dry_run, t0)
+    if rows and not dry_run: _bulk_invalidate(Payment, rows)
+    return report
+
+def _reconcile_tx(lines, dry_run, t0):
+    tokens = [_line_tokens(row) for row in lines]
+    index = _invoice_index([t for ts in tokens for t in ts])
+    known = _reference_index({r for row in lines for r in _line_refs(row)})
+    balances = {v[0]: v[2] for v in index.values() if v}
+    balances.update({h[0]: _cents(h[2]) for hits in known.values() for h in hits})
+    report, rows, seen = [], [], set()
+    for n, (row, toks) in enumerate(zip(lines, tokens), start=1):
+        ref = str(row.get('reference') or '').strip() or None
+        out = {'line': n, 'reference': ref, 'amount': row.get('amount'), 'invoice': None}
+        try:
+            amount = _money(row, 'amount', positive=True)
+            pay_date = _opt_date(row, 'date', date.today())
+        except ValueError as e:
+            report.append({**out, 'status': 'invalid', 'message': str(e)}); continue
+        if ref and ((ref, amount, pay_date) in seen or
+                    any(_cents(a) == amount and d == pay_date for *_, a, d in known.get(ref, ()))):
+            report.append({**out, 'status': 'duplicate', 'message': 'reference already posted'}); continue
+        hits = {(h[0], h[1]) for r in _line_refs(row) for h in known.get(r, ())}
+        if len(hits) != 1:   # no single invoice by reference: fall back to invoice numbers
+            hits = {index[t.lower()] for t in toks if t.lower() in index}
+            if None in hits or len(hits) > 1:
+                report.append({**out, 'status': 'ambiguous', 'message': 'matches more than one invoice'}); continue
+            if not hits:
+                report.append({**out, 'status': 'unmatched', 'message': 'no invoice number or known reference found'}); continue
+        inv_id, number = hits.pop()[:2]
+        balances[inv_id] -= amount
+        if ref: seen.add((ref, amount, pay_date))
+        rows.append({'invoice_id': inv_id, 'amount': amount, 'date': pay_date, 'method': row.get('method') or None,
+                     'reference': ref, 'note': row.get('note') or row.get('narrative') or None})
+        report.append({**out, 'amount': str(amount), 'invoice': number, 'status': 'matched',
+                       'balance_after': str(balances[inv_id]),
+                       'message': 'overpaid' if balances[inv_id] < 0 else ''})
+    closed = []
+    if rows and not dry_run:
+        _insert_batch_tx(Payment, rows)
+        closed = [r['invoice'] for r in report if r['status'] == 'matched' and Decimal(r['balance_after']) <= 0]
+    counts = {s: sum(1 for r in report if r['status'] == s) for s in ('matched', 'duplicate', 'ambiguous', 'unmatched', 'invalid')}
+    return {'posted': 0 if dry_run else len(rows), 'dry_run': dry_run, **counts,
+            'closed_invoices': sorted(set(closed)), 'seconds': round(time.perf_counter() - t0, 3),
+            'lines': report}, rows
+
+# ------------- Synthetic data -------------
+# Production-shaped volumes for benchmarking: per client 1-5 cases, per case 0-6 hearings and
+# 0-3 invoices, per invoice 0-4 payments. Written client-chunk by client-chunk through
+# _insert_batch, so ledger, search, calendar and report data stay consistent.
+_FIRST = ('Wanjiku Njeri Achieng Otieno Kamau Mwangi Chebet Kiprop Atieno Mutua Akinyi Omondi Wairimu '
+          'Kariuki Nyambura Barasa Jepkosgei Onyango Wafula Moraa Kilonzo Adhiambo Kimani Nekesa').split()
+_LAST = ('Wanjiku Otieno Kamau Mwangi Kiprop Mutua Omondi Kariuki Barasa Onyango Wafula Kilonzo Kimani '
+         'Ochieng Njoroge Maina Rotich Koech Owino Gitau Ndungu Mbugua Chege Waweru').split()
+_FIRMS = ('Holdings Ltd', 'Enterprises', 'Traders', 'Logistics Ltd', 'Farmers Co-op', 'Properties Ltd')
+_MATTERS = ('Contract Dispute', 'Land Dispute', 'Employment Claim', 'Succession Cause', 'Debt Recovery',
+            'Judicial Review', 'Defamation Suit', 'Lease Arbitration', 'Insurance Claim', 'Tax Appeal')
+_NOTES = ('Mention', 'Hearing of the application', 'Directions', 'Ruling', 'Judgment', 'Pre-trial conference',
+          'Adjourned by consent', 'Further mention', 'Submissions to be filed', 'Witness absent; adjourned')
+_METHODS = ('M-Pesa', 'Bank', 'Cheque', 'Cash')
+_ADVOCATES = ('J. Njoroge', 'A. Odhiambo', 'M. Chebet', 'P. Kariuki', 'L. Wafula', None)
+
+def generate_data(n_clients, seed=0, chunk=500):
+    rnd = random.Random(seed)
+    today = date.today()
+    types = [t.id for t in lookup_cache.case_types()]
+    open_ids = lookup_cache.status_ids('Pending', 'Open')
+    closed_id = lookup_cache.status_id('Closed') or open_ids[0]
+    tag = f'G{seed}'
+    counts = dict.fromkeys(('clients', 'cases', 'hearings', 'invoices', 'payments'), 0)
+    day = lambda lo, hi: today + timedelta(days=rnd.randint(lo, hi))
+    for start in range(0, n_clients, chunk):
+        clients = []
+        for i in range(start, min(start + chunk, n_clients)):
+            first, last = rnd.choice(_FIRST), rnd.choice(_LAST)
+            name = f'{first} {last}' if rnd.random() < 0.7 else f'{last} {rnd.choice(_FIRMS)}'
+            clients.append({'name': name, 'phone': f'+2547{rnd.randrange(10**8):08d}',
+                            'email': f'{first.lower()}.{last.lower()}{i}@example.com', 'address': 'Nairobi'})
+        client_ids = _insert_batch(Client, clients)
+
+        cases = []
+        for cid in client_ids:
+            for _ in range(rnd.randint(1, 5)):
+                n = counts['cases'] + len(cases) + 1
+                cases.append({'ref': f'{tag}/HCC/{n}/{today.year - rnd.randint(0, 3)}', 'title': rnd.choice(_MATTERS),
+                              'client_id': cid, 'case_type_id': rnd.choice(types), 'advocate': rnd.choice(_ADVOCATES),
+                              'status_id': closed_id if rnd.random() < 0.2 else rnd.choice(open_ids),
+                              'opened_on': day(-1100, 0)})
+        case_ids = _insert_batch(Case, cases)
+
+        hearings, invoices = [], []
+        for cid, c in zip(case_ids, cases):
+            for _ in range(rnd.randint(0, 6)):
+                hearings.append({'case_id': cid, 'date': day(-365, 120), 'status_id': rnd.choice(open_ids),
+                                 'notes': rnd.choice(_NOTES)})
+            for _ in range(rnd.randint(0, 3)):
+                n = counts['invoices'] + len(invoices) + 1
+                amount = Decimal(rnd.randrange(5, 500) * 1000)
+                invoices.append({'number': f'INV-{tag}-{n:07d}', 'client_id': c['client_id'], 'case_id': cid,
+                                 'status_id': rnd.choice(open_ids), 'amount': amount, 'due_date': day(-400, 60),
+                                 'paid_total': Decimal('0'), 'balance': amount, 'payment_count': 0,
+                                 'payments_version': 0, 'updated_at': _utcnow()})
+        if hearings: _insert_batch(Hearing, hearings)
+        invoice_ids = _insert_batch(Invoice, invoices) if invoices else []
+
+        payments = []
+        for iid, inv in zip(invoice_ids, invoices):
+            left = inv['amount']
+            for _ in range(rnd.randint(0, 4)):
+                amt = min(left, Decimal(rnd.randrange(1, 200) * 500))
+                if amt <= 0: break
+                left -= amt
+                payments.append({'invoice_id': iid, 'amount': amt, 'method': rnd.choice(_METHODS),
+                                 'reference': f'{rnd.choice("QRST")}{rnd.randrange(36 ** 9):09X}',
+                                 'date': min(today, inv['due_date'] + timedelta(days=rnd.randint(-60, 90)))})
+        for i in range(0, len(payments), app.config['IMPORT_BATCH']):
+            _insert_batch(Payment, payments[i:i + app.config['IMPORT_BATCH']])
+
+        for k, rows in (('clients', clients), ('cases', cases), ('hearings', hearings),
+                        ('invoices', invoices), ('payments', payments)):
+            counts[k] += len(rows)
+    return counts
+
+# ------------- Background jobs -------------
+# Jobs live in the job table; `flask worker` runs them on a thread pool. A worker claims the
+# best ready job with one UPDATE (SKIP LOCKED on Postgres, BEGIN IMMEDIATE on SQLite), retries
+# failures with backoff and enqueues PERIODIC_JOBS when their app_meta due time passes.
+app.config['JOB_OUTPUT_DIR'] = os.getenv('JOB_OUTPUT_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'data', 'jobs')
+app.config['JOB_POLL_SECONDS'] = float(os.getenv('JOB_POLL_SECONDS') or 2)
+app.config['JOB_LOCK_TIMEOUT'] = int(os.getenv('JOB_LOCK_TIMEOUT') or 1800)
+app.config['JOB_RETENTION_DAYS'] = int(os.getenv('JOB_RETENTION_DAYS') or 7)
+app.config['REMINDER_DAYS'] = int(os.getenv('REMINDER_DAYS') or 2)
+
+JOB_HANDLERS = {}
+PERIODIC_JOBS = {'refresh_next_hearings': 86400, 'hearing_reminders': 86400, 'purge_jobs': 86400,
+                 'purge_tombstones': 86400}
+USER_JOBS = ('invoice_pdfs_zip', 'export_table', 'hearing_reminders')   # may be queued from the UI
+
+def job_handler(kind):
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+def enqueue(kind, payload=None, priority=0, run_at=None, max_attempts=3):
+    if kind not in JOB_HANDLERS: raise ValueError(f'unknown job kind {kind!r}')
+    job = Job(kind=kind, payload=json.dumps(payload or {}), priority=priority,
+              run_at=run_at or _utcnow(), max_attempts=max_attempts)
+    db.session.add(job); db.session.commit()
+    return job
+
+def _job_file(job_id, ext):
+    os.makedirs(app.config['JOB_OUTPUT_DIR'], exist_ok=True)
+    return os.path.join(app.config['JOB_OUTPUT_DIR'], f'job-{job_id}.{ext}')
+
+def _write_chunks(path, chunks):
+    size = 0
+    with open(path + '.part', 'wb') as fh:
+        for chunk in chunks:
+            if isinstance(chunk, str): chunk = chunk.encode()
+            fh.write(chunk); size += len(chunk)
+    os.replace(path + '.part', path)
+    return size
+
+@job_handler('invoice_pdfs_zip')
+def _job_invoice_pdfs_zip(job, args):
+    path = _job_file(job.id, 'zip')
+    return {'file': path, 'name': f'invoices-{date.today():%Y%m%d}.zip', 'bytes': _write_chunks(path, _export_invoice_pdfs_zip(args))}
+
+@job_handler('export_table')
+def _job_export_table(job, payload):
+    kind, fmt = payload['kind'], payload.get('fmt', 'csv')
+    if kind not in EXPORTS or fmt not in ('csv', 'xlsx'): raise ValueError(f'bad export {kind}.{fmt}')
+    stmt, header = EXPORTS[kind](payload.get('args') or {})
+    body = _export_csv(stmt, header) if fmt == 'csv' else _export_xlsx(stmt, header, kind.title())
+    path = _job_file(job.id, fmt)
+    return {'file': path, 'name': f'{kind}-{date.today().isoformat()}.{fmt}', 'bytes': _write_chunks(path, body)}
+
+@job_handler('hearing_reminders')
+def _job_hearing_reminders(job, payload):
+    # No mail/SMS transport here: produce the contact sheet for hearings in the next REMINDER_DAYS
+    start = date.today()
+    end = start + timedelta(days=int(payload.get('days') or app.config['REMINDER_DAYS']))
+    stmt = (select(Hearing.date, Case.ref, Case.title, Case.advocate, Client.name, Client.phone, Client.email, Hearing.notes)
+            .join(Case, Case.id == Hearing.case_id).join(Client, Client.id == Case.client_id)
+            .where(Hearing.date >= start, Hearing.date <= end).order_by(Hearing.date, Case.advocate, Case.ref))
+    path = _job_file(job.id, 'csv')
+    _write_chunks(path, _export_csv(stmt, ['Date', 'Case', 'Title', 'Advocate', 'Client', 'Phone', 'Email', 'Notes']))
+    n = db.session.execute(select(func.count()).select_from(Hearing).where(Hearing.date >= start, Hearing.date <= end)).scalar()
+    app.logger.info('Hearing reminders: %d hearings between %s and %s', n, start, end)
+    return {'file': path, 'name': f'reminders-{start.isoformat()}.csv', 'hearings': n}
+
+@job_handler('refresh_next_hearings')
+def _job_refresh_next_hearings(job, payload):
+    with write_intent():
+        n = _next_hearing_refresh(db.session.connection(), stale_only=True).rowcount
+        db.session.commit()
+    return {'cases': n}
+
+@job_handler('purge_jobs')
+def _job_purge(job, payload):
+    cutoff = _utcnow() - timedelta(days=app.config['JOB_RETENTION_DAYS'])
+    old = Job.query.filter(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff).all()
+    for j in old:
+        path = json.loads(j.result or '{}').get('file')
+        if path and os.path.exists(path): os.remove(path)
+        db.session.delete(j)
+    db.session.commit()
+    return {'purged': len(old)}
+
+@job_handler('purge_tombstones')
+def _job_purge_tombstones(job, payload):
+    # Clients whose cursors predate the newest purged tombstone are told to re-sync from scratch
+    tomb, meta = SyncTombstone.__table__, AppMeta.__table__
+    cutoff = _utcnow() - timedelta(days=app.config['SYNC_TOMBSTONE_DAYS'])
+    with write_intent():
+        conn = db.session.connection()
+        top = conn.execute(select(func.max(tomb.c.row_version)).where(tomb.c.deleted_at < cutoff)).scalar()
+        if top is None: return {'purged': 0}
+        n = conn.execute(delete(tomb).where(tomb.c.row_version <= top)).rowcount
+        conn.execute(delete(meta).where(meta.c.key == 'sync_floor'))
+        conn.execute(insert(meta).values(key='sync_floor', value=top + 1))
+        db.session.commit()
+    return {'purged': n}
+
+def _claim_job(worker):
+    now = _utcnow()
+    j = Job.__table__
+    pick = (select(j.c.id).where(j.c.status == 'queued', j.c.run_at <= now)
+            .order_by(j.c.priority.desc(), j.c.run_at, j.c.id).limit(1)
+            .with_for_update(skip_locked=True).scalar_subquery())
+    with write_intent(), db.engine.begin() as conn:
+        return conn.execute(update(j).where(j.c.id == pick, j.c.status == 'queued')
+                            .values(status='running', locked_by=worker, locked_at=now, attempts=j.c.attempts + 1)
+                            .returning(j.c.id)).scalar()
+
+def _finish_job(job_id, **values):
+    j = Job.__table__
+    def write():
+        with write_intent(), db.engine.begin() as conn:
+            conn.execute(update(j).where(j.c.id == job_id).values(locked_by=None, locked_at=None, **values))
+    _with_lock_retry(write)
+
+def _run_job(job_id):
+    job = db.session.get(Job, job_id)
+    kind, attempts, max_attempts = job.kind, job.attempts, job.max_attempts
+    handler = JOB_HANDLERS.get(kind)
+    try:
+        if handler is None: raise LookupError(f'no handler for job kind {kind!r}')
+        result = handler(job, json.loads(job.payload or '{}'))
+    except Exception as e:
+        db.session.rollback()
+        app.logger.exception('Job %s (%s) failed on attempt %s', job_id, kind, attempts)
+        if attempts < max_attempts and handler is not None:
+            status, when = 'queued', {'run_at': _utcnow() + timedelta(seconds=30 * 2 ** (attempts - 1))}
+        else:
+            status, when = 'failed', {'finished_at': _utcnow()}
+        _finish_job(job_id, status=status, error=f'{e.__class__.__name__}: {e}', **when)
+    else:
+        db.session.commit()   # end the handler's transaction before the status write
+        status = 'done'
+        _finish_job(job_id, status=status, result=json.dumps(result or {}, default=str), error=None,
+                    finished_at=_utcnow())
+    return status
+
+def _insert_if_absent(conn, t, **values):
+    # 1 if the row went in, 0 if its key was already there (e.g. another worker won the race)
+    if conn.dialect.name in ('sqlite', 'postgresql'):
+        from sqlalchemy.dialects import postgresql, sqlite
+        dialect_insert = postgresql.insert if conn.dialect.name == 'postgresql' else sqlite.insert
+        return conn.execute(dialect_insert(t).values(**values).on_conflict_do_nothing()).rowcount
+    try:
+        with conn.begin_nested(): conn.execute(insert(t).values(**values))
+        return 1
+    except IntegrityError:
+        return 0
+
+def _schedule_periodic():
+    # app_meta 'job:<kind>' holds the next due time (epoch seconds); the worker whose UPDATE
+    # moves it forward, or whose INSERT creates it, is the one that enqueues, so several
+    # workers never double-schedule
+    now = int(time.time())
+    meta = AppMeta.__table__
+    for kind, every in PERIODIC_JOBS.items():
+        key = f'job:{kind}'
+        with write_intent(), db.engine.begin() as conn:
+            won = conn.execute(update(meta).where(meta.c.key == key, meta.c.value <= now)
+                               .values(value=now + every)).rowcount
+            if not won: won = _insert_if_absent(conn, meta, key=key, value=now + every)
+        if won: enqueue(kind)
+
+def _release_stale_jobs():
+    j = Job.__table__
+    cutoff = _utcnow() - timedelta(seconds=app.config['JOB_LOCK_TIMEOUT'])
+    with write_intent(), db.engine.begin() as conn:
+        return conn.execute(update(j).where(j.c.status == 'running', j.c.locked_at < cutoff)
+                            .values(status='queued', locked_by=None, locked_at=None)).rowcount
+
+def _worker_loop(name, stop, burst):
+    while not stop.is_set():
+        job_id = None
+        try:
+            with app.app_context():
+                job_id = _with_lock_retry(_claim_job, name)
+                if job_id: _run_job(job_id)
+        except Exception:
+            app.logger.exception('Worker %s: job loop error', name)
+        if not job_id:
+            if burst: return
+            stop.wait(app.config['JOB_POLL_SECONDS'])
+
+def job_status(job):
+    out = {'id': job.id, 'kind': job.kind, 'status': job.status, 'attempts': job.attempts,
+           'error': job.error, 'created_at': job.created_at, 'finished_at': job.finished_at}
+    result = json.loads(job.result or '{}')
+    out['result'] = {k: v for k, v in result.items() if k != 'file'}
+    if result.get('file'): out['download_url'] = url_for('job_download', id=job.id)
+    return out
 
 # ------------- Routes -------------
 @app.route('/')
 @login_required
 def dashboard():
-    recent = Case.query.order_by(Case.id.desc()).limit(5).all()
-    return render_template('dashboard.html', active='dashboard', metrics=_metrics(), recent_cases=recent)
+    return render_template('dashboard.html', active='dashboard', metrics=_metrics(), recent_cases=_recent_cases)
+
+def _recent_cases():
+    # called from dashboard.html only when its cached fragment is missing
+    return Case.query.options(*_case_opts()).order_by(Case.id.desc()).limit(5).all()
 
 # Clients
 @app.route('/clients')
 @login_required
 def clients():
-    rows = Client.query.order_by(Client.name.asc()).all()
-    return render_template('clients.html', active='clients', rows=rows, edit=None)
+    page = _clients_page()
+    return render_template('clients.html', active='clients', rows=page.rows, page=page, edit=None)
 
 @app.route('/clients/new', methods=['POST'])
 @login_required
@@ -230,9 +2497,9 @@ def clients_create():
 @app.route('/clients/<int:id>/edit')
 @login_required
 def clients_edit(id):
-    rows = Client.query.order_by(Client.name.asc()).all()
     edit = Client.query.get_or_404(id)
-    return render_template('clients.html', active='clients', rows=rows, edit=edit)
+    page = _clients_page()
+    return render_template('clients.html', active='clients', rows=page.rows, page=page, edit=edit)
 
 @app.route('/clients/<int:id>/update', methods=['POST'])
 @login_required
@@ -248,13 +2515,33 @@ def clients_delete(id):
     r = Client.query.get_or_404(id); db.session.delete(r)
     db.session.commit(); flash('Client deleted'); return redirect(url_for('clients'))
 
+# Typeahead JSON
+@app.get('/api/clients')
+@login_required
+def api_clients():
+    q, limit = _typeahead_args()
+    query = Client.query
+    if q: query = query.filter(_prefix_match(func.lower(Client.name), q))
+    rows = query.order_by(func.lower(Client.name), Client.id).limit(limit).all()
+    return jsonify([{'id': r.id, 'label': _client_label(r)} for r in rows])
+
+@app.get('/api/cases')
+@login_required
+def api_cases():
+    q, limit = _typeahead_args()
+    query = Case.query
+    if _arg_int('client_id'): query = query.filter(Case.client_id == _arg_int('client_id'))
+    if q: query = query.filter(or_(_prefix_match(func.lower(Case.ref), q),
+                                   _prefix_match(func.lower(Case.title), q)))
+    rows = query.order_by(Case.id.desc()).limit(limit).all()
+    return jsonify([{'id': r.id, 'label': _case_label(r)} for r in rows])
+
 # Lookups
 @app.route('/lookups')
 @login_required
 def lookups():
     return render_template('lookups.html', active='lookups',
-        case_types=CaseType.query.order_by(CaseType.name).all(),
-        case_status=CaseStatus.query.order_by(CaseStatus.name).all(),
+        case_types=lookup_cache.case_types(), case_status=lookup_cache.statuses(),
         edit=None, edit_entity=None)
 
 @app.route('/lookups/case-types/new', methods=['POST'])
@@ -267,8 +2554,7 @@ def case_types_create():
 @login_required
 def case_types_edit(id):
     return render_template('lookups.html', active='lookups',
-        case_types=CaseType.query.order_by(CaseType.name).all(),
-        case_status=CaseStatus.query.order_by(CaseStatus.name).all(),
+        case_types=lookup_cache.case_types(), case_status=lookup_cache.statuses(),
         edit=CaseType.query.get_or_404(id), edit_entity='type')
 
 @app.route('/lookups/case-types/<int:id>/update', methods=['POST'])
@@ -293,8 +2579,7 @@ def case_status_create():
 @login_required
 def case_status_edit(id):
     return render_template('lookups.html', active='lookups',
-        case_types=CaseType.query.order_by(CaseType.name).all(),
-        case_status=CaseStatus.query.order_by(CaseStatus.name).all(),
+        case_types=lookup_cache.case_types(), case_status=lookup_cache.statuses(),
         edit=CaseStatus.query.get_or_404(id), edit_entity='status')
 
 @app.route('/lookups/case-status/<int:id>/update', methods=['POST'])
@@ -313,41 +2598,45 @@ def case_status_delete(id):
 @app.route('/cases')
 @login_required
 def cases():
-    rows = Case.query.order_by(Case.id.desc()).all()
-    return render_template('cases.html', active='cases', rows=rows,
-        clients=Client.query.order_by(Client.name).all(),
-        types=CaseType.query.order_by(CaseType.name).all(),
-        status=CaseStatus.query.order_by(CaseStatus.name).all(),
+    page = _cases_page()
+    return render_template('cases.html', active='cases', rows=page.rows, page=page,
+        types=lookup_cache.case_types(), status=lookup_cache.statuses(),
         edit=None)
 
 @app.route('/cases/new', methods=['POST'])
 @login_required
 def cases_create():
+    try: client_id = _form_id(Client, 'client_id', 'client')
+    except ValueError as e:
+        flash(str(e), 'error'); return redirect(url_for('cases'))
     r = Case(ref=request.form['ref'], title=request.form['title'],
-             client_id=int(request.form['client_id']),
+             client_id=client_id,
              case_type_id=int(request.form['case_type_id']),
-             status_id=int(request.form['status_id']))
+             status_id=int(request.form['status_id']),
+             advocate=request.form.get('advocate') or None)
     db.session.add(r); db.session.commit(); flash('Case created')
     return redirect(url_for('cases'))
 
 @app.route('/cases/<int:id>/edit')
 @login_required
 def cases_edit(id):
-    rows = Case.query.order_by(Case.id.desc()).all()
-    return render_template('cases.html', active='cases', rows=rows,
-        clients=Client.query.order_by(Client.name).all(),
-        types=CaseType.query.order_by(CaseType.name).all(),
-        status=CaseStatus.query.order_by(CaseStatus.name).all(),
+    page = _cases_page()
+    return render_template('cases.html', active='cases', rows=page.rows, page=page,
+        types=lookup_cache.case_types(), status=lookup_cache.statuses(),
         edit=Case.query.get_or_404(id))
 
 @app.route('/cases/<int:id>/update', methods=['POST'])
 @login_required
 def cases_update(id):
     r = Case.query.get_or_404(id)
+    try: client_id = _form_id(Client, 'client_id', 'client')
+    except ValueError as e:
+        flash(str(e), 'error'); return redirect(url_for('cases_edit', id=id))
     r.ref = request.form['ref']; r.title = request.form['title']
-    r.client_id = int(request.form['client_id'])
+    r.client_id = client_id
     r.case_type_id = int(request.form['case_type_id'])
     r.status_id = int(request.form['status_id'])
+    r.advocate = request.form.get('advocate') or None
     db.session.commit(); flash('Case updated'); return redirect(url_for('cases'))
 
 @app.route('/cases/<int:id>/delete', methods=['POST'])
@@ -360,17 +2649,19 @@ def cases_delete(id):
 @app.route('/hearings')
 @login_required
 def hearings():
-    rows = Hearing.query.order_by(Hearing.date.desc()).all()
-    return render_template('hearings.html', active='hearings', rows=rows,
-        cases=Case.query.order_by(Case.id.desc()).all(),
-        status=CaseStatus.query.order_by(CaseStatus.name).all(),
+    page = _hearings_page()
+    return render_template('hearings.html', active='hearings', rows=page.rows, page=page,
+        status=lookup_cache.statuses(),
         edit=None)
 
 @app.route('/hearings/new', methods=['POST'])
 @login_required
 def hearings_create():
+    try: case_id = _form_id(Case, 'case_id', 'case')
+    except ValueError as e:
+        flash(str(e), 'error'); return redirect(url_for('hearings'))
     r = Hearing(
-        case_id=int(request.form['case_id']),
+        case_id=case_id,
         date=datetime.strptime(request.form['date'], '%Y-%m-%d').date(),
         status_id=int(request.form['status_id']),
         notes=request.form.get('notes')
@@ -381,17 +2672,19 @@ def hearings_create():
 @app.route('/hearings/<int:id>/edit')
 @login_required
 def hearings_edit(id):
-    rows = Hearing.query.order_by(Hearing.date.desc()).all()
-    return render_template('hearings.html', active='hearings', rows=rows,
-        cases=Case.query.order_by(Case.id.desc()).all(),
-        status=CaseStatus.query.order_by(CaseStatus.name).all(),
+    page = _hearings_page()
+    return render_template('hearings.html', active='hearings', rows=page.rows, page=page,
+        status=lookup_cache.statuses(),
         edit=Hearing.query.get_or_404(id))
 
 @app.route('/hearings/<int:id>/update', methods=['POST'])
 @login_required
 def hearings_update(id):
     r = Hearing.query.get_or_404(id)
-    r.case_id = int(request.form['case_id'])
+    try: case_id = _form_id(Case, 'case_id', 'case')
+    except ValueError as e:
+        flash(str(e), 'error'); return redirect(url_for('hearings_edit', id=id))
+    r.case_id = case_id
     r.date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
     r.status_id = int(request.form['status_id'])
     r.notes = request.form.get('notes')
@@ -408,20 +2701,21 @@ def hearings_delete(id):
 @app.route('/invoices')
 @login_required
 def invoices():
-    rows = Invoice.query.order_by(Invoice.id.desc()).all()
-    return render_template('invoices.html', active='invoices', rows=rows,
-        clients=Client.query.order_by(Client.name).all(),
-        cases=Case.query.order_by(Case.id.desc()).all(),
-        status=CaseStatus.query.order_by(CaseStatus.name).all(),
+    page = _invoices_page()
+    return render_template('invoices.html', active='invoices', rows=page.rows, page=page,
+        status=lookup_cache.statuses(),
         edit=None, payments=None, paid=None, balance=None)
 
 @app.route('/invoices/new', methods=['POST'])
 @login_required
 def invoices_create():
+    try: client_id, case_id = _form_id(Client, 'client_id', 'client'), _form_id(Case, 'case_id', 'case')
+    except ValueError as e:
+        flash(str(e), 'error'); return redirect(url_for('invoices'))
     r = Invoice(
         number=request.form['number'],
-        client_id=int(request.form['client_id']),
-        case_id=int(request.form['case_id']),
+        client_id=client_id,
+        case_id=case_id,
         status_id=int(request.form['status_id']),
         amount=Decimal(request.form.get('amount') or 0),
         due_date=datetime.strptime(request.form['due_date'], '%Y-%m-%d').date()
@@ -433,23 +2727,24 @@ def invoices_create():
 @app.route('/invoices/<int:id>/edit')
 @login_required
 def invoices_edit(id):
-    rows = Invoice.query.order_by(Invoice.id.desc()).all()
     edit = Invoice.query.get_or_404(id)
     pays = edit.payments.order_by(Payment.date.asc(), Payment.id.asc()).all()
     paid, balance = _invoice_paid_balance(edit)
-    return render_template('invoices.html', active='invoices', rows=rows,
-        clients=Client.query.order_by(Client.name).all(),
-        cases=Case.query.order_by(Case.id.desc()).all(),
-        status=CaseStatus.query.order_by(CaseStatus.name).all(),
+    page = _invoices_page()
+    return render_template('invoices.html', active='invoices', rows=page.rows, page=page,
+        status=lookup_cache.statuses(),
         edit=edit, payments=pays, paid=paid, balance=balance)
 
 @app.route('/invoices/<int:id>/update', methods=['POST'])
 @login_required
 def invoices_update(id):
     r = Invoice.query.get_or_404(id)
+    try: client_id, case_id = _form_id(Client, 'client_id', 'client'), _form_id(Case, 'case_id', 'case')
+    except ValueError as e:
+        flash(str(e), 'error'); return redirect(url_for('invoices_edit', id=id))
     r.number = request.form['number']
-    r.client_id = int(request.form['client_id'])
-    r.case_id = int(request.form['case_id'])
+    r.client_id = client_id
+    r.case_id = case_id
     r.status_id = int(request.form['status_id'])
     r.amount = Decimal(request.form.get('amount') or 0)
     r.due_date = datetime.strptime(request.form['due_date'], '%Y-%m-%d').date() \
@@ -463,61 +2758,226 @@ def invoices_delete(id):
     r = Invoice.query.get_or_404(id); db.session.delete(r)
     db.session.commit(); flash('Invoice deleted'); return redirect(url_for('invoices'))
 
+# Bulk import (multipart 'file' field, or the raw CSV / JSON body)
+@app.post('/import/<kind>')
+@login_required
+def import_data(kind):
+    if kind not in IMPORTERS: return jsonify({'error': f'unknown import kind {kind!r}'}), 404
+    upload = request.files.get('file')
+    if upload:
+        fmt = _import_format(upload.filename, upload.mimetype)
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig')
+    else:
+        fmt = _import_format('', request.mimetype)
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig')
+    try:
+        report = import_rows(kind, _read_rows(stream, fmt), dry_run=_truthy(request.args.get('dry_run', '0')))
+    except (ValueError, csv.Error) as e:
+        return jsonify({'error': f'unreadable {fmt}: {e}'}), 400
+    return jsonify(report), (200 if not report['failed'] else 207)
+
+# Cause list: ?view=day|week|advocate&date=YYYY-MM-DD&advocate=
+@app.get('/causelist')
+@login_required
+def causelist():
+    view = request.args.get('view') if request.args.get('view') in ('day', 'week', 'advocate') else 'day'
+    day = _arg_date('date') or date.today()
+    start, end = _cause_range(view, day)
+    items = _cause_items(start, end)
+    advocates = sorted({i.advocate for i in items if i.advocate})
+    advocate = request.args.get('advocate', '')
+    if advocate: items = [i for i in items if (i.advocate or '') == advocate]
+    if view == 'advocate':
+        items = sorted(items, key=lambda i: (i.advocate or '\uffff', i.date, i.ref))
+        groups = [(k or 'Unassigned', list(g)) for k, g in itertools.groupby(items, key=lambda i: i.advocate)]
+    else:
+        groups = [(k.strftime('%A %d %B %Y'), list(g)) for k, g in itertools.groupby(items, key=lambda i: i.date)]
+    step = timedelta(days=1 if view == 'day' else 7)
+    return render_template('causelist.html', active='causelist', view=view, day=day, start=start, end=end,
+                           groups=groups, advocates=advocates, advocate=advocate,
+                           prev_day=day - step, next_day=day + step, firm_feed=feed_url('firm'))
+
+# iCal feeds (firm-wide or per client); authorised by the signed token in the URL
+@app.get('/calendar/<token>.ics')
+def calendar_feed(token):
+    try: scope = _feed_signer().loads(token)
+    except BadSignature: abort(404)
+    # The body also depends on today (the ICAL_PAST_DAYS window) and on the status names
+    etag = hashlib.sha1(f'{scope}:{_calendar_version()}:{lookup_cache.current_version()}:'
+                        f'{date.today()}:{_ICAL_REV}'.encode()).hexdigest()
+    resp = _not_modified(etag, None)
+    if resp: return resp
+    key = f'ical:{scope}'
+    hit = cache.get(key)
+    if hit and hit[0] == etag: body = hit[1]
+    else:
+        body = _render_ical(scope)
+        cache.set(key, (etag, body))
+    return _with_validators(Response(body, mimetype='text/calendar'), etag, None)
+
+# Reports: ageing by client, collections by month and by method (HTML, or ?format=json)
+@app.get('/reports')
+@login_required
+def reports():
+    today = date.today()
+    last = request.args.get('to') if re.fullmatch(r'\d{4}-\d{2}', request.args.get('to', '')) else _period(today)
+    first = request.args.get('from') if re.fullmatch(r'\d{4}-\d{2}', request.args.get('from', '')) \
+        else _period(date(today.year - 1, today.month, 1) + timedelta(days=31))
+    ageing, ageing_totals = aged_receivables(today)
+    by_month, by_method = collections(first, last)
+    if request.args.get('format') == 'json':
+        return jsonify(ageing=ageing, ageing_totals=ageing_totals, by_month=by_month, by_method=by_method,
+                       period={'from': first, 'to': last})
+    return render_template('reports.html', active='reports', today=today, buckets=AGE_BUCKETS,
+                           ageing=ageing, ageing_totals=ageing_totals, by_month=by_month, by_method=by_method,
+                           first=first, last=last,
+                           month_total=sum((m['total'] for m in by_month), Decimal('0.00')))
+
+# Prometheus scrape target: METRICS_TOKEN as a bearer token, otherwise a logged-in session
+@app.get('/metrics')
+def prometheus_metrics():
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if request.headers.get('Authorization', '') != f'Bearer {token}': abort(401)
+    elif app.config['REQUIRE_LOGIN'] and not session.get('user'):
+        abort(401)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Payment batch / bank statement: JSON array or {"lines": [...]}, CSV, or a multipart 'file'
+@app.post('/payments/batch')
+@login_required
+def payments_batch():
+    dry_run = _truthy(request.args.get('dry_run', '0'))
+    try:
+        if request.is_json:
+            body = request.get_json()
+            lines = body.get('lines', []) if isinstance(body, dict) else body
+        else:
+            upload = request.files.get('file')
+            src = upload or request
+            fmt = _import_format(upload.filename if upload else '', src.mimetype)
+            lines = list(_read_rows(io.TextIOWrapper(src.stream, encoding='utf-8-sig'), fmt))
+        if not isinstance(lines, list) or not all(isinstance(r, dict) for r in lines):
+            raise ValueError('expected a list of line objects, or {"lines": [...]}')
+        report = reconcile_payments(lines, dry_run=dry_run)
+    except (ValueError, csv.Error) as e:
+        return jsonify({'error': f'unreadable statement: {e}'}), 400
+    return jsonify(report)
+
+# Delta sync for offline clients: pass back the returned cursor until "more" is false
+@app.get('/sync')
+@login_required
+def sync_feed():
+    kinds = [k for k in request.args.get('kinds', '').split(',') if k]
+    if any(k not in SYNC_MODELS for k in kinds):
+        return jsonify({'error': f'kinds must be among {", ".join(SYNC_MODELS)}'}), 400
+    try:
+        return jsonify(sync_changes(request.args.get('since', ''), request.args.get('limit', type=int), kinds))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+# Background jobs: queue one from the UI, poll its status, fetch its file
+@app.post('/jobs/<kind>')
+@login_required
+def job_create(kind):
+    if kind not in USER_JOBS: abort(404)
+    args = request.args.to_dict()
+    payload = {'export_table': lambda: {'kind': args.pop('kind', ''), 'fmt': args.pop('fmt', 'csv'), 'args': args},
+               'hearing_reminders': lambda: {'days': _arg_int('days')}}.get(kind, lambda: args)()
+    job = enqueue(kind, payload, priority=10)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job_status(job)), 202, {'Location': url_for('job_view', id=job.id)}
+    return redirect(url_for('job_view', id=job.id))
+
+@app.get('/jobs/<int:id>')
+@login_required
+def job_view(id):
+    job = Job.query.get_or_404(id)
+    if request.args.get('format') == 'json': return jsonify(job_status(job))
+    return render_template('job.html', job=job, info=job_status(job))
+
+@app.get('/jobs/<int:id>/download')
+@login_required
+def job_download(id):
+    job = Job.query.get_or_404(id)
+    result = json.loads(job.result or '{}')
+    if job.status != 'done' or not result.get('file') or not os.path.exists(result['file']): abort(404)
+    return send_file(result['file'], as_attachment=True, download_name=result.get('name'))
+
+# Global search (HTML, or ?format=json)
+@app.get('/search')
+@login_required
+def search():
+    q = request.args.get('q', '').strip()
+    hits = search_all(q)
+    if request.args.get('format') == 'json': return jsonify([h._asdict() for h in hits])
+    return render_template('search.html', active='search', q=q, hits=hits)
+
+# CSV / XLSX export of invoices, payments or hearings; takes the list page filters
+@app.get('/export/<kind>.<fmt>')
+@login_required
+def export_table(kind, fmt):
+    if kind not in EXPORTS or fmt not in ('csv', 'xlsx'): abort(404)
+    stmt, header = EXPORTS[kind](request.args.to_dict())
+    name = f"{kind}-{date.today().isoformat()}.{fmt}"
+    if fmt == 'csv':
+        body, mimetype = _export_csv(stmt, header), 'text/csv; charset=utf-8'
+    else:
+        body, mimetype = _export_xlsx(stmt, header, kind.title()), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{name}"'})
+
 # View/Print
 @app.get('/invoices/<int:id>')
 @login_required
 def invoice_view(id):
-    inv = Invoice.query.get_or_404(id)
-    pays = inv.payments.order_by(Payment.date.asc(), Payment.id.asc()).all()
-    paid, balance = _invoice_paid_balance(inv)
-    return render_template('invoice_print.html', inv=inv, payments=pays, paid=paid, balance=balance)
+    inv = Invoice.query.options(*_invoice_opts()).filter_by(id=id).first_or_404()
+
+    def render():
+        pays = inv.payments.order_by(Payment.date.asc(), Payment.id.asc()).all()
+        paid, balance = _invoice_paid_balance(inv)
+        return render_template('invoice_print.html', inv=inv, payments=pays, paid=paid, balance=balance)
+
+    if session.get('_flashes'):   # page carries one-off messages; don't cache or 304 it
+        return render()
+    etag = _invoice_etag(inv, 'html')
+    return _not_modified(etag, inv.updated_at) or \
+        _with_validators(make_response(_cached_render(inv, 'html', etag, render)), etag, inv.updated_at)
 
 # PDF
 @app.get('/invoices/<int:id>/pdf')
 @login_required
 def invoice_pdf(id):
-    inv = Invoice.query.get_or_404(id)
-    pays = inv.payments.order_by(Payment.date.asc(), Payment.id.asc()).all()
-    paid, balance = _invoice_paid_balance(inv)
-    try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-    except Exception:
+    inv = Invoice.query.options(*_invoice_opts()).filter_by(id=id).first_or_404()
+    etag = _invoice_etag(inv, 'pdf')
+    cached = _not_modified(etag, inv.updated_at)
+    if cached: return cached
+    if not _have_reportlab():
         flash("PDF generator not available. Use browser Print → Save as PDF.", "error")
         return redirect(url_for('invoice_view', id=id))
 
-    mem = io.BytesIO()
-    c = canvas.Canvas(mem, pagesize=A4)
-    w, h = A4
-    y = h - 50
-
-    c.setFont("Helvetica-Bold", 16); c.drawString(40, y, f"Invoice {inv.number}")
-    c.setFont("Helvetica", 10); y -= 20
-    c.drawString(40, y, f"Client: {inv.client.name}")
-    y -= 14; c.drawString(40, y, f"Case: {inv.case.ref} — {inv.case.title}")
-    y -= 14; c.drawString(40, y, f"Status: {inv.status.name}")
-    y -= 14; c.drawString(40, y, f"Due: {inv.due_date.strftime('%Y-%m-%d') if inv.due_date else '—'}")
-    y -= 20; c.setFont("Helvetica-Bold", 12)
-    c.drawString(40, y, f"Total: {float(inv.amount):.2f}    Paid: {float(paid):.2f}    Balance: {float(balance):.2f}")
+    def render():
+        pays = inv.payments.order_by(Payment.date.asc(), Payment.id.asc()).all()
+        data = _invoice_pdf_data(inv, pays)
+        t0 = time.perf_counter()
+        pdf = _render_invoice_pdf(data)
+        metrics.observe('juris360_pdf_render_seconds', {}, time.perf_counter() - t0)
+        return pdf
 
-    y -= 24; c.setFont("Helvetica-Bold", 11); c.drawString(40, y, "Payments")
-    y -= 16; c.setFont("Helvetica", 10)
-    if not pays:
-        c.drawString(40, y, "— None —"); y -= 14
-    else:
-        for p in pays:
-            c.drawString(40, y, p.date.strftime("%Y-%m-%d"))
-            c.drawString(140, y, (p.method or "—"))
-            c.drawString(240, y, (p.reference or ""))
-            c.drawRightString(w-40, y, f"{float(p.amount):.2f}")
-            y -= 14
-            if y < 60:
-                c.showPage(); y = h - 50; c.setFont("Helvetica", 10)
-
-    c.showPage(); c.save(); mem.seek(0)
-    return send_file(mem, as_attachment=True,
+    resp = send_file(io.BytesIO(_cached_render(inv, 'pdf', etag, render)), as_attachment=True,
                      download_name=f"invoice-{inv.number}.pdf",
-                     mimetype="application/pdf")
+                     mimetype="application/pdf", etag=False, conditional=False)
+    return _with_validators(resp, etag, inv.updated_at)
+
+@app.get('/invoices/export.zip')
+@login_required
+def invoices_export_pdfs():
+    if not _have_reportlab():
+        flash("PDF generator not available. Use browser Print → Save as PDF.", "error")
+        return redirect(url_for('invoices'))
+    return Response(stream_with_context(_export_invoice_pdfs_zip(request.args.to_dict())),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename=invoices-{date.today():%Y%m%d}.zip'})
 
 # Payments
 @app.post('/invoices/<int:id>/payments/add')
@@ -541,16 +3001,446 @@ def invoice_payment_add(id):
                 method=request.form.get('method'),
                 reference=request.form.get('reference'),
                 note=request.form.get('note'))
-    db.session.add(p)
+    db.session.add(p); db.session.flush()   # flush refreshes inv's ledger totals
 
-    paid, balance = _invoice_paid_balance(inv)
-    if (Decimal(inv.amount or 0) - paid - amount) <= 0:
-        closed = CaseStatus.query.filter_by(name='Closed').first()
-        if closed: inv.status = closed
+    if inv.balance <= 0:
+        closed = lookup_cache.status_id('Closed')
+        if closed: inv.status_id = closed
 
     db.session.commit()
     flash('Payment recorded', 'ok')
     return redirect(url_for('invoices_edit', id=id))
 
+# ------------- CLI -------------
+@app.cli.command('reconcile-ledger', help='Rebuild invoice paid/balance/payment-count totals from payments.')
+def reconcile_ledger_cmd():
+    with db.engine.begin() as conn:
+        n = _ledger_refresh(conn).rowcount
+    print(f'Reconciled {n} invoices')
+
+@app.cli.command('post-payments', help='Match a bank/M-Pesa statement (CSV or JSON) to invoices and post the payments.')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True)
+def post_payments_cmd(path, dry_run):
+    with open(path, encoding='utf-8-sig', newline='') as fh:
+        report = reconcile_payments(_read_rows(fh, _import_format(path, '')), dry_run=dry_run)
+    for r in report['lines']:
+        if r['status'] != 'matched': print(f"line {r['line']}: {r['status']} ({r['message']}) ref={r['reference']}")
+    print(f"{report['posted']} posted, {report['duplicate']} duplicate, {report['unmatched']} unmatched, "
+          f"{report['ambiguous']} ambiguous, {report['invalid']} invalid; closed {len(report['closed_invoices'])} invoices")
+
+@app.cli.command('export-pdfs', help='Render the filtered invoices to PDFs and write them into a ZIP file.')
+@click.option('-o', '--output', default='invoices.zip', show_default=True)
+@click.option('--client-id')
+@click.option('--status-id')
+@click.option('--case-id')
+@click.option('--from', 'date_from', help='due date from (YYYY-MM-DD)')
+@click.option('--to', 'date_to', help='due date to (YYYY-MM-DD)')
+@click.option('--outstanding', is_flag=True)
+def export_pdfs_cmd(output, **filters):
+    t0 = time.perf_counter()
+    with open(output, 'wb') as fh:
+        for chunk in _export_invoice_pdfs_zip({k: v for k, v in filters.items() if v}): fh.write(chunk)
+    print(f'Wrote {output} in {time.perf_counter() - t0:.1f}s')
+
+@app.cli.command('import-data', help='Bulk-import clients, cases, hearings, invoices or payments from CSV / JSON Lines.')
+@click.argument('kind', type=click.Choice(list(IMPORTERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json']))
+@click.option('--dry-run', is_flag=True)
+def import_data_cmd(kind, path, fmt, dry_run):
+    with open(path, encoding='utf-8-sig', newline='') as fh:
+        report = import_rows(kind, _read_rows(fh, fmt or _import_format(path, '')), dry_run=dry_run)
+    for e in report['errors']: print(f"row {e['row']}: {e['error']}")
+    print(f"{report['inserted']} inserted, {report['failed']} failed in {report['seconds']}s "
+          f"({report['rows_per_sec']} rows/s)")
+
+def _bench_import_run(rows, out):
+    with app.app_context():
+        init_db(seed=True)
+        results = []
+        n_clients = max(rows // 10, 1)
+        gen = {
+            'clients': lambda: ({'name': f'Client {i:06d}', 'phone': f'+2547{i:08d}', 'email': f'c{i}@example.com'}
+                                for i in range(n_clients)),
+            'cases': lambda: ({'ref': f'B-{i:07d}', 'title': f'Matter {i}', 'client': f'Client {i % n_clients:06d}',
+                               'case_type': 'Civil', 'status': 'Open'} for i in range(rows)),
+            'invoices': lambda: ({'number': f'BI-{i:07d}', 'case': f'B-{i:07d}', 'amount': '15000.00',
+                                  'due_date': '2025-01-31'} for i in range(rows)),
+            'payments': lambda: ({'invoice': f'BI-{i % rows:07d}', 'amount': '2500.00', 'method': 'M-Pesa',
+                                  'reference': f'MP{i:09d}'} for i in range(rows)),
+        }
+        for kind, rows_fn in gen.items():
+            r = import_rows(kind, rows_fn())
+            results.append((kind, r['inserted'], r['failed'], r['seconds'], r['rows_per_sec']))
+    out.put(results)
+
+@app.cli.command('bench-import', help='Import synthetic clients/cases/invoices/payments into a scratch DB and report rows/s.')
+@click.option('--rows', default=20000, show_default=True)
+@click.option('--url', help='target database URL (default: a throwaway SQLite file)')
+def bench_import_cmd(rows, url):
+    import multiprocessing as mp
+    ctx = mp.get_context('spawn')
+    with _scratch_env(url) as target:
+        out = ctx.Queue()
+        p = ctx.Process(target=_bench_import_run, args=(rows, out)); p.start()
+        results = out.get(); p.join()
+    print(f"target: {target.split('@')[-1]}")
+    for kind, ok, failed, secs, rate in results:
+        print(f'{kind:>9}: {ok:>8} rows in {secs:7.2f}s  {rate:>10} rows/s  ({failed} failed)')
+
+@app.cli.command('search-reindex', help='Rebuild the full-text search index from the source tables.')
+def search_reindex_cmd():
+    with write_intent(), db.engine.begin() as conn:
+        _search_create(conn)
+        n = _search_rebuild(conn)
+    print(f'{n} documents indexed ({_search_mode_cache})')
+
+@app.cli.command('refresh-next-hearings', help='Roll Case.next_hearing_date forward past hearings that are over (run daily).')
+@click.option('--all', 'everything', is_flag=True, help='recompute every case, not only stale ones')
+def refresh_next_hearings_cmd(everything):
+    with write_intent(), db.engine.begin() as conn:
+        n = _next_hearing_refresh(conn, stale_only=not everything).rowcount
+    print(f'{n} cases updated')
+
+@app.cli.command('refresh-reports', help='Rebuild the monthly collection summary from all payments.')
+def refresh_reports_cmd():
+    with write_intent(), db.engine.begin() as conn:
+        _collections_refresh(conn)
+        n = conn.execute(select(func.count()).select_from(CollectionSummary.__table__)).scalar()
+    print(f'{n} period/method rows')
+
+@app.cli.command('worker', help='Run background jobs on a thread pool (Ctrl-C to stop).')
+@click.option('--threads', default=2, show_default=True)
+@click.option('--burst', is_flag=True, help='exit once the queue is empty')
+@click.option('--no-periodic', is_flag=True, help='do not schedule PERIODIC_JOBS from this worker')
+def worker_cmd(threads, burst, no_periodic):
+    import socket
+    stop = threading.Event()
+    name = f'{socket.gethostname()}:{os.getpid()}'
+    released = _release_stale_jobs()
+    if released: print(f'requeued {released} stale running jobs')
+    if not no_periodic: _schedule_periodic()
+
+    def housekeeping():
+        try:
+            _release_stale_jobs()
+            if not no_periodic: _schedule_periodic()
+        except Exception:   # a failed pass is retried on the next tick; keep the threads running
+            app.logger.exception('Worker %s: housekeeping error', name)
+    pool = [threading.Thread(target=_worker_loop, args=(f'{name}:{i}', stop, burst), daemon=True)
+            for i in range(threads)]
+    for t in pool: t.start()
+    print(f'worker {name}: {threads} threads' + (' (burst)' if burst else ''))
+    try:
+        while any(t.is_alive() for t in pool):
+            time.sleep(1 if burst else 30)
+            if not burst: housekeeping()
+    except KeyboardInterrupt:
+        stop.set()
+        for t in pool: t.join()
+
+@app.cli.command('enqueue', help='Queue a background job, e.g. `flask enqueue hearing_reminders`.')
+@click.argument('kind', type=click.Choice(sorted(JOB_HANDLERS)))
+@click.option('--payload', default='{}', help='JSON payload')
+@click.option('--priority', default=0, show_default=True)
+def enqueue_cmd(kind, payload, priority):
+    print(f'job {enqueue(kind, json.loads(payload), priority=priority).id} queued')
+
+@app.cli.command('init-db', help='Create tables, apply migrations and seed an empty database. '
+                                 'Required after every upgrade.')
+@click.option('--seed/--no-seed', default=True)
+def init_db_cmd(seed):
+    applied = init_db(seed=seed)
+    print(f'Database ready ({len(applied)} migrations applied)')
+
+@app.cli.command('seed', help='Insert demo lookups, clients, cases and invoices into an empty database.')
+def seed_cmd():
+    seed_if_empty()
+    print('Seeded (no-op if clients already exist)')
+
+@app.cli.command('db-upgrade', help='Apply pending schema migrations.')
+def db_upgrade_cmd():
+    applied = migrate()
+    for version, label in applied: print(f'Applied {version}: {label}')
+    if not applied: print('Schema is up to date')
+
+def _list_queries():
+    # First and next page of every list sort in both directions, built as _keyset_page
+    # builds them; a NULL-keyed sort also gets its trailing NULL page. A first page in id
+    # order walks the primary key and stops at the limit, but SQLite reports that as a plain
+    # SCAN, so for id sorts only the next page (a rowid range) is checked.
+    out = {}
+    for label, model, sorts in (('clients', Client, CLIENT_SORTS), ('cases', Case, CASE_SORTS),
+                                ('hearings', Hearing, HEARING_SORTS), ('invoices', Invoice, INVOICE_SORTS)):
+        pk = model.id
+        for key, (expr, _, is_date, _, *bind) in sorts.items():
+            kv = date(2024, 1, 1) if is_date else 100 if expr is pk else (bind[0] if bind else (lambda v: v))('M')
+            for desc in (False, True):
+                name = f"{label} by {key} {'desc' if desc else 'asc'}"
+                by_pk = pk.desc() if desc else pk.asc()
+                page = select(model).limit(51)
+                if expr is pk:
+                    out[name + ', next page'] = page.where(_keyset_past(desc)(pk, kv)).order_by(by_pk)
+                    continue
+                keyed = page.where(expr.isnot(None)) if _keyset_nullable(expr) else page
+                order = (expr.desc() if desc else expr.asc(), by_pk)
+                out[name] = keyed.order_by(*order)
+                out[name + ', next page'] = keyed.where(_keyset_after(expr, pk, kv, 100, desc)).order_by(*order)
+                if _keyset_nullable(expr):
+                    out[name + ', NULL tail'] = page.where(expr.is_(None), _keyset_past(desc)(pk, 100)).order_by(by_pk)
+    return out
+
+# Queries the list/lookup/payment paths depend on; each must be answerable from an index.
+def _hot_queries():
+    return {
+        **_list_queries(),
+        'payments of an invoice': select(Payment).where(Payment.invoice_id == 1).order_by(Payment.date, Payment.id),
+        'cases of a client': select(Case).where(Case.client_id == 1).order_by(Case.id.desc()).limit(50),
+        'cases by status': select(Case).where(Case.status_id == 1).order_by(Case.id.desc()).limit(50),
+        'case by ref': select(Case).where(Case.ref == 'C-001'),
+        'case typeahead': select(Case).where(_prefix_match(func.lower(Case.ref), 'c-0')).limit(20),
+        'client typeahead': select(Client).where(_prefix_match(func.lower(Client.name), 'al'))
+                                          .order_by(func.lower(Client.name)).limit(20),
+        'hearings by date': select(Hearing).where(Hearing.date >= date(2024, 1, 1))
+                                           .order_by(Hearing.date.desc(), Hearing.id.desc()).limit(50),
+        'hearings of a case': select(Hearing).where(Hearing.case_id == 1).order_by(Hearing.date),
+        'invoices of a case': select(Invoice).where(Invoice.case_id == 1),
+        'invoices of a client': select(Invoice).where(Invoice.client_id == 1).order_by(Invoice.id.desc()).limit(50),
+        'invoice by number': select(Invoice).where(Invoice.number == 'INV-1001'),
+        'outstanding invoices': select(Invoice).where(Invoice.balance > 0),
+    }
+
+def _full_scans(conn, stmt):
+    # Full table scans, and sorts of a whole result that an index should have ordered
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'sqlite':
+        plan = [r[-1] for r in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql)]
+        bad = [p for p in plan if (p.startswith('SCAN ') and 'INDEX' not in p) or 'TEMP B-TREE FOR ORDER BY' in p]
+    else:
+        conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plan = [r[0] for r in conn.exec_driver_sql('EXPLAIN ' + sql)]
+        bad = [p for p in plan if 'Seq Scan' in p]
+    return plan, bad
+
+@app.cli.command('check-indexes', help='EXPLAIN the hot queries and fail if any falls back to a full table scan.')
+def check_indexes_cmd():
+    failed = 0
+    with db.engine.connect() as conn:
+        for name, stmt in _hot_queries().items():
+            plan, bad = _full_scans(conn, stmt)
+            print(f"{'FAIL' if bad else 'ok  '} {name}: {' | '.join(plan)}")
+            failed += bool(bad)
+        conn.rollback()
+    if failed: raise SystemExit(f'{failed} hot queries use a full scan')
+
+_STARTUP_PROBE = '''
+import json, sys, time
+t0 = time.perf_counter()
+import app as m
+t1 = time.perf_counter()
+m.app.test_client().get('/login')
+t2 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'first_request': t2 - t1}))
+'''
+
+@app.cli.command('bench-startup', help='Time module import and first request in fresh interpreters.')
+@click.option('--runs', default=5, show_default=True)
+def bench_startup_cmd(runs):
+    import statistics, subprocess, sys
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', _STARTUP_PROBE], cwd=here, check=True,
+                             capture_output=True, text=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    for key in ('import', 'first_request'):
+        vals = [s[key] * 1000 for s in samples]
+        print(f'{key:>14}: median {statistics.median(vals):.1f} ms  (min {min(vals):.1f}, max {max(vals):.1f})')
+
+@app.cli.command('gen-data', help='Bulk-generate clients with case, hearing, invoice and payment fan-out (use a scratch DB).')
+@click.option('--clients', default=1000, show_default=True)
+@click.option('--seed', default=0, show_default=True, help='same seed, same data')
+def gen_data_cmd(clients, seed):
+    init_db(seed=True)
+    t0 = time.perf_counter()
+    counts = generate_data(clients, seed)
+    secs = time.perf_counter() - t0
+    total = sum(counts.values())
+    print(', '.join(f'{v} {k}' for k, v in counts.items()) + f' in {secs:.1f}s ({total / secs:,.0f} rows/s)')
+
+class _BenchSample:
+    # Deterministic picks of existing invoice ids, spread over the id range
+    def __init__(self, seed, n=50):
+        rnd = random.Random(seed)
+        lo, hi = db.session.execute(select(func.min(Invoice.id), func.max(Invoice.id))).one()
+        ids = set()
+        for _ in range(n if lo else 0):
+            x = rnd.randint(lo, hi)
+            ids.add(db.session.execute(select(Invoice.id).where(Invoice.id >= x).order_by(Invoice.id).limit(1)).scalar())
+        self.ids, self._i = sorted(ids), 0
+
+    def invoice(self):
+        self._i += 1
+        return self.ids[self._i % len(self.ids)]
+
+BENCH_ROUTES = [   # name, method, url(sample), form data; POST routes write and only run with --allow-writes
+    ('dashboard', 'GET', lambda s: '/', None),
+    ('cases', 'GET', lambda s: '/cases', None),
+    ('hearings', 'GET', lambda s: '/hearings', None),
+    ('invoices', 'GET', lambda s: '/invoices', None),
+    ('invoice_edit', 'GET', lambda s: f'/invoices/{s.invoice()}/edit', None),
+    ('invoice_view', 'GET', lambda s: f'/invoices/{s.invoice()}', None),
+    ('invoice_pdf', 'GET', lambda s: f'/invoices/{s.invoice()}/pdf', None),
+    ('causelist', 'GET', lambda s: '/causelist?view=week', None),
+    ('reports', 'GET', lambda s: '/reports', None),
+    ('search', 'GET', lambda s: '/search?q=land', None),
+    ('payment_post', 'POST', lambda s: f'/invoices/{s.invoice()}/payments/add',
+     {'amount': '1.00', 'method': 'Cash', 'reference': 'bench'}),
+]
+
+def _pct(vals, p):
+    s = sorted(vals)
+    return s[min(len(s) - 1, round(p / 100 * (len(s) - 1)))]
+
+def run_route_bench(iterations, warm=False, only=None, seed=0, writes=False):
+    # Runs in an empty contextvars context so that, even under the CLI's app context,
+    # every request gets its own app context, g and session as it would in production
+    return contextvars.Context().run(_run_route_bench, iterations, warm, only, seed, writes)
+
+def _run_route_bench(iterations, warm, only, seed, writes):
+    import tracemalloc
+    app.config.update(SQL_QUERY_BUDGET=10 ** 9, SQL_QUERY_BUDGET_STRICT=False)   # emit X-SQL-Count only
+    with app.app_context(): sample = _BenchSample(seed)
+    if not sample.ids: raise click.ClickException('no invoices to benchmark; run `flask gen-data` first')
+    c = app.test_client()
+    with c.session_transaction() as sess: sess['user'] = 'bench'
+    results = {}
+    for name, method, url, data in BENCH_ROUTES:
+        if (only and name not in only) or (method != 'GET' and not writes): continue
+        times, sql = [], []
+        for i in range(iterations + 1):   # first request warms imports / connections and is discarded
+            if not warm: cache.clear()
+            t0 = time.perf_counter()
+            r = c.open(url(sample), method=method, data=data)
+            elapsed = time.perf_counter() - t0
+            if r.status_code >= 400: raise click.ClickException(f'{name}: HTTP {r.status_code}')
+            with c.session_transaction() as sess: sess.pop('_flashes', None)
+            if i:
+                times.append(elapsed * 1000); sql.append(int(r.headers.get('X-SQL-Count', 0)))
+        if not warm: cache.clear()
+        tracemalloc.start()
+        c.open(url(sample), method=method, data=data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        with c.session_transaction() as sess: sess.pop('_flashes', None)
+        results[name] = {'p50_ms': round(_pct(times, 50), 2), 'p95_ms': round(_pct(times, 95), 2),
+                         'sql': max(sql), 'peak_kb': peak // 1024}
+    return results
+
+@app.cli.command('bench-routes', help='Drive each route through the test client; report p50/p95, SQL count and peak memory.')
+@click.option('--iterations', '-n', default=30, show_default=True)
+@click.option('--warm', is_flag=True, help='keep the app cache between requests (default: cold, cache cleared)')
+@click.option('--route', 'only', multiple=True, help='limit to these route names')
+@click.option('--save', type=click.Path(dir_okay=False), help='write results as a baseline JSON file')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help='baseline JSON to compare against')
+@click.option('--tolerance', default=0.25, show_default=True, help='allowed p95 slowdown before flagging (0.25 = 25%)')
+@click.option('--allow-writes', is_flag=True, help='also run POST routes, which add real payments to the configured DB')
+def bench_routes_cmd(iterations, warm, only, save, compare, tolerance, allow_writes):
+    counts = {m.__tablename__: db.session.execute(select(func.count()).select_from(m)).scalar()
+              for m in (Client, Case, Hearing, Invoice, Payment)}
+    dialect = db.engine.dialect.name
+    db.session.remove()
+    results = run_route_bench(iterations, warm, set(only), writes=allow_writes)
+    base = json.load(open(compare))['routes'] if compare else {}
+    regressions = []
+    print(f"{'route':<14}{'p50 ms':>9}{'p95 ms':>9}{'sql':>5}{'peak KB':>9}" + ('   vs baseline' if base else ''))
+    for name, r in results.items():
+        line = f"{name:<14}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['sql']:>5}{r['peak_kb']:>9}"
+        b = base.get(name)
+        if b:
+            delta = (r['p95_ms'] - b['p95_ms']) / b['p95_ms'] if b['p95_ms'] else 0
+            flags = [f'p95 {delta:+.0%}']
+            if r['sql'] != b['sql']: flags.append(f"sql {b['sql']}->{r['sql']}")
+            if delta > tolerance or r['sql'] > b['sql']:
+                regressions.append(name); flags.append('REGRESSION')
+            line += '   ' + ', '.join(flags)
+        print(line)
+    print('rows: ' + ', '.join(f'{v} {k}' for k, v in counts.items()))
+    if not allow_writes: print('write routes skipped (pass --allow-writes against a scratch database)')
+    if save:
+        with open(save, 'w') as fh:
+            json.dump({'created': _utcnow().isoformat(timespec='seconds'), 'dialect': dialect,
+                       'iterations': iterations, 'warm': warm, 'rows': counts, 'routes': results}, fh, indent=2)
+        print(f'baseline saved to {save}')
+    if regressions: raise click.ClickException(f"regressions: {', '.join(regressions)}")
+
+@contextlib.contextmanager
+def _scratch_env(url=None, **env):
+    # Env for spawned benchmark processes: a throwaway SQLite file unless a URL is given
+    import tempfile
+    env = dict(DATABASE_URL=url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'),
+               REQUIRE_LOGIN='0', SQL_QUERY_BUDGET='0', AUTO_INIT_DB='0', **env)
+    saved = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    try:
+        yield env['DATABASE_URL']
+    finally:
+        for k, v in saved.items():
+            if v is None: os.environ.pop(k, None)
+            else: os.environ[k] = v
+
+def _bench_write_worker(seconds, invoice_ids, out):
+    c = app.test_client()
+    ok = failed = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        r = c.post(f'/invoices/{random.choice(invoice_ids)}/payments/add',
+                   data={'amount': '1.00', 'method': 'Cash', 'reference': 'bench'})
+        if r.status_code == 302: ok += 1
+        else: failed += 1
+    out.put((ok, failed))
+
+def _bench_write_init(n_invoices):
+    with app.app_context():
+        init_db()
+        case = Case.query.first()
+        db.session.add_all([Invoice(number=f'BENCH-{i}', client_id=case.client_id, case_id=case.id,
+                                    status_id=case.status_id, amount=Decimal('1000000')) for i in range(n_invoices)])
+        db.session.commit()
+
+@app.cli.command('bench-sqlite-writes', help='Concurrent payment posting against a scratch SQLite file, default vs tuned.')
+@click.option('--workers', default=4, show_default=True)
+@click.option('--seconds', default=5.0, show_default=True)
+def bench_sqlite_writes_cmd(workers, seconds):
+    import multiprocessing as mp
+    ctx = mp.get_context('spawn')
+    for tuned in ('0', '1'):
+        with _scratch_env(SQLITE_TUNED=tuned):
+            init = ctx.Process(target=_bench_write_init, args=(50,)); init.start(); init.join()
+            out = ctx.Queue()
+            procs = [ctx.Process(target=_bench_write_worker, args=(seconds, list(range(3, 53)), out))
+                     for _ in range(workers)]
+            for p in procs: p.start()
+            results = [out.get() for _ in procs]
+            for p in procs: p.join()
+            ok, failed = sum(r[0] for r in results), sum(r[1] for r in results)
+            print(f"{'tuned' if tuned == '1' else 'default':>8}: {ok / seconds:8.1f} writes/s  "
+                  f"({ok} ok, {failed} failed, {workers} workers, {seconds:g}s)")
+
+def _wire_app():
+    # Finishes wiring extensions onto the module-level app (routes live on it, so this is not
+    # a factory; serve app:app). Pure configuration: no DB I/O.
+    if 'sqlalchemy' in app.extensions: return app
+    db.init_app(app)
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') and app.config['SQLITE_TUNED']:
+        for rule in app.url_map.iter_rules():
+            if 'POST' in rule.methods and rule.endpoint not in _NO_VIEW_RETRY:
+                app.view_functions[rule.endpoint] = _with_write_retry(app.view_functions[rule.endpoint])
+    return app
+
+_wire_app()
+
 if __name__ == '__main__':
+    with app.app_context(): init_db()
     app.run(debug=True)
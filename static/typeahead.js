@@ -0,0 +1,53 @@
+/* Juris360 typeahead: fills a <datalist> from the JSON lookup endpoint named in
+   data-typeahead and copies the chosen id into the hidden input that follows. */
+(function () {
+  var seq = 0;
+
+  function init(input) {
+    var hidden = input.nextElementSibling;
+    var list = document.createElement('datalist');
+    var ids = {}, timer = null;
+    list.id = 'typeahead-' + (++seq);
+    input.setAttribute('list', list.id);
+    input.parentNode.appendChild(list);
+    if (hidden.value) ids[input.value] = hidden.value;
+
+    function pick() {
+      hidden.value = ids[input.value] || '';
+      input.setCustomValidity('');
+    }
+
+    input.addEventListener('input', function () {
+      pick();
+      clearTimeout(timer);
+      if (hidden.value) return;
+      timer = setTimeout(function () {
+        var url = input.dataset.typeahead + '?q=' + encodeURIComponent(input.value);
+        fetch(url, { headers: { Accept: 'application/json' }, credentials: 'same-origin' })
+          .then(function (r) { return r.json(); })
+          .then(function (items) {
+            ids = {}; list.innerHTML = '';
+            items.forEach(function (it) {
+              var o = document.createElement('option');
+              o.value = it.label; ids[it.label] = it.id;
+              list.appendChild(o);
+            });
+            pick();
+          });
+      }, 150);
+    });
+
+    if (input.form) input.form.addEventListener('submit', function (e) {
+      if (!input.value) hidden.value = '';
+      if (input.required && !hidden.value) {
+        e.preventDefault();
+        input.setCustomValidity('Pick a match from the list');
+        input.reportValidity();
+      }
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('[data-typeahead]').forEach(init);
+  });
+})();
@@ -0,0 +1,72 @@
+import os, shutil, tempfile
+from decimal import Decimal
+
+import pytest
+
+# app.py reads its configuration at import time, so the test database is set up first
+_TMP = tempfile.mkdtemp(prefix='juris360-tests-')
+DB_PATH = os.path.join(_TMP, 'test.db')
+os.environ.update(DATABASE_URL='sqlite:///' + DB_PATH, REQUIRE_LOGIN='0', AUTO_INIT_DB='0',
+                  SQL_QUERY_BUDGET='0', SQL_QUERY_BUDGET_STRICT='0', CACHE_REDIS_URL='',
+                  JOB_OUTPUT_DIR=os.path.join(_TMP, 'jobs'))
+
+import app as juris  # noqa: E402
+
+BASELINE_DB = os.path.join(os.path.dirname(juris.__file__), 'data', 'juris360.db')
+
+
+def reset_db(src=None):
+    # Drop the file under the engine (optionally replacing it with a copy of src) and forget
+    # every per-process cache that remembers what the old database held
+    with juris.app.app_context():
+        juris.db.session.remove()
+        juris.db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(DB_PATH + suffix): os.remove(DB_PATH + suffix)
+    if src: shutil.copy(src, DB_PATH)
+    juris._search_mode_cache = None
+    juris.lookup_cache.reset()
+    juris.cache.clear()
+
+
+@pytest.fixture
+def fresh_db():
+    reset_db()
+    with juris.app.app_context():
+        juris.init_db()
+        juris.db.session.remove()
+    yield
+    with juris.app.app_context(): juris.db.session.remove()
+
+
+@pytest.fixture
+def ctx(fresh_db):
+    # For tests that call app functions directly; request tests use `client` instead, so
+    # every request gets its own app context (and g) as it would in production
+    with juris.app.app_context():
+        yield juris
+        juris.db.session.remove()
+
+
+@pytest.fixture
+def client(fresh_db):
+    return juris.app.test_client()
+
+
+@pytest.fixture
+def in_app():
+    def run(fn, *args, **kw):
+        with juris.app.app_context():
+            try: return fn(*args, **kw)
+            finally: juris.db.session.remove()
+    return run
+
+
+def invoice(number='INV-1001'):
+    return juris.Invoice.query.filter_by(number=number).one()
+
+
+def add_payment(inv, amount, **kw):
+    p = juris.Payment(invoice_id=inv.id, amount=Decimal(amount), **kw)
+    juris.db.session.add(p); juris.db.session.commit()
+    return p
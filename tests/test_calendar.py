@@ -0,0 +1,55 @@
+from datetime import date, timedelta
+
+from conftest import juris
+
+
+def _feed(in_app):
+    def url():
+        with juris.app.test_request_context():
+            return juris.feed_url('firm').split('localhost', 1)[1]
+    return in_app(url)
+
+
+def test_feed_etag_revalidates(client, in_app):
+    url = _feed(in_app)
+    r = client.get(url)
+    assert r.status_code == 200 and r.mimetype == 'text/calendar' and b'BEGIN:VEVENT' in r.data
+    assert client.get(url, headers={'If-None-Match': r.headers['ETag']}).status_code == 304
+
+
+def test_feed_etag_moves_with_status_names(client, in_app):
+    url = _feed(in_app)
+    etag = client.get(url).headers['ETag']
+
+    def rename():
+        s = juris.CaseStatus.query.filter_by(name='Open').one()
+        s.name = 'Active'; juris.db.session.commit()
+    in_app(rename)
+    r = client.get(url, headers={'If-None-Match': etag})
+    assert r.status_code == 200 and r.headers['ETag'] != etag
+
+
+def test_bad_token_is_a_404(client):
+    assert client.get('/calendar/nope.ics').status_code == 404
+
+
+def test_next_hearing_date_follows_hearing_writes(ctx):
+    m = ctx
+    case = m.Case.query.filter_by(ref='C-001').one()
+    later = m.Hearing(case_id=case.id, date=date.today() + timedelta(days=9), status_id=case.status_id)
+    m.db.session.add(later); m.db.session.commit()
+    assert case.next_hearing_date == date.today()
+    for h in m.Hearing.query.filter(m.Hearing.case_id == case.id, m.Hearing.id != later.id):
+        m.db.session.delete(h)
+    m.db.session.commit()
+    assert case.next_hearing_date == later.date
+
+
+def test_moving_a_hearing_refreshes_the_case_it_left(ctx):
+    m = ctx
+    c1, c2 = (m.Case.query.filter_by(ref=r).one() for r in ('C-001', 'C-002'))
+    h = m.Hearing.query.filter_by(case_id=c1.id).one()
+    h.notes = 'Moved'; m.db.session.commit()
+    h.case_id = c2.id; m.db.session.commit()
+    assert c1.next_hearing_date is None
+    assert c2.next_hearing_date == date.today()
@@ -0,0 +1,72 @@
+import gzip
+import re
+
+import pytest
+
+from conftest import juris
+
+
+def static_url(client, name):
+    html = client.get('/').get_data(as_text=True)
+    return re.search(r'/static/%s\?v=[0-9a-f]{12}' % re.escape(name), html).group(0)
+
+
+def test_large_pages_are_gzipped_when_accepted(client, monkeypatch):
+    monkeypatch.setattr(juris, 'brotli', None)
+    plain = client.get('/clients')
+    assert 'Content-Encoding' not in plain.headers and 'Accept-Encoding' in plain.headers['Vary']
+    r = client.get('/clients', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(r.data) == plain.data
+
+
+def test_small_or_disabled_responses_stay_plain(client, monkeypatch):
+    monkeypatch.setitem(juris.app.config, 'COMPRESS_MIN_SIZE', 10 ** 7)
+    assert 'Content-Encoding' not in client.get('/clients', headers={'Accept-Encoding': 'gzip'}).headers
+    monkeypatch.setitem(juris.app.config, 'COMPRESS_MIN_SIZE', 1)
+    monkeypatch.setitem(juris.app.config, 'COMPRESS_ENABLED', False)
+    assert 'Content-Encoding' not in client.get('/clients', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_hashed_static_urls_are_immutable(client, monkeypatch):
+    monkeypatch.setattr(juris, 'brotli', None)
+    url = static_url(client, 'kwetu.css')
+    r = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200 and r.headers['Content-Encoding'] == 'gzip'
+    cc = r.cache_control
+    assert cc.immutable and cc.public and cc.max_age == juris.app.config['STATIC_MAX_AGE']
+    assert r.get_etag()[1]   # weak: the gzip bytes differ from the file
+    with open(juris.safe_join(juris.app.static_folder, 'kwetu.css'), 'rb') as fh:
+        assert gzip.decompress(r.data) == fh.read()
+    r.close()
+
+
+@pytest.mark.parametrize('query', ['', '?v=000000000000'])
+def test_unhashed_or_stale_static_urls_are_not_immutable(client, query):
+    r = client.get('/static/kwetu.css' + query)
+    assert r.status_code == 200 and not r.cache_control.immutable
+    r.close()
+
+
+def test_static_hash_follows_the_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(juris.app, 'static_folder', str(tmp_path))
+    (tmp_path / 'x.css').write_text('a{}')
+    first = juris._static_hash('x.css')
+    (tmp_path / 'x.css').write_text('b{color:red}')
+    assert juris._static_hash('x.css') != first
+    assert juris._static_hash('missing.css') is None
+
+
+def test_dashboard_fragment_is_cached_until_a_write(client, monkeypatch):
+    calls = []
+    real = juris._recent_cases
+    monkeypatch.setattr(juris, '_recent_cases', lambda: calls.append(1) or real())
+    client.get('/'); client.get('/')
+    assert len(calls) == 1
+    with juris.app.app_context():
+        c = juris.Case.query.first()
+        juris.db.session.add(juris.Case(ref='HCC/999/2026', title='Fresh Matter', client_id=c.client_id,
+                                        case_type_id=c.case_type_id, status_id=c.status_id))
+        juris.db.session.commit()
+    assert 'HCC/999/2026' in client.get('/').get_data(as_text=True)
+    assert len(calls) == 2
@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+import pytest
+
+from conftest import juris
+
+
+@pytest.fixture
+def computes(ctx, monkeypatch):
+    calls = []
+    real = juris._compute_metrics
+    monkeypatch.setattr(juris, '_compute_metrics', lambda today: calls.append(today) or real(today))
+    return calls
+
+
+def test_metrics_come_from_one_cached_query(ctx, computes):
+    m = juris._metrics()
+    assert m == {'clients': 2, 'pending_cases': 2, 'pending_invoices': 2,
+                 'receivables': Decimal('37000.00'), 'hearings_week': 2}
+    assert juris._metrics() == m and len(computes) == 1
+
+
+def test_orm_writes_invalidate_the_metrics(ctx, computes):
+    juris._metrics()
+    juris.db.session.add(juris.Client(name='New Client')); juris.db.session.commit()
+    assert juris._metrics()['clients'] == 3 and len(computes) == 2
+
+
+def test_bulk_writes_invalidate_the_metrics(ctx, computes):
+    juris._metrics()
+    juris.import_rows('payments', [{'invoice': 'INV-1001', 'amount': '1000'}])
+    assert juris._metrics()['receivables'] == Decimal('36000.00')
+
+
+def test_rollbacks_and_unrelated_writes_keep_the_metrics(ctx, computes):
+    juris._metrics()
+    juris.db.session.add(juris.Client(name='Rolled Back')); juris.db.session.flush()
+    juris.db.session.rollback()
+    juris.db.session.add(juris.CaseType(name='Maritime')); juris.db.session.commit()
+    juris._metrics()
+    assert len(computes) == 1
+
+
+def test_dashboard_serves_the_cached_metrics(client, monkeypatch):
+    monkeypatch.setitem(juris.app.config, 'SQL_QUERY_BUDGET', 10 ** 9)   # emits X-SQL-Count
+    first = client.get('/')
+    assert first.status_code == 200
+    again = client.get('/')
+    assert int(again.headers['X-SQL-Count']) < int(first.headers['X-SQL-Count'])
@@ -0,0 +1,76 @@
+import csv, io, re, zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+from conftest import juris
+
+
+def _csv(client, path, **params):
+    r = client.get(path, query_string=params)
+    assert r.status_code == 200 and r.is_streamed
+    return list(csv.reader(io.StringIO(r.get_data(as_text=True).lstrip('﻿'))))
+
+
+def _xlsx_rows(client, path, **params):
+    r = client.get(path, query_string=params)
+    assert r.status_code == 200 and r.is_streamed
+    with zipfile.ZipFile(io.BytesIO(r.data)) as zf:
+        assert {'[Content_Types].xml', 'xl/workbook.xml'} <= set(zf.namelist())
+        sheet = zf.read('xl/worksheets/sheet1.xml').decode()
+    cell = lambda c: ''.join(re.findall(r'<(?:t|v)[^>]*>([^<]*)</', c))
+    return [[cell(c) for c in re.findall(r'<c[^>]*/>|<c[^>]*>.*?</c>', row)]
+            for row in re.findall(r'<row[^>]*>(.*?)</row>', sheet)]
+
+
+@pytest.fixture
+def payments(in_app):
+    def add():
+        far = date.today() + timedelta(days=90)
+        juris.db.session.get(juris.Invoice, 2).due_date = far
+        juris.db.session.add_all([
+            juris.Payment(invoice_id=1, amount=Decimal('100.00'), date=date(2025, 1, 10), reference='A1'),
+            juris.Payment(invoice_id=1, amount=Decimal('200.00'), date=date(2025, 2, 10), reference='A2'),
+            juris.Payment(invoice_id=2, amount=Decimal('50.00'), date=date(2025, 1, 20), reference='B1')])
+        juris.db.session.commit()
+    in_app(add)
+
+
+def test_invoice_csv_has_every_invoice_and_its_totals(client, payments):
+    rows = _csv(client, '/export/invoices.csv')
+    assert rows[0][:3] == ['ID', 'Number', 'Client']
+    by_number = {r[1]: r for r in rows[1:]}
+    assert set(by_number) == {'INV-1001', 'INV-1002'}
+    assert by_number['INV-1001'][7:10] == ['300.00', '14700.00', '2']
+
+
+def test_invoice_csv_takes_the_list_filters(client, payments):
+    assert [r[1] for r in _csv(client, '/export/invoices.csv', client_id=2)[1:]] == ['INV-1002']
+    today = date.today().isoformat()
+    assert [r[1] for r in _csv(client, '/export/invoices.csv', date_from=today, date_to=today)[1:]] == ['INV-1001']
+
+
+def test_payments_export_holds_the_payments_of_the_filtered_invoices(client, payments):
+    today = date.today().isoformat()
+    # due-date filters pick invoices, not payment dates
+    rows = _xlsx_rows(client, '/export/payments.xlsx', date_from=today, date_to=today)
+    refs = [cells[9] for cells in rows[1:]]
+    assert refs == ['A1', 'A2']
+    rows = _xlsx_rows(client, '/export/payments.xlsx', paid_from='2025-01-15')
+    assert [cells[9] for cells in rows[1:]] == ['B1', 'A2']
+
+
+def test_running_totals_count_payments_before_the_date_bound(client, payments):
+    rows = _csv(client, '/export/payments.csv', paid_from='2025-02-01')
+    assert [(r[9], r[6], r[7]) for r in rows[1:]] == [('A2', '300.00', '14700.00')]
+
+
+def test_hearings_csv_filters_by_case(client):
+    rows = _csv(client, '/export/hearings.csv', case_id=2)
+    assert [r[2] for r in rows[1:]] == ['C-002']
+
+
+def test_unknown_export_is_a_404(client):
+    assert client.get('/export/clients.csv').status_code == 404
+    assert client.get('/export/invoices.pdf').status_code == 404
@@ -0,0 +1,53 @@
+from sqlalchemy import func, select
+
+from conftest import juris, reset_db
+
+MODELS = {'clients': juris.Client, 'cases': juris.Case, 'hearings': juris.Hearing,
+          'invoices': juris.Invoice, 'payments': juris.Payment}
+
+
+def table_counts():
+    return {k: juris.db.session.execute(select(func.count()).select_from(m)).scalar() for k, m in MODELS.items()}
+
+
+def snapshot():
+    return {'clients': juris.db.session.execute(select(juris.Client.name, juris.Client.phone)
+                                                .order_by(juris.Client.id)).all(),
+            'invoices': juris.db.session.execute(select(juris.Invoice.number, juris.Invoice.amount, juris.Invoice.balance)
+                                                 .order_by(juris.Invoice.id)).all(),
+            'payments': juris.db.session.execute(select(juris.Payment.amount, juris.Payment.reference)
+                                                 .order_by(juris.Payment.id)).all()}
+
+
+def test_generated_counts_match_the_tables(ctx):
+    before = table_counts()
+    counts = juris.generate_data(40, seed=3, chunk=15)
+    assert counts['clients'] == 40
+    assert 40 <= counts['cases'] <= 200
+    after = table_counts()
+    assert {k: after[k] - before[k] for k in MODELS} == counts
+
+
+def test_generated_payments_never_overpay(ctx):
+    juris.generate_data(30, seed=5)
+    over = juris.db.session.execute(select(func.count()).select_from(juris.Invoice)
+                                    .where(juris.Invoice.balance < 0)).scalar()
+    assert over == 0
+
+
+def test_same_seed_gives_the_same_data(fresh_db, in_app):
+    def run():
+        juris.generate_data(25, seed=7, chunk=10)
+        return snapshot()
+    first = in_app(run)
+    reset_db()
+    in_app(juris.init_db)
+    assert in_app(run) == first
+
+
+def test_other_seeds_differ(ctx):
+    juris.generate_data(10, seed=1)
+    a = snapshot()['clients']
+    juris.generate_data(10, seed=2)
+    assert snapshot()['clients'][-10:] != a[-10:]
+
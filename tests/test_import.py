@@ -0,0 +1,61 @@
+import csv
+from decimal import Decimal
+
+import pytest
+
+from conftest import invoice, juris
+
+
+def test_ledger_follows_bulk_payment_import(ctx):
+    m = ctx
+    report = m.import_rows('payments', [{'invoice': 'INV-1002', 'amount': '22000', 'reference': 'B1'}])
+    assert report['inserted'] == 1
+    m.db.session.expire_all()
+    inv = invoice('INV-1002')
+    assert (inv.balance, inv.payment_count) == (Decimal('0.00'), 1)
+    assert m.lookup_cache.status_name(inv.status_id) == 'Closed'
+
+
+def _ndjson(lines):
+    return '\n'.join(lines) + '\n'
+
+
+def test_unreadable_line_is_a_row_error_after_committed_batches(client, in_app, monkeypatch):
+    monkeypatch.setitem(juris.app.config, 'IMPORT_BATCH', 2)
+    body = _ndjson(['{"name": "Imported One"}', '{"name": "Imported Two"}', '{"name": "Imported Three"}',
+                    '{"name": "broken', '{"name": "Imported Five"}'])
+    r = client.post('/import/clients', data=body, content_type='application/x-ndjson')
+    report = r.get_json()
+    assert r.status_code == 207
+    assert (report['inserted'], report['failed']) == (4, 1)
+    assert [e['row'] for e in report['errors']] == [4] and 'unreadable json' in report['errors'][0]['error']
+    names = in_app(lambda: {c.name for c in juris.Client.query.filter(juris.Client.name.like('Imported %'))})
+    assert names == {'Imported One', 'Imported Two', 'Imported Three', 'Imported Five'}
+
+
+@pytest.mark.parametrize('body', ['[1, 2]', '[null, "x"]', '1\n"x"\n'])
+def test_rows_that_are_not_objects_are_row_errors(client, body):
+    r = client.post('/import/clients', data=body, content_type='application/json')
+    report = r.get_json()
+    assert r.status_code == 207
+    assert (report['inserted'], report['failed']) == (0, 2)
+    assert all('expected an object' in e['error'] for e in report['errors'])
+
+
+def test_unreadable_file_is_rejected_before_anything_is_written(client, in_app):
+    before = in_app(lambda: juris.Client.query.count())
+    r = client.post('/import/clients', data='[{"name": "A"}, ', content_type='application/json')
+    assert r.status_code == 400 and 'unreadable json' in r.get_json()['error']
+    assert in_app(lambda: juris.Client.query.count()) == before
+
+
+def test_stream_error_after_a_committed_batch_stops_and_reports(ctx, monkeypatch):
+    monkeypatch.setitem(juris.app.config, 'IMPORT_BATCH', 1)
+
+    def rows():
+        yield {'name': 'Streamed One'}
+        yield {'name': 'Streamed Two'}
+        raise csv.Error('line contains NUL')
+    report = juris.import_rows('clients', rows())
+    assert report['inserted'] == 2
+    assert report['errors'] == [{'row': 3, 'error': 'unreadable input, import stopped here: line contains NUL'}]
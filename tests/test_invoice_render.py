@@ -0,0 +1,57 @@
+import pytest
+
+from conftest import juris
+
+
+def test_print_page_revalidates_with_304(client):
+    r = client.get('/invoices/1')
+    assert r.status_code == 200 and b'INV-1001' in r.data
+    etag, modified = r.headers['ETag'], r.headers['Last-Modified']
+    assert client.get('/invoices/1', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/invoices/1', headers={'If-Modified-Since': modified}).status_code == 304
+
+
+@pytest.mark.parametrize('change', [
+    lambda inv: juris.db.session.add(juris.Payment(invoice_id=inv.id, amount=juris.Decimal('10.00'), reference='R-77')),
+    lambda inv: setattr(inv, 'due_date', juris.date(2030, 1, 1)),
+    lambda inv: setattr(inv.client, 'name', 'Renamed Client'),
+])
+def test_etag_moves_when_the_invoice_changes(client, in_app, change):
+    etag = client.get('/invoices/1').headers['ETag']
+
+    def write():
+        change(juris.db.session.get(juris.Invoice, 1)); juris.db.session.commit()
+    in_app(write)
+    r = client.get('/invoices/1', headers={'If-None-Match': etag})
+    assert r.status_code == 200 and r.headers['ETag'] != etag
+
+
+def test_unrelated_writes_keep_the_etag(client, in_app):
+    etag = client.get('/invoices/1').headers['ETag']
+
+    def write():
+        juris.db.session.get(juris.Invoice, 2).amount = juris.Decimal('1.00'); juris.db.session.commit()
+    in_app(write)
+    assert client.get('/invoices/1', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_cached_print_page_carries_no_session_content(client, monkeypatch):
+    monkeypatch.setitem(juris.app.config, 'REQUIRE_LOGIN', True)
+    with client.session_transaction() as s: s['user'] = {'name': 'admin'}
+    first = client.get('/invoices/1').data
+    assert b'Logout' not in first and b'class="menu"' not in first
+    with client.session_transaction() as s: s['user'] = {'name': 'someone-else'}
+    assert client.get('/invoices/1').data == first
+
+
+def test_pdf_revalidates_and_renders_once(client, monkeypatch):
+    pytest.importorskip('reportlab')
+    renders = []
+    real = juris._render_invoice_pdf
+    monkeypatch.setattr(juris, '_render_invoice_pdf', lambda data: renders.append(1) or real(data))
+    r = client.get('/invoices/1/pdf')
+    assert r.status_code == 200 and r.data.startswith(b'%PDF')
+    etag = r.headers['ETag']
+    assert etag != client.get('/invoices/1').headers['ETag']
+    assert client.get('/invoices/1/pdf', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/invoices/1/pdf').data == r.data and len(renders) == 1
@@ -0,0 +1,30 @@
+from sqlalchemy import select
+
+from conftest import juris
+
+
+def _queued(kind):
+    return juris.Job.query.filter_by(kind=kind, status='queued').count()
+
+
+def test_periodic_jobs_are_scheduled_once_per_interval(ctx):
+    juris._schedule_periodic()
+    juris._schedule_periodic()   # a second worker in the same interval finds nothing due
+    assert {k: _queued(k) for k in juris.PERIODIC_JOBS} == dict.fromkeys(juris.PERIODIC_JOBS, 1)
+
+
+def test_a_lost_insert_race_does_not_enqueue(ctx):
+    meta = juris.AppMeta.__table__
+    with juris.db.engine.begin() as conn:
+        assert juris._insert_if_absent(conn, meta, key='job:x', value=1) == 1
+        assert juris._insert_if_absent(conn, meta, key='job:x', value=2) == 0
+        assert conn.execute(select(meta.c.value).where(meta.c.key == 'job:x')).scalar() == 1
+
+
+def test_due_jobs_are_scheduled_again(ctx):
+    juris._schedule_periodic()
+    meta = juris.AppMeta.__table__
+    with juris.db.engine.begin() as conn:
+        conn.execute(meta.update().where(meta.c.key == 'job:purge_jobs').values(value=0))
+    juris._schedule_periodic()
+    assert _queued('purge_jobs') == 2 and _queued('hearing_reminders') == 1
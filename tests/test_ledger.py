@@ -0,0 +1,28 @@
+from decimal import Decimal
+
+from conftest import add_payment, invoice
+
+
+def test_ledger_follows_payment_writes(ctx):
+    m = ctx
+    inv = invoice()
+    p = add_payment(inv, '4000.00')
+    add_payment(inv, '1000.00')
+    assert (inv.paid_total, inv.balance, inv.payment_count) == (Decimal('5000.00'), Decimal('10000.00'), 2)
+
+    p.amount = Decimal('6000.00'); m.db.session.commit()
+    assert inv.balance == Decimal('8000.00')
+    m.db.session.delete(p); m.db.session.commit()
+    assert (inv.paid_total, inv.payment_count) == (Decimal('1000.00'), 1)
+
+    inv.amount = Decimal('2000.00'); m.db.session.commit()
+    assert inv.balance == Decimal('1000.00')
+
+
+def test_moving_a_payment_refreshes_the_invoice_it_left(ctx):
+    m = ctx
+    a, b = invoice('INV-1001'), invoice('INV-1002')
+    p = add_payment(a, '100.00')
+    p.invoice_id = b.id; m.db.session.commit()   # p was expired by the commit above
+    assert (a.payment_count, a.balance) == (0, a.amount)
+    assert (b.payment_count, b.balance) == (1, b.amount - Decimal('100.00'))
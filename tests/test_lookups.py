@@ -0,0 +1,58 @@
+import contextlib
+
+from sqlalchemy import event, update
+
+from conftest import juris
+
+
+@contextlib.contextmanager
+def statements():
+    seen = []
+    listener = lambda conn, cursor, stmt, *a: stmt != 'BEGIN' and seen.append(stmt)
+    event.listen(juris.db.engine, 'before_cursor_execute', listener)
+    try: yield seen
+    finally: event.remove(juris.db.engine, 'before_cursor_execute', listener)
+
+
+def test_registry_loads_once_per_version(ctx):
+    reg = juris.lookup_cache
+    assert [s.name for s in reg.statuses()] == ['Closed', 'Open', 'Pending']
+    with statements() as seen:
+        reg.status_name(1); reg.case_types(); reg.status_id('open')
+    # outside a request every call re-checks the version, but never reloads the tables
+    assert seen and all('app_meta' in s for s in seen)
+
+
+def test_one_version_check_per_request(client):
+    client.get('/cases')
+    with juris.app.test_request_context('/cases'), statements() as seen:
+        juris.lookup_cache.statuses(); juris.lookup_cache.case_types(); juris.lookup_cache.status_name(1)
+    assert len(seen) == 1
+
+
+def test_orm_write_bumps_the_version_and_reloads(ctx):
+    reg = juris.lookup_cache
+    before = reg.current_version()
+    juris.db.session.add(juris.CaseType(name='Maritime')); juris.db.session.commit()
+    assert reg.current_version() == before + 1
+    assert 'Maritime' in [t.name for t in reg.case_types()]
+
+
+def test_write_in_another_process_is_picked_up_by_the_version(ctx):
+    reg = juris.lookup_cache
+    reg.statuses()
+    status = juris.CaseStatus.__table__
+    # what another worker's commit looks like from here: new rows plus a moved counter
+    with juris.db.engine.begin() as conn:
+        conn.execute(update(status).where(status.c.name == 'Open').values(name='Active'))
+        juris._bump_version(conn, 'lookups')
+    juris.db.session.rollback()   # end this session's read snapshot, as the next request would
+    assert reg.status_id('active') and reg.status_id('open') is None
+
+
+def test_rollback_keeps_the_registry(ctx):
+    reg = juris.lookup_cache
+    version = reg.current_version()
+    juris.db.session.add(juris.CaseStatus(name='Stayed')); juris.db.session.flush()
+    juris.db.session.rollback()
+    assert reg.current_version() == version and reg.status_id('stayed') is None
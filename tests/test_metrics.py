@@ -0,0 +1,74 @@
+import re
+
+from conftest import juris
+
+
+def _value(text, name, **labels):
+    # Sum of the samples of `name` whose labels include `labels`
+    total = 0.0
+    for line in text.splitlines():
+        m = re.fullmatch(r'(\w+)(?:\{(.*)\})? (\S+)', line)
+        if not m or m[1] != name: continue
+        have = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', m[2] or ''))
+        if all(have.get(k) == str(v) for k, v in labels.items()): total += float(m[3])
+    return total
+
+
+def _scrape(client, **headers):
+    r = client.get('/metrics', headers=headers)
+    assert r.status_code == 200 and r.mimetype == 'text/plain'
+    return r.get_data(as_text=True)
+
+
+def test_requests_are_counted_and_timed(client):
+    before = _scrape(client)
+    client.get('/clients'); client.get('/clients'); client.get('/invoices/99999')
+    after = _scrape(client)
+    inc = lambda name, **l: _value(after, name, **l) - _value(before, name, **l)
+    assert inc('juris360_requests_total', endpoint='clients', method='GET', status=200) == 2
+    assert inc('juris360_requests_total', endpoint='invoice_view', status=404) == 1
+    assert inc('juris360_request_duration_seconds_count', endpoint='clients') == 2
+    assert inc('juris360_request_sql_statements_count', endpoint='clients') == 2
+    assert inc('juris360_request_sql_statements_sum', endpoint='clients') >= 2
+    assert inc('juris360_sql_seconds_total', endpoint='clients') > 0
+    assert inc('juris360_template_render_seconds_count', template='clients.html') == 2
+    assert '# TYPE juris360_request_duration_seconds histogram' in after
+
+
+def test_disabled_metrics_record_nothing(client, monkeypatch):
+    before = _value(_scrape(client), 'juris360_requests_total', endpoint='clients')
+    monkeypatch.setitem(juris.app.config, 'METRICS_ENABLED', False)
+    client.get('/clients')
+    monkeypatch.setitem(juris.app.config, 'METRICS_ENABLED', True)
+    assert _value(_scrape(client), 'juris360_requests_total', endpoint='clients') == before
+
+
+def test_token_protects_the_endpoint(client, monkeypatch):
+    monkeypatch.setitem(juris.app.config, 'METRICS_TOKEN', 's3cret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert 'juris360_requests_total' in _scrape(client, Authorization='Bearer s3cret')
+
+
+def test_without_a_token_a_login_is_needed(client, monkeypatch):
+    monkeypatch.setitem(juris.app.config, 'REQUIRE_LOGIN', True)
+    assert client.get('/metrics').status_code == 401
+    with client.session_transaction() as s: s['user'] = {'name': 'admin'}
+    assert client.get('/metrics').status_code == 200
+
+
+def test_histograms_are_cumulative_and_labels_escaped():
+    m = juris._Metrics()
+    m.describe('t_seconds', 'histogram', 'test', (0.1, 1))
+    for v in (0.05, 0.5, 0.5, 3): m.observe('t_seconds', {'path': 'a"b\\c'}, v)
+    text = m.render()
+    assert 't_seconds_bucket{path="a\\"b\\\\c",le="0.1"} 1' in text
+    assert 't_seconds_bucket{path="a\\"b\\\\c",le="1"} 3' in text
+    assert 't_seconds_bucket{path="a\\"b\\\\c",le="+Inf"} 4' in text
+    assert 't_seconds_count{path="a\\"b\\\\c"} 4' in text
+
+
+def test_slow_queries_are_logged_with_their_route(client, monkeypatch, caplog):
+    monkeypatch.setitem(juris.app.config, 'SLOW_QUERY_MS', 1e-6)
+    client.get('/clients')
+    assert any('Slow query' in r.message and 'GET /clients (clients)' in r.message for r in caplog.records)
@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import inspect, select
+
+from conftest import BASELINE_DB, juris, reset_db
+
+
+@pytest.fixture
+def baseline_db():
+    reset_db(BASELINE_DB)
+    yield
+    reset_db()
+
+
+@pytest.mark.parametrize('upto', range(1, len(juris.MIGRATIONS) + 1))
+def test_each_step_upgrades_the_baseline_db(baseline_db, monkeypatch, upto):
+    # A step may only rely on columns added by itself or by earlier steps
+    monkeypatch.setattr(juris, 'MIGRATIONS', juris.MIGRATIONS[:upto])
+    with juris.app.app_context():
+        applied = juris.migrate()
+        assert [v for v, _ in applied] == list(range(1, upto + 1))
+        with juris.db.engine.connect() as conn:
+            assert juris._schema_version(conn) == upto
+
+
+def test_full_upgrade_backfills_derived_data(baseline_db):
+    with juris.app.app_context():
+        assert [v for v, _ in juris.migrate()] == [v for v, _, _ in juris.MIGRATIONS]
+        assert juris.migrate() == []   # nothing left to apply
+        juris.init_db()                # seeding is a no-op on a populated database
+
+        have = {c['name'] for c in inspect(juris.db.engine).get_columns('invoice')}
+        assert {'paid_total', 'balance', 'payment_count', 'payments_version', 'updated_at', 'row_version'} <= have
+
+        inv = juris.Invoice.query.filter_by(number='INV-1002').one()
+        paid = sum((p.amount for p in inv.payments), Decimal('0'))
+        assert (inv.paid_total, inv.balance, inv.payment_count) == (paid, inv.amount - paid, inv.payments.count())
+
+        assert ('client', 1) in juris._search_keys(['alice'], 10)
+        months = juris.db.session.execute(select(juris.CollectionSummary.period)).scalars().all()
+        assert months and all(len(p) == 7 for p in months)
+        assert juris.sync_changes(limit=1000)['more'] is False
+
+
+def test_list_queries_use_indexes(ctx):
+    with juris.db.engine.connect() as conn:
+        bad = {name: juris._full_scans(conn, stmt)[1] for name, stmt in juris._hot_queries().items()}
+        conn.rollback()
+    assert {k: v for k, v in bad.items() if v} == {}
@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from conftest import juris
+
+
+def _post(client, lines, **params):
+    return client.post('/payments/batch', json=lines, query_string=params)
+
+
+def _payments(in_app):
+    return in_app(lambda: juris.Payment.query.count())
+
+
+def test_lines_match_by_invoice_number_and_post_once(client, in_app):
+    r = _post(client, [{'reference': 'QX1', 'amount': '5000', 'narrative': 'Fees inv-1001', 'date': '2025-05-02'},
+                       {'reference': 'QX1', 'amount': '5000', 'narrative': 'Fees INV-1001', 'date': '2025-05-02'}])
+    body = r.get_json()
+    assert (body['posted'], body['matched'], body['duplicate']) == (1, 1, 1)
+    assert body['lines'][0]['balance_after'] == '10000.00'
+    # the same statement again is all duplicates
+    assert _post(client, [{'reference': 'QX1', 'amount': '5000', 'narrative': 'INV-1001',
+                           'date': '2025-05-02'}]).get_json()['duplicate'] == 1
+    assert _payments(in_app) == 1
+
+
+def test_known_reference_picks_the_invoice(client):
+    _post(client, [{'reference': 'ACC-77', 'amount': '1000', 'narrative': 'INV-1002', 'date': '2025-05-01'}])
+    # a later line with the same reference but a new amount is a new payment on the same invoice,
+    # even when its narrative mentions no invoice number
+    body = _post(client, [{'reference': 'ACC-77', 'amount': '2500', 'narrative': 'monthly', 'date': '2025-06-01'}]).get_json()
+    assert body['lines'][0]['status'] == 'matched' and body['lines'][0]['invoice'] == 'INV-1002'
+    assert body['lines'][0]['balance_after'] == '18500.00'
+
+
+def test_dry_run_posts_nothing(client, in_app):
+    body = _post(client, [{'amount': '100', 'narrative': 'INV-1001'}], dry_run=1).get_json()
+    assert (body['posted'], body['matched']) == (0, 1)
+    assert _payments(in_app) == 0
+
+
+def test_line_statuses(client):
+    body = _post(client, {'lines': [{'amount': '-3', 'narrative': 'INV-1001'},
+                                    {'amount': '10', 'narrative': 'no number here'},
+                                    {'amount': '10', 'narrative': 'INV-1001 and INV-1002'}]}).get_json()
+    assert [l['status'] for l in body['lines']] == ['invalid', 'unmatched', 'ambiguous']
+
+
+@pytest.mark.parametrize('payload', [{'lines': 'x'}, ['x'], [1, 2], {'lines': [None]}, 'text'])
+def test_malformed_payload_is_a_400(client, payload):
+    r = _post(client, payload)
+    assert r.status_code == 400 and 'unreadable statement' in r.get_json()['error']
+
+
+def test_csv_statement(client):
+    csv = 'reference,amount,narrative,date\nC9,700,INV-1001,2025-05-03\n'
+    r = client.post('/payments/batch', data=csv, content_type='text/csv')
+    assert r.get_json()['posted'] == 1
+
+
+def test_lock_error_retries_without_posting_twice(client, in_app, monkeypatch):
+    real, calls = juris._insert_batch_tx, []
+
+    def flaky(*a, **kw):
+        calls.append(1)
+        if len(calls) == 1: raise OperationalError('INSERT', {}, Exception('database is locked'))
+        return real(*a, **kw)
+    monkeypatch.setattr(juris, '_insert_batch_tx', flaky)
+    r = _post(client, [{'reference': 'L1', 'amount': '250', 'narrative': 'INV-1001'}])
+    assert r.status_code == 200 and r.get_json()['posted'] == 1
+    assert len(calls) == 2 and _payments(in_app) == 1
+    inv = in_app(lambda: juris.Invoice.query.filter_by(number='INV-1001').one().balance)
+    assert inv == Decimal('14750.00')
+
+
+def test_lock_retries_do_not_nest(client, in_app, monkeypatch):
+    calls = []
+
+    def locked(*a, **kw):
+        calls.append(1)
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+    monkeypatch.setattr(juris, '_insert_batch_tx', locked)
+    monkeypatch.setattr(juris.time, 'sleep', lambda s: None)
+    assert _post(client, [{'reference': 'L2', 'amount': '250', 'narrative': 'INV-1001'}]).status_code == 500
+    assert len(calls) == juris.app.config['SQLITE_WRITE_RETRIES'] + 1
+    assert _payments(in_app) == 0
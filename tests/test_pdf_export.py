@@ -0,0 +1,54 @@
+import io, pickle, zipfile
+
+import pytest
+
+from conftest import juris
+
+needs_reportlab = pytest.mark.skipif(not juris._have_reportlab(), reason='reportlab is not installed')
+
+
+@pytest.fixture
+def invoices(in_app):
+    in_app(juris.generate_data, 12, seed=2)
+
+
+def _walk(args, size):
+    with juris.app.test_request_context():
+        return [b for b in juris._export_batches(args, size)]
+
+
+def test_batches_cover_the_filtered_invoices_once(ctx, invoices):
+    batches = _walk({}, 7)
+    ids = [d['id'] for b in batches for d in b]
+    assert ids == sorted(ids) and len(ids) == len(set(ids)) == juris.Invoice.query.count()
+    assert all(len(b) <= 7 for b in batches)
+    assert {d['id'] for b in _walk({'client_id': '1'}, 7) for d in b} == \
+        {i.id for i in juris.Invoice.query.filter_by(client_id=1)}
+
+
+def test_batches_are_picklable_snapshots_with_payments(ctx, invoices):
+    snap = {d['id']: d for b in _walk({}, 50) for d in b}
+    for inv in juris.Invoice.query.filter(juris.Invoice.payment_count > 0).limit(5):
+        d = pickle.loads(pickle.dumps(snap[inv.id]))
+        assert len(d['payments']) == inv.payment_count
+        assert d['paid'] == pytest.approx(float(inv.paid_total))
+
+
+@pytest.mark.skipif(juris._have_reportlab(), reason='reportlab is installed')
+def test_zip_export_without_reportlab_points_to_print(client):
+    r = client.get('/invoices/export.zip', follow_redirects=True)
+    assert r.request.path == '/invoices' and b'PDF generator not available' in r.data
+
+
+@needs_reportlab
+def test_zip_export_streams_one_pdf_per_invoice(client, monkeypatch):
+    monkeypatch.setitem(juris.app.config, 'EXPORT_WORKERS', 1)
+    try:
+        r = client.get('/invoices/export.zip', query_string={'client_id': 1})
+        assert r.status_code == 200 and r.is_streamed and r.mimetype == 'application/zip'
+        with zipfile.ZipFile(io.BytesIO(r.data)) as zf:
+            names = zf.namelist()
+            assert names == ['invoice-INV-1001-1.pdf']
+            assert zf.read(names[0]).startswith(b'%PDF')
+    finally:
+        if juris._export_pool: juris._export_pool.shutdown(); juris._export_pool = None
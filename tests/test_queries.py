@@ -0,0 +1,13 @@
+from conftest import juris
+
+
+def test_list_routes_issue_a_fixed_number_of_statements(client, in_app):
+    # The statement budget: page size must not change how many queries a list page runs
+    in_app(juris.generate_data, 20, seed=3)
+    juris.app.config.update(SQL_QUERY_BUDGET=25, SQL_QUERY_BUDGET_STRICT=True)
+    try:
+        for path in ('/clients', '/cases', '/hearings', '/invoices'):
+            counts = {int(client.get(f'{path}?per={per}').headers['X-SQL-Count']) for per in (5, 100)}
+            assert len(counts) == 1, path
+    finally:
+        juris.app.config.update(SQL_QUERY_BUDGET=0, SQL_QUERY_BUDGET_STRICT=False)
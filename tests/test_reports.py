@@ -0,0 +1,21 @@
+from datetime import date
+from decimal import Decimal
+
+from conftest import add_payment, invoice
+
+
+def test_collection_summary_follows_payment_writes(ctx):
+    m = ctx
+    inv = invoice()
+    p = add_payment(inv, '300.00', date=date(2025, 3, 14), method='M-Pesa')
+    add_payment(inv, '200.00', date=date(2025, 3, 20), method='M-Pesa')
+    by_month, by_method = m.collections('2025-03', '2025-03')
+    assert by_month == [{'period': '2025-03', 'total': Decimal('500.00'), 'count': 2}]
+    assert by_method == [{'method': 'M-Pesa', 'total': Decimal('500.00'), 'count': 2}]
+
+    p.date = date(2025, 4, 2); m.db.session.commit()
+    assert [(r['period'], r['total']) for r in m.collections('2025-03', '2025-04')[0]] == \
+        [('2025-03', Decimal('200.00')), ('2025-04', Decimal('300.00'))]
+
+    m.db.session.delete(p); m.db.session.commit()
+    assert m.collections('2025-04', '2025-04') == ([], [])
@@ -0,0 +1,13 @@
+
+def test_search_index_follows_writes(ctx):
+    m = ctx
+    c = m.Client(name='Zawadi Mwende', email='zawadi@example.com')
+    m.db.session.add(c); m.db.session.commit()
+    assert ('client', c.id) in m._search_keys(['zawad'], 10)
+
+    c.name = 'Neema Achieng'; c.email = None; m.db.session.commit()
+    assert m._search_keys(['zawadi'], 10) == []
+    assert ('client', c.id) in m._search_keys(['neema'], 10)
+
+    m.db.session.delete(c); m.db.session.commit()
+    assert m._search_keys(['neema'], 10) == []
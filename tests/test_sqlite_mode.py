@@ -0,0 +1,84 @@
+import contextlib, sqlite3, threading, time
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from conftest import DB_PATH, juris
+
+
+@contextlib.contextmanager
+def begins():
+    seen = []
+    with juris.app.app_context(): engine = juris.db.engine
+    listener = lambda conn, cursor, stmt, *a: stmt.startswith('BEGIN') and seen.append(stmt)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try: yield seen
+    finally: event.remove(engine, 'before_cursor_execute', listener)
+
+
+def test_connections_run_in_wal_mode(ctx):
+    with juris.db.engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == juris.app.config['SQLITE_BUSY_TIMEOUT_MS']
+
+
+def test_posts_begin_immediate_and_gets_do_not(client):
+    with begins() as seen:
+        client.get('/clients')
+    assert seen and set(seen) == {'BEGIN'}
+    with begins() as seen:
+        client.post('/clients/new', data={'name': 'Writer'})
+    assert seen and set(seen) == {'BEGIN IMMEDIATE'}
+
+
+def test_write_intent_outside_a_request(ctx):
+    juris.db.session.remove()
+    with begins() as seen, juris.write_intent():
+        juris.db.session.execute(text('SELECT 1')); juris.db.session.rollback()
+    assert seen == ['BEGIN IMMEDIATE']
+
+
+def _locked():
+    return OperationalError('INSERT', {}, sqlite3.OperationalError('database is locked'))
+
+
+def test_lock_errors_are_retried_then_raised(ctx, monkeypatch):
+    monkeypatch.setattr(juris.time, 'sleep', lambda s: None)
+    calls = []
+
+    def twice_locked():
+        calls.append(1)
+        if len(calls) < 3: raise _locked()
+        return 'ok'
+    assert juris._with_lock_retry(twice_locked) == 'ok' and len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(OperationalError):
+        juris._with_lock_retry(lambda: calls.append(1) or (_ for _ in ()).throw(_locked()))
+    assert len(calls) == juris.app.config['SQLITE_WRITE_RETRIES'] + 1
+
+    calls.clear()
+    with pytest.raises(OperationalError):   # other errors are not retried
+        juris._with_lock_retry(lambda: calls.append(1) or (_ for _ in ()).throw(
+            OperationalError('x', {}, sqlite3.OperationalError('no such table: nope'))))
+    assert len(calls) == 1
+
+
+def test_a_post_waits_out_another_writer(client, in_app, monkeypatch):
+    # Another process holds the write lock for a while; the POST outlasts busy_timeout and
+    # succeeds on a retry instead of failing
+    assert client.get('/clients').status_code == 200   # this worker's startup checks are done
+    monkeypatch.setitem(juris.app.config, 'SQLITE_BUSY_TIMEOUT_MS', 20)
+    in_app(lambda: juris.db.engine.dispose())   # new connections pick up the short timeout
+    other = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+    other.execute('BEGIN IMMEDIATE')
+    threading.Timer(0.3, other.rollback).start()
+    t0 = time.perf_counter()
+    try:
+        r = client.post('/clients/new', data={'name': 'Patient Writer'})
+    finally:
+        time.sleep(0.35); other.close()
+        in_app(lambda: juris.db.engine.dispose())
+    assert r.status_code == 302 and time.perf_counter() - t0 >= 0.25
+    assert in_app(lambda: juris.Client.query.filter_by(name='Patient Writer').count()) == 1
@@ -0,0 +1,59 @@
+import os, subprocess, sys
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from conftest import BASELINE_DB, juris, reset_db
+
+
+def test_import_does_no_database_work(tmp_path):
+    db_file = tmp_path / 'never.db'
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_file}', AUTO_INIT_DB='0')
+    out = subprocess.run([sys.executable, '-c', 'import app; print(app.app.name)'], cwd=os.path.dirname(juris.__file__),
+                         env=env, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    assert not db_file.exists()
+
+
+def test_init_db_cli_builds_and_seeds_an_empty_database():
+    reset_db()
+    result = juris.app.test_cli_runner().invoke(args=['init-db'])
+    assert result.exit_code == 0, result.output
+    assert f'{len(juris.MIGRATIONS)} migrations applied' in result.output
+    with juris.app.app_context():
+        assert juris.pending_migrations() == []
+        assert juris.Client.query.count() == 2
+    # a second run is a no-op
+    assert '0 migrations applied' in juris.app.test_cli_runner().invoke(args=['init-db']).output
+
+
+@pytest.fixture
+def unchecked(monkeypatch):
+    monkeypatch.setattr(juris, '_db_ready', False)
+    yield
+    reset_db()
+
+
+def test_requests_fail_until_pending_migrations_are_applied(unchecked, caplog):
+    reset_db(BASELINE_DB)
+    client = juris.app.test_client()
+    r = client.get('/clients')
+    assert r.status_code == 503 and b'init-db' in r.data
+    assert 'missing migrations' in caplog.text
+    with juris.app.app_context(): juris.init_db()
+    assert client.get('/clients').status_code == 200
+    assert juris._db_ready
+
+
+def test_auto_init_db_upgrades_on_the_first_request(unchecked, monkeypatch):
+    reset_db(BASELINE_DB)
+    monkeypatch.setitem(juris.app.config, 'AUTO_INIT_DB', True)
+    assert juris.app.test_client().get('/clients').status_code == 200
+    with juris.app.app_context(): assert juris.pending_migrations() == []
+
+
+def test_a_busy_database_is_not_reported_as_unmigrated(ctx, monkeypatch):
+    # Only a missing app_meta table means "never initialised"; a lock error propagates
+    def busy(conn): raise OperationalError('SELECT', {}, Exception('database is locked'))
+    monkeypatch.setattr(juris, '_schema_version', busy)
+    with pytest.raises(OperationalError): juris.pending_migrations()
@@ -0,0 +1,142 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from conftest import invoice, juris
+
+
+def _walk(client, since='', limit=7, **params):
+    # Follow cursors until "more" is false; returns every (kind, id) seen, deletions and the last cursor
+    seen, deleted, pages = [], [], 0
+    while True:
+        body = client.get('/sync', query_string=dict(since=since, limit=limit, **params)).get_json()
+        assert not body['reset']
+        for kind, block in body['changes'].items():
+            at = block['columns'].index('id')
+            seen += [(kind, row[at]) for row in block['rows']]
+        deleted += [(kind, i) for kind, ids in body['deleted'].items() for i in ids]
+        pages += 1
+        assert pages < 1000
+        since = body['cursor'] or since
+        if not body['more']: return seen, deleted, since
+
+
+@pytest.fixture
+def synced(client, in_app):
+    in_app(juris.generate_data, 15, seed=11)
+    return client
+
+
+def _all_rows():
+    return sorted((kind, i) for kind, model in juris.SYNC_MODELS.items()
+                  for i in juris.db.session.execute(select(model.id)).scalars())
+
+
+def test_paging_delivers_every_row_exactly_once(synced, in_app):
+    seen, _, cursor = _walk(synced)
+    assert len(seen) == len(set(seen))
+    assert sorted(seen) == in_app(_all_rows)
+    # a caught-up client gets an empty page back with the same cursor
+    body = synced.get('/sync', query_string={'since': cursor}).get_json()
+    assert (body['changes'], body['deleted'], body['more'], body['cursor']) == ({}, {}, False, cursor)
+
+
+def test_page_size_does_not_change_what_is_delivered(synced):
+    assert sorted(_walk(synced, limit=1)[0]) == sorted(_walk(synced, limit=5000)[0])
+
+
+def test_updates_and_deletes_after_a_cursor(synced, in_app):
+    *_, cursor = _walk(synced)
+
+    def write():
+        c = juris.Client.query.order_by(juris.Client.id).first()
+        c.phone = '+254799999999'
+        h = juris.Hearing.query.order_by(juris.Hearing.id).first()
+        juris.db.session.delete(h); juris.db.session.commit()
+        return c.id, h.id
+    cid, hid = in_app(write)
+
+    seen, deleted, _ = _walk(synced, since=cursor)
+    assert ('client', cid) in seen
+    assert ('hearing', hid) not in seen
+    assert deleted == [('hearing', hid)]
+
+
+def test_kinds_filter(synced):
+    seen, _, _ = _walk(synced, kinds='case,invoice')
+    assert {k for k, _ in seen} == {'case', 'invoice'}
+    assert synced.get('/sync?kinds=nope').status_code == 400
+
+
+def test_purged_tombstones_force_a_reset(synced, in_app):
+    *_, cursor = _walk(synced)
+
+    def delete_and_purge():
+        juris.db.session.delete(juris.Hearing.query.first()); juris.db.session.commit()
+        juris.app.config['SYNC_TOMBSTONE_DAYS'] = -1   # everything is old enough
+        try: return juris._job_purge_tombstones(None, {})
+        finally: juris.app.config['SYNC_TOMBSTONE_DAYS'] = 90
+    assert in_app(delete_and_purge) == {'purged': 1}
+
+    body = synced.get('/sync', query_string={'since': cursor}).get_json()
+    assert body['reset'] and body['cursor'] == ''
+    # starting over works, and the restarted chain is not reset again
+    seen, _, _ = _walk(synced)
+    assert sorted(seen) == in_app(_all_rows)
+
+
+@pytest.mark.parametrize('since', ['garbage', '1.2.3', '1.2.x.4'])
+def test_bad_cursor_is_a_400(client, since):
+    r = client.get('/sync', query_string={'since': since})
+    assert r.status_code == 400 and 'cursor' in r.get_json()['error']
+
+
+def test_deletes_leave_sync_tombstones(ctx):
+    m = ctx
+    hearing = m.Hearing.query.first()
+    before = m.sync_changes(limit=1000)['cursor']
+    m.db.session.delete(hearing); m.db.session.commit()
+
+    tomb = m.db.session.execute(select(m.SyncTombstone)).scalars().one()
+    assert (tomb.kind, tomb.row_id) == ('hearing', hearing.id)
+    page = m.sync_changes(before)
+    assert page['deleted'] == {'hearing': [hearing.id]}
+    # the case's next hearing date is derived and does not bump the case
+    assert 'case' not in page['changes']
+
+
+def test_writes_stamp_one_row_version_per_transaction(ctx):
+    m = ctx
+    client = m.Client.query.first()
+    inv = invoice()
+    client.phone = '+254711111111'
+    m.db.session.add(m.Payment(invoice_id=inv.id, amount=Decimal('10.00')))
+    m.db.session.commit()
+    assert client.row_version == inv.row_version
+    assert client.row_version > 0
+
+
+def test_version_is_allocated_at_commit(ctx):
+    m = ctx
+    counter = lambda: m.db.session.execute(select(m.AppMeta.value).where(m.AppMeta.key == 'sync')).scalar()
+    before = counter()
+    c = m.Client(name='Late Stamp')
+    m.db.session.add(c); m.db.session.flush()
+    m.db.session.delete(m.Hearing.query.first()); m.db.session.flush()
+    assert counter() == before   # nothing holds the counter row while the transaction works
+    m.db.session.commit()
+    assert counter() == before + 1
+    assert c.row_version == before + 1
+    tomb = m.db.session.execute(select(m.SyncTombstone)).scalars().one()
+    assert tomb.row_version == before + 1
+
+
+def test_rollback_forgets_marked_rows(ctx):
+    m = ctx
+    m.db.session.add(m.Client(name='Never Saved')); m.db.session.flush()
+    m.db.session.delete(m.Hearing.query.first()); m.db.session.flush()
+    m.db.session.rollback()
+    assert not {'sync_pending', 'sync_rows', 'sync_gone'} & set(m.db.session.info)
+    m.db.session.commit()
+    assert m.db.session.execute(select(m.SyncTombstone)).first() is None
@@ -0,0 +1,68 @@
+import pytest
+
+from conftest import juris
+
+
+def _count(in_app, model):
+    return in_app(lambda: model.query.count())
+
+
+@pytest.mark.parametrize('path,form,model', [
+    ('/cases/new', {'ref': 'C-9', 'title': 'T', 'client_id': '', 'case_type_id': '1', 'status_id': '1'}, juris.Case),
+    ('/cases/new', {'ref': 'C-9', 'title': 'T', 'client_id': '999', 'case_type_id': '1', 'status_id': '1'}, juris.Case),
+    ('/hearings/new', {'case_id': '', 'date': '2025-05-01', 'status_id': '1'}, juris.Hearing),
+    ('/invoices/new', {'number': 'INV-9', 'client_id': '1', 'case_id': 'abc', 'status_id': '1'}, juris.Invoice),
+])
+def test_create_without_a_picked_id_flashes_an_error(client, in_app, path, form, model):
+    before = _count(in_app, model)
+    r = client.post(path, data=form, follow_redirects=True)
+    assert r.status_code == 200 and b'from the list' in r.data
+    assert _count(in_app, model) == before
+
+
+@pytest.mark.parametrize('path,model,form', [
+    ('/cases/1/update', juris.Case,
+     {'ref': 'C-001', 'title': 'Changed', 'client_id': '', 'case_type_id': '1', 'status_id': '1'}),
+    ('/hearings/1/update', juris.Hearing, {'case_id': '', 'date': '2025-05-01', 'status_id': '1', 'notes': 'Changed'}),
+    ('/invoices/1/update', juris.Invoice, {'number': 'Changed', 'client_id': '', 'case_id': '1', 'status_id': '1'}),
+])
+def test_update_without_a_picked_id_leaves_the_row(client, in_app, path, model, form):
+    before = in_app(lambda: dict(vars(juris.db.session.get(model, 1)), _sa_instance_state=None))
+    r = client.post(path, data=form)
+    assert r.status_code == 302 and r.location.endswith(path.replace('update', 'edit'))
+    assert in_app(lambda: dict(vars(juris.db.session.get(model, 1)), _sa_instance_state=None)) == before
+
+
+def test_create_with_a_picked_id(client, in_app):
+    r = client.post('/hearings/new', data={'case_id': '2', 'date': '2025-05-01', 'status_id': '1'})
+    assert r.status_code == 302
+    assert in_app(lambda: juris.Hearing.query.filter_by(case_id=2).count()) == 2
+
+
+def _labels(client, path, **params):
+    r = client.get(path, query_string=params)
+    assert r.status_code == 200
+    return [row['label'] for row in r.get_json()]
+
+
+def test_client_lookup_matches_name_prefixes(client, in_app):
+    def add():
+        juris.db.session.add_all([juris.Client(name=n) for n in ('Alibaba Traders', 'ALICE Two', 'Al_x Ltd', 'Amina')])
+        juris.db.session.commit()
+    in_app(add)
+    assert _labels(client, '/api/clients', q='ali') == ['Alibaba Traders', 'ALICE Two', 'Alice Wanjiku']
+    assert _labels(client, '/api/clients', q='al_') == ['Al_x Ltd']   # _ is not a wildcard
+    assert _labels(client, '/api/clients', q='zz') == []
+
+
+def test_lookup_limit_defaults_and_is_capped(client, in_app):
+    in_app(juris.generate_data, 80, seed=5)
+    assert len(_labels(client, '/api/clients')) == juris.app.config['TYPEAHEAD_LIMIT']
+    assert len(_labels(client, '/api/clients', limit=3)) == 3
+    assert len(_labels(client, '/api/clients', limit=500)) == 50
+
+
+def test_case_lookup_by_ref_or_title_and_client(client):
+    assert _labels(client, '/api/cases', q='c-00') == ['C-002 — Property Claim', 'C-001 — Contract Dispute']
+    assert _labels(client, '/api/cases', q='property') == ['C-002 — Property Claim']
+    assert _labels(client, '/api/cases', q='c-00', client_id=1) == ['C-001 — Contract Dispute']